@@ -25,6 +25,7 @@ a = Analysis(
         'piexif._common',
         'piexif._exif',
         'piexif._gps',
+        'numpy',  # Optional: bundled when installed, enables automatic lossless and --min-ssim
     ],
     hookspath=[],
     hooksconfig={},
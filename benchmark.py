@@ -0,0 +1,387 @@
+"""
+Benchmark for ALLimageToWebpConverter
+Author: MadS
+
+Generates a reproducible synthetic corpus (several sizes, modes, formats and
+EXIF payloads), converts it with ImageToWebPConverter in a temporary folder and
+prints a machine-readable JSON report, so runs can be compared after a Pillow /
+libwebp upgrade or a settings change.
+
+Usage:
+    python benchmark.py
+    python benchmark.py --scale 2 --workers 4 --output bench.json
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from PIL import Image, ImageDraw, ImageFilter, features
+import piexif
+
+from converter import ImageToWebPConverter
+
+try:
+    import resource  # Unix only
+except ImportError:
+    resource = None
+
+
+# (width, height) of the generated images
+SIZES = [(640, 480), (1920, 1080), (4000, 3000)]
+
+# Formats and the modes each one can store
+FORMATS = {
+    'jpg': ('JPEG', ['RGB', 'L', 'CMYK']),
+    'png': ('PNG', ['RGB', 'RGBA', 'P', 'L']),
+    'tif': ('TIFF', ['RGB', 'RGBA', 'CMYK', 'L']),
+    'bmp': ('BMP', ['RGB', 'P', 'L']),
+    'gif': ('GIF', ['P', 'L']),
+    'webp': ('WEBP', ['RGB', 'RGBA']),
+}
+
+# Formats whose Pillow writer accepts an exif= payload
+EXIF_FORMATS = {'JPEG', 'PNG', 'TIFF', 'WEBP'}
+
+EXIF_PAYLOADS = ['none', 'camera', 'gps']
+
+
+def make_exif(kind):
+    """
+    Build an EXIF payload.
+
+    Args:
+        kind: 'none', 'camera' (make/model/date) or 'gps' (camera + GPS position)
+
+    Returns:
+        bytes: EXIF data for Pillow's exif= argument (empty for 'none')
+    """
+    if kind == 'none':
+        return b''
+
+    exif = {
+        '0th': {
+            piexif.ImageIFD.Make: b'BenchCam',
+            piexif.ImageIFD.Model: b'Synthetic 1',
+            piexif.ImageIFD.DateTime: b'2025:12:16 10:00:00',
+        },
+        'Exif': {piexif.ExifIFD.DateTimeOriginal: b'2025:12:16 10:00:00'},
+    }
+    if kind == 'gps':
+        exif['GPS'] = {
+            piexif.GPSIFD.GPSLatitudeRef: b'S',
+            piexif.GPSIFD.GPSLatitude: ((6, 1), (10, 1), (3000, 100)),
+            piexif.GPSIFD.GPSLongitudeRef: b'E',
+            piexif.GPSIFD.GPSLongitude: ((106, 1), (49, 1), (1500, 100)),
+        }
+    return piexif.dump(exif)
+
+
+def make_image(rng, size, mode):
+    """
+    Draw a deterministic photo-like test image: gradient, shapes and noise.
+
+    Args:
+        rng: random.Random instance
+        size: (width, height)
+        mode: Target image mode
+
+    Returns:
+        Image: Generated image
+    """
+    width, height = size
+    gradient = Image.linear_gradient('L').resize(size)
+    img = Image.merge('RGB', (
+        gradient,
+        gradient.transpose(Image.Transpose.FLIP_LEFT_RIGHT),
+        gradient.transpose(Image.Transpose.ROTATE_180),
+    ))
+
+    draw = ImageDraw.Draw(img)
+    for _ in range(rng.randint(5, 40)):
+        x0, y0 = rng.randrange(width), rng.randrange(height)
+        x1, y1 = x0 + rng.randrange(width // 2 + 1), y0 + rng.randrange(height // 2 + 1)
+        colour = tuple(rng.randrange(256) for _ in range(3))
+        if rng.random() < 0.5:
+            draw.ellipse((x0, y0, x1, y1), fill=colour)
+        else:
+            draw.rectangle((x0, y0, x1, y1), fill=colour)
+
+    # Sensor-like noise, from almost clean to heavy
+    noise = Image.effect_noise(size, rng.uniform(5, 60)).convert('RGB')
+    img = Image.blend(img, noise, rng.uniform(0.05, 0.5)).filter(ImageFilter.GaussianBlur(rng.uniform(0, 1.5)))
+
+    if mode == 'RGBA':
+        img.putalpha(Image.radial_gradient('L').resize(size))
+        return img
+    if mode == 'P':
+        return img.quantize(colors=rng.choice([16, 64, 256]))
+    return img.convert(mode)
+
+
+def generate_corpus(folder, seed=1, scale=1):
+    """
+    Write the synthetic corpus: every size x format x mode combination, cycling
+    through the EXIF payloads.
+
+    Args:
+        folder: Output folder
+        seed: Random seed (same seed = same corpus)
+        scale: Number of images per combination
+
+    Returns:
+        list: Description dict of every generated file
+    """
+    rng = random.Random(seed)
+    corpus = []
+    index = 0
+    for size in SIZES:
+        for extension, (pil_format, modes) in FORMATS.items():
+            for mode in modes:
+                for _ in range(scale):
+                    exif_kind = EXIF_PAYLOADS[index % len(EXIF_PAYLOADS)] if pil_format in EXIF_FORMATS else 'none'
+                    path = Path(folder) / f"img{index:04d}_{size[0]}x{size[1]}_{mode}.{extension}"
+                    img = make_image(rng, size, mode)
+                    options = {'exif': make_exif(exif_kind)} if exif_kind != 'none' else {}
+                    if pil_format == 'JPEG':
+                        options['quality'] = 92
+                    img.save(path, pil_format, **options)
+                    corpus.append({
+                        'name': path.name,
+                        'size': list(size),
+                        'mode': mode,
+                        'format': pil_format,
+                        'exif': exif_kind,
+                        'bytes': path.stat().st_size,
+                    })
+                    index += 1
+    return corpus
+
+
+def percentile(values, fraction):
+    """
+    Nearest-rank percentile of a list of numbers (None for an empty list).
+    """
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(int(round(fraction * (len(ordered) - 1))), len(ordered) - 1)]
+
+
+def peak_rss_mb(children=False):
+    """
+    Peak resident memory of this process or of its largest finished child process, in MB.
+
+    Args:
+        children: Report the child processes (the conversion workers) instead
+
+    Returns:
+        float: Peak RSS in MB, or None where the platform does not report it
+               (or no child process has finished)
+    """
+    if resource is None:
+        return None
+    divisor = 1024 * 1024 if sys.platform == 'darwin' else 1024  # macOS reports bytes, Linux KB
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF).ru_maxrss
+    return usage / divisor if usage else None
+
+
+def _child_main(connection, function, args):
+    """
+    Body of a run_in_process() child: send function's result back.
+    """
+    connection.send(function(*args))
+    connection.close()
+
+
+def run_in_process(function, *args):
+    """
+    Run function in a fresh (spawned) process and return its result. Linux
+    carries the peak RSS of a process over into the processes it starts, so
+    the corpus generation and the conversion each get a process of their own,
+    started from a parent that never held the large images.
+
+    Args:
+        function: Module-level function
+        *args: Its (picklable) arguments
+
+    Returns:
+        Whatever function returns
+    """
+    context = multiprocessing.get_context('spawn')
+    receiver, sender = context.Pipe(duplex=False)
+    process = context.Process(target=_child_main, args=(sender, function, args))
+    process.start()
+    sender.close()
+    try:
+        return receiver.recv()
+    except EOFError:
+        raise RuntimeError(f"{function.__name__} failed in its benchmark process") from None
+    finally:
+        process.join()
+
+
+def convert_corpus(work_dir, workers, executor, max_kb, search_method, pipeline):
+    """
+    Convert the corpus in work_dir/source. Runs in a process of its own (see
+    run_in_process()), so its peak RSS covers the converter only and the
+    worker processes are its only children.
+
+    Args:
+        work_dir: Benchmark folder holding the generated source folder
+        workers: Parallel workers passed to the converter
+        executor: "process" or "thread"
+        max_kb: Output size budget in KB
+        search_method: Two-phase search effort (None = method 6 only)
+        pipeline: Use the streaming read/decode/encode/commit pipeline
+
+    Returns:
+        tuple: (results, seconds, workers, main process peak RSS, worker peak RSS)
+    """
+    source = work_dir / 'source'
+    converter = ImageToWebPConverter(source, work_dir / 'result', work_dir / 'failed',
+                                     workers=workers, executor=executor, pipeline=pipeline)
+    converter.max_output_size_kb = max_kb
+    converter.search_method = search_method
+
+    image_files = sorted(source.iterdir())
+    results = []
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        for image_file, success, _, stats in converter.convert_images(image_files):
+            results.append((image_file.name, success, stats))
+    elapsed = time.perf_counter() - started
+    converter.shutdown()  # Joins the worker processes, so their usage is reported
+    return results, elapsed, converter.workers, peak_rss_mb(), peak_rss_mb(children=True)
+
+
+def run_benchmark(workers=1, executor='process', seed=1, scale=1, max_kb=150, search_method=None,
+                  pipeline=False):
+    """
+    Generate the corpus, convert it and collect the measurements. Both steps
+    run in separate processes, so the reported peak RSS is the converter's.
+
+    Args:
+        workers: Parallel workers passed to the converter
+        executor: "process" or "thread"
+        seed: Corpus random seed
+        scale: Images per size/format/mode combination
+        max_kb: Output size budget in KB
+        search_method: Two-phase search effort (None = method 6 only)
+        pipeline: Use the streaming read/decode/encode/commit pipeline
+
+    Returns:
+        dict: Benchmark report
+    """
+    work_dir = Path(tempfile.mkdtemp(prefix='webp_bench_'))
+    try:
+        source = work_dir / 'source'
+        source.mkdir()
+        generate_started = time.perf_counter()
+        corpus = run_in_process(generate_corpus, source, seed, scale)
+        generate_seconds = time.perf_counter() - generate_started
+
+        results, elapsed, workers, main_rss, worker_rss = run_in_process(
+            convert_corpus, work_dir, workers, executor, max_kb, search_method, pipeline
+        )
+
+        converted = [stats for _, success, stats in results if success and stats]
+        stages = {}
+        for stats in converted:
+            for stage, seconds in stats.get('timings', {}).items():
+                stages.setdefault(stage, []).append(seconds)
+
+        return {
+            'environment': {
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'pillow': Image.__version__,
+                'libwebp': features.version('webp'),
+                'cpu_count': os.cpu_count(),
+            },
+            'settings': {
+                'workers': workers,
+                'executor': executor,
+                'seed': seed,
+                'scale': scale,
+                'max_output_size_kb': max_kb,
+                'search_method': search_method,
+                'pipeline': pipeline,
+            },
+            'corpus': {
+                'images': len(corpus),
+                'bytes': sum(item['bytes'] for item in corpus),
+                'generate_seconds': round(generate_seconds, 3),
+            },
+            'images': len(results),
+            'converted': len(converted),
+            'failed': len(results) - len(converted),
+            'seconds': round(elapsed, 3),
+            'images_per_sec': round(len(results) / elapsed, 3) if elapsed else None,
+            'stage_latency_ms': {
+                stage: {
+                    'p50': round(percentile(values, 0.50) * 1000, 2),
+                    'p95': round(percentile(values, 0.95) * 1000, 2),
+                }
+                for stage, values in sorted(stages.items())
+            },
+            'avg_attempts': round(sum(s['attempts'] for s in converted) / len(converted), 3) if converted else None,
+            'budget_hit_rate': round(sum(1 for s in converted if s['final_size_kb'] <= max_kb) / len(converted), 4)
+                               if converted else None,
+            'reduced_decode_rate': round(sum(1 for s in converted if s.get('reduced_decode')) / len(converted), 4)
+                                   if converted else None,
+            'peak_rss_mb': main_rss,
+            'worker_peak_rss_mb': worker_rss,
+            'files': [
+                {
+                    'name': name,
+                    'success': success,
+                    'quality': stats['quality'] if success else None,
+                    'scale': stats['resize_scale'] if success else None,
+                    'attempts': stats['attempts'] if success else None,
+                    'size_kb': round(stats['final_size_kb'], 2) if success else None,
+                    'reduced_decode': stats.get('reduced_decode', False) if success else None,
+                }
+                for name, success, stats in results
+            ],
+        }
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def main():
+    """
+    Command line entry point.
+    """
+    parser = argparse.ArgumentParser(description="Benchmark the image to WebP conversion pipeline.")
+    parser.add_argument('--workers', type=int, default=1, help="parallel workers (0 = one per CPU core)")
+    parser.add_argument('--executor', choices=['process', 'thread'], default='process')
+    parser.add_argument('--seed', type=int, default=1, help="corpus random seed")
+    parser.add_argument('--scale', type=int, default=1, help="images per size/format/mode combination")
+    parser.add_argument('--max-kb', type=int, default=150, help="output size budget in KB")
+    parser.add_argument('--search-method', type=int, default=None, help="two-phase search effort (0-6)")
+    parser.add_argument('--pipeline', action='store_true', help="use the streaming stage pipeline")
+    parser.add_argument('--output', help="write the JSON report to this file instead of stdout")
+    args = parser.parse_args()
+
+    report = run_benchmark(args.workers, args.executor, args.seed, args.scale, args.max_kb, args.search_method,
+                           args.pipeline)
+    text = json.dumps(report, indent=2)
+    if args.output:
+        Path(args.output).write_text(text + "\n", encoding='utf-8')
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,36 @@
+import argparse
+import hashlib
+import io
+import json
+import math
+import os
+import queue
 import shutil
+import socket
+import socketserver
+import sqlite3
+import struct
 import time
 import sys
+import threading
+import multiprocessing
+import ctypes
+import ctypes.util
+from bisect import insort
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
 from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from pathlib import Path
-from PIL import Image
+from PIL import Image, ImageChops, ImageFilter, ImageStat, TiffImagePlugin
 import piexif
 
+try:
+    import numpy as np  # Optional: content analysis for automatic lossless selection
+except ImportError:
+    np = None
+
 try:
     import msvcrt  # Windows
     WINDOWS = True
@@ -14,321 +39,3821 @@ except ImportError:
     WINDOWS = False
 
 
-class ImageToWebPConverter:
-    def __init__(self, source_folder="source", result_folder="result", failed_folder="failedConvert"):
+# Per-thread buffer used to collect the log lines of one image while it is
+# converted by a worker, so parallel conversions never interleave their output.
+_log_capture = threading.local()
+
+# Converter settings of a worker process, installed once by _init_worker()
+_worker_converter = None
+
+
+def _worker_job_converter(converter, effort_ratio):
+    """
+    Converter a worker job runs with: the given one in a worker thread, or the
+    one _init_worker() built in a worker process (converter=None), updated with
+    the state the main process keeps changing (effort ratio, learned model).
+    """
+    if converter is None:
+        converter = _worker_converter
+        if converter.predictor is not None:
+            converter.predictor.reload()
+    if effort_ratio is not None:
+        converter.effort_ratio = effort_ratio
+    return converter
+
+
+def _convert_worker(converter, image_path, effort_ratio=None):
+    """
+    Convert one image inside a worker thread or process.
+
+    Args:
+        converter: ImageToWebPConverter instance, or None for the one built
+                   by _init_worker()
+        image_path: Path to the source image file
+        effort_ratio: Current calibrated two-phase ratio of the main process
+                      (default: keep the converter's own value)
+
+    Returns:
+        tuple: (success, log_lines, stats)
+    """
+    converter = _worker_job_converter(converter, effort_ratio)
+    _log_capture.lines = []
+    try:
+        success, stats = converter.convert_image(image_path)
+        return success, _log_capture.lines, stats
+    finally:
+        _log_capture.lines = None
+
+
+def _init_worker(converter_type, settings):
+    """
+    Pool initializer: build the converter of a worker process once, from the
+    settings it got at start-up (see ImageToWebPConverter.worker_settings()),
+    so jobs only carry their own arguments.
+    """
+    global _worker_converter
+    _worker_converter = object.__new__(converter_type)
+    _worker_converter.__dict__.update(settings)
+
+
+def _convert_bytes_worker(converter, data, name, effort_ratio=None):
+    """
+    Convert image bytes inside a worker thread or process (see convert_bytes()).
+
+    Args:
+        converter: ImageToWebPConverter instance, or None for the one built
+                   by _init_worker()
+        data: Image file bytes
+        name: Name used in logs and error messages
+        effort_ratio: Current calibrated two-phase ratio of the main process
+
+    Returns:
+        tuple: (webp_bytes, stats)
+    """
+    converter = _worker_job_converter(converter, effort_ratio)
+    _log_capture.lines = []  # Service requests do not print per-image logs
+    try:
+        return converter.convert_bytes(data, name)
+    finally:
+        _log_capture.lines = None
+
+
+def _pipeline_worker(converter, job, effort_ratio=None):
+    """
+    Run the decode and encode stages of a pipeline job inside a worker process
+    (see run_pipeline()). Errors are stored in the job instead of raised, so the
+    log lines collected so far travel back with it.
+
+    Args:
+        converter: ImageToWebPConverter instance, or None for the one built
+                   by _init_worker()
+        job: Job that went through read_source()
+        effort_ratio: Current calibrated two-phase ratio of the main process
+
+    Returns:
+        dict: The job, without its source bytes and decoded image
+    """
+    converter = _worker_job_converter(converter, effort_ratio)
+    _log_capture.lines = job['lines']
+    try:
+        converter.decode_source(job)
+        converter.encode_output(job)
+    except Exception as e:
+        job['error'] = e
+    finally:
+        converter.release_image(job)
+        _log_capture.lines = None
+    return job
+
+
+def _warm_worker():
+    """
+    Load every Pillow format plugin in a fresh worker, so the first request it
+    serves does not pay for the imports.
+    """
+    Image.init()
+    return os.getpid()
+
+
+# VP8X feature flags (see the WebP container specification)
+WEBP_FLAG_ICC = 0x20
+WEBP_FLAG_ALPHA = 0x10
+WEBP_FLAG_EXIF = 0x08
+WEBP_FLAG_XMP = 0x04
+WEBP_FLAG_ANIMATION = 0x02
+
+# Largest width/height a WebP image can have
+WEBP_MAX_DIMENSION = 16383
+
+
+def _read_webp_chunks(webp_data):
+    """
+    Split a WebP file into its RIFF chunks.
+
+    Args:
+        webp_data: Encoded WebP file
+
+    Returns:
+        list: (fourcc, payload) tuples in file order
+    """
+    if webp_data[:4] != b'RIFF' or webp_data[8:12] != b'WEBP':
+        raise ValueError("Not a WebP file")
+
+    end = min(len(webp_data), 8 + struct.unpack('<I', webp_data[4:8])[0])
+    chunks = []
+    position = 12
+    while position + 8 <= end:
+        fourcc = webp_data[position:position + 4]
+        size = struct.unpack('<I', webp_data[position + 4:position + 8])[0]
+        chunks.append((fourcc, webp_data[position + 8:position + 8 + size]))
+        position += 8 + size + (size & 1)
+    return chunks
+
+
+def _webp_chunk(fourcc, payload):
+    """
+    Build one RIFF chunk (header, payload and padding byte if the size is odd).
+    """
+    padding = b'\x00' if len(payload) & 1 else b''
+    return fourcc + struct.pack('<I', len(payload)) + payload + padding
+
+
+def _webp_canvas_info(chunks):
+    """
+    Read canvas size and alpha usage from a simple-format (VP8/VP8L) WebP.
+
+    Returns:
+        tuple: (width, height, has_alpha)
+    """
+    for fourcc, payload in chunks:
+        if fourcc == b'VP8 ' and payload[3:6] == b'\x9d\x01\x2a':
+            width = struct.unpack('<H', payload[6:8])[0] & 0x3fff
+            height = struct.unpack('<H', payload[8:10])[0] & 0x3fff
+            return width, height, False
+        if fourcc == b'VP8L' and payload[:1] == b'\x2f':
+            bits = struct.unpack('<I', payload[1:5])[0]
+            return (bits & 0x3fff) + 1, ((bits >> 14) & 0x3fff) + 1, bool((bits >> 28) & 1)
+    raise ValueError("WebP file has no image data")
+
+
+def embed_webp_metadata(webp_data, exif=b'', icc_profile=b'', xmp=b''):
+    """
+    Insert EXIF, ICC and XMP chunks into an already encoded WebP file.
+    The image bitstream is copied as-is, so nothing is decoded or re-encoded.
+
+    Args:
+        webp_data: Encoded WebP file
+        exif: Raw EXIF (TIFF) data, with or without the "Exif" APP1 header
+        icc_profile: ICC profile bytes
+        xmp: XMP packet bytes
+
+    Returns:
+        bytes: WebP file in extended (VP8X) format carrying the metadata
+    """
+    if exif.startswith(b'Exif\x00\x00'):
+        exif = exif[6:]
+    if not (exif or icc_profile or xmp):
+        return webp_data
+
+    chunks = _read_webp_chunks(webp_data)
+
+    if chunks[0][0] == b'VP8X':
+        header = chunks[0][1]
+        flags = header[0]
+        width = int.from_bytes(header[4:7], 'little') + 1
+        height = int.from_bytes(header[7:10], 'little') + 1
+        chunks = chunks[1:]
+    else:
+        width, height, has_alpha = _webp_canvas_info(chunks)
+        flags = WEBP_FLAG_ALPHA if has_alpha else 0
+
+    existing = dict((fourcc, payload) for fourcc, payload in chunks
+                    if fourcc in (b'ICCP', b'EXIF', b'XMP '))
+    icc_profile = icc_profile or existing.get(b'ICCP', b'')
+    exif = exif or existing.get(b'EXIF', b'')
+    xmp = xmp or existing.get(b'XMP ', b'')
+
+    flags &= ~(WEBP_FLAG_ICC | WEBP_FLAG_EXIF | WEBP_FLAG_XMP)
+    if icc_profile:
+        flags |= WEBP_FLAG_ICC
+    if exif:
+        flags |= WEBP_FLAG_EXIF
+    if xmp:
+        flags |= WEBP_FLAG_XMP
+
+    # Chunk order required by the spec: VP8X, ICCP, ANIM, image data, EXIF, XMP
+    vp8x = bytes([flags, 0, 0, 0]) + (width - 1).to_bytes(3, 'little') + (height - 1).to_bytes(3, 'little')
+    body = [_webp_chunk(b'VP8X', vp8x)]
+    if icc_profile:
+        body.append(_webp_chunk(b'ICCP', icc_profile))
+    body.extend(_webp_chunk(fourcc, payload) for fourcc, payload in chunks
+                if fourcc not in (b'ICCP', b'EXIF', b'XMP '))
+    if exif:
+        body.append(_webp_chunk(b'EXIF', exif))
+    if xmp:
+        body.append(_webp_chunk(b'XMP ', xmp))
+
+    payload = b'WEBP' + b''.join(body)
+    return b'RIFF' + struct.pack('<I', len(payload)) + payload
+
+
+# Rendition set for image sites: 1024/320/128 px thumbnails next to the full-size
+# output. 'metadata' is 'all', 'no-gps' (EXIF without location), 'icc' or 'none'.
+THUMBNAIL_RENDITIONS = [
+    {'suffix': '_1024', 'max_dimension': 1024, 'max_kb': 60, 'metadata': 'no-gps'},
+    {'suffix': '_320', 'max_dimension': 320, 'max_kb': 15, 'metadata': 'icc'},
+    {'suffix': '_128', 'max_dimension': 128, 'max_kb': 5, 'metadata': 'icc'},
+]
+
+RENDITION_METADATA_POLICIES = ('all', 'no-gps', 'icc', 'none')
+
+# Encodings tried by the automatic lossless/lossy selection. Pillow has no
+# near_lossless option, so 'near_lossless' rounds every colour channel to a
+# multiple of 4 before a lossless encode, and 'palette' quantizes to 256
+# colours so libwebp can use its colour-indexing transform.
+ENCODINGS = ('lossy', 'lossless', 'near_lossless', 'palette')
+NEAR_LOSSLESS_LUT = [min((value + 2) // 4 * 4, 255) for value in range(256)]
+
+
+def _ssim_luma(img):
+    """
+    8-bit luma of an image for SSIM scoring. Colour under transparent pixels
+    is meaningless (the encoder may change it), so luma is premultiplied by alpha.
+
+    Args:
+        img: PIL Image
+
+    Returns:
+        numpy.ndarray: 2-D uint8 array
+    """
+    luma = np.asarray(img.convert('L'), dtype=np.uint16)
+    if 'A' in img.getbands():
+        luma = luma * np.asarray(img.getchannel('A'), dtype=np.uint16) // 255
+    return luma.astype(np.uint8)
+
+
+def _window_mean(values, window):
+    """
+    Mean over every window x window block of a 2-D array (summed-area table).
+
+    Returns:
+        numpy.ndarray: Array of shape (rows - window + 1, columns - window + 1)
+    """
+    table = np.zeros((values.shape[0] + 1, values.shape[1] + 1))
+    table[1:, 1:] = values.cumsum(0).cumsum(1)
+    return (table[window:, window:] - table[:-window, window:]
+            - table[window:, :-window] + table[:-window, :-window]) / (window * window)
+
+
+def structural_similarity(reference, candidate, window=7, band_rows=256):
+    """
+    Mean SSIM (Wang et al. 2004, uniform window, K1=0.01, K2=0.03) of two
+    equally sized luma arrays. Vectorised with NumPy and computed in horizontal
+    bands, so a large image needs only a few band-sized float buffers.
+
+    Args:
+        reference: 2-D uint8 array (see _ssim_luma())
+        candidate: 2-D uint8 array of the same shape
+        window: Side of the square window in pixels
+        band_rows: Output rows computed per band
+
+    Returns:
+        float: SSIM in [-1, 1], 1.0 for identical images
+    """
+    c1, c2 = (0.01 * 255) ** 2, (0.03 * 255) ** 2
+    height, width = reference.shape
+    window = max(min(window, height, width), 1)
+    total, count = 0.0, 0
+    for top in range(0, height - window + 1, band_rows):
+        bottom = min(top + band_rows + window - 1, height)
+        x = reference[top:bottom].astype(np.float64)
+        y = candidate[top:bottom].astype(np.float64)
+        mean_x, mean_y = _window_mean(x, window), _window_mean(y, window)
+        var_x = _window_mean(x * x, window) - mean_x * mean_x
+        var_y = _window_mean(y * y, window) - mean_y * mean_y
+        covariance = _window_mean(x * y, window) - mean_x * mean_y
+        scores = ((2 * mean_x * mean_y + c1) * (2 * covariance + c2)
+                  / ((mean_x * mean_x + mean_y * mean_y + c1) * (var_x + var_y + c2)))
+        total += float(scores.sum())
+        count += scores.size
+    return total / count
+
+
+# inotify constants (Linux), see <sys/inotify.h>
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_NONBLOCK = os.O_NONBLOCK if hasattr(os, 'O_NONBLOCK') else 0
+IN_CLOEXEC = 0o2000000
+
+
+class SourceWatcher:
+    """
+    Watch a folder for new image files and report them once they are complete.
+
+    Uses inotify on Linux so new files are seen immediately without rescanning
+    the folder; other platforms (or when inotify is unavailable) fall back to
+    polling with os.scandir. A file is only reported after its size and mtime
+    have stayed the same for settle_time seconds, so files that are still being
+    copied are never handed to the converter.
+    """
+
+    def __init__(self, folder, is_candidate, settle_time=1.0, poll_interval=2, use_inotify=True):
+        """
+        Args:
+            folder: Folder to watch (not recursive)
+            is_candidate: Function(Path) -> bool selecting the files to report
+            settle_time: Seconds a file's size and mtime must stay unchanged
+            poll_interval: Seconds between full scans in polling mode
+            use_inotify: Use inotify where available; turn off for network shares,
+                         where inotify misses files written by other machines
+        """
+        self.folder = Path(folder)
+        self.is_candidate = is_candidate
+        self.settle_time = settle_time
+        self.poll_interval = poll_interval
+
+        self._pending = {}  # name -> (size, mtime_ns, inode, unchanged_since)
+        self._dispatched = {}  # name -> (size, mtime_ns, inode) of files already reported
+        self._last_scan = 0.0
+        self._inotify_fd = None
+
+        if use_inotify and sys.platform.startswith('linux'):
+            self._start_inotify()
+
+        # Pick up files that were already there before watching started
+        self.scan()
+
+    @property
+    def mode(self):
+        """Watching mechanism in use: 'inotify' or 'polling'."""
+        return 'inotify' if self._inotify_fd is not None else 'polling'
+
+    def _start_inotify(self):
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+            fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+            if fd < 0:
+                return
+            mask = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_MODIFY | IN_MOVED_FROM | IN_DELETE
+            if libc.inotify_add_watch(fd, os.fsencode(self.folder), mask) < 0:
+                os.close(fd)
+                return
+            self._inotify_fd = fd
+        except (OSError, AttributeError):
+            self._inotify_fd = None
+
+    def close(self):
+        """
+        Stop watching and release the inotify descriptor.
+        """
+        if self._inotify_fd is not None:
+            os.close(self._inotify_fd)
+            self._inotify_fd = None
+
+    def scan(self):
+        """
+        Scan the whole folder once and track every candidate file.
+        """
+        self._last_scan = time.monotonic()
+        seen = set()
+        try:
+            with os.scandir(self.folder) as entries:
+                for entry in entries:
+                    if entry.is_file() and self.is_candidate(Path(entry.path)):
+                        seen.add(entry.name)
+                        self._observe(entry.name, entry.stat())
+        except FileNotFoundError:
+            pass
+        # Forget reported files that have since been converted or moved away
+        for name in list(self._dispatched):
+            if name not in seen:
+                del self._dispatched[name]
+
+    def _observe(self, name, stat_result=None):
+        if stat_result is None:
+            try:
+                stat_result = os.stat(self.folder / name)
+            except OSError:
+                self._pending.pop(name, None)
+                return
+        signature = (stat_result.st_size, stat_result.st_mtime_ns, stat_result.st_ino)
+        if self._dispatched.get(name) == signature:
+            return  # Already reported and unchanged since
+        previous = self._pending.get(name)
+        if previous is None or previous[:3] != signature:
+            self._pending[name] = signature + (time.monotonic(),)
+
+    def _read_events(self):
+        while True:
+            try:
+                data = os.read(self._inotify_fd, 64 * 1024)
+            except BlockingIOError:
+                return
+            if not data:
+                return
+
+            # struct inotify_event: int wd; uint32 mask, cookie, len; char name[len]
+            position = 0
+            while position + 16 <= len(data):
+                _, mask, _, length = struct.unpack_from('iIII', data, position)
+                name = data[position + 16:position + 16 + length].rstrip(b'\x00')
+                position += 16 + length
+
+                if mask & IN_Q_OVERFLOW:
+                    # Events were dropped by the kernel - fall back to one full scan
+                    self.scan()
+                    continue
+                if not name:
+                    continue
+                name = os.fsdecode(name)
+                if mask & (IN_MOVED_FROM | IN_DELETE):
+                    self._pending.pop(name, None)
+                    self._dispatched.pop(name, None)
+                elif self.is_candidate(self.folder / name):
+                    self._dispatched.pop(name, None)  # New content under a known name
+                    self._observe(name)
+
+    def wait(self, timeout):
+        """
+        Wait up to timeout seconds and return the files that are ready to convert.
+
+        Args:
+            timeout: Maximum seconds to block
+
+        Returns:
+            list: Paths whose size and mtime have settled
+        """
+        if self._inotify_fd is not None:
+            if self._pending:
+                # Wake up in time to re-check files that are still settling
+                timeout = min(timeout, self.settle_time)
+            readable, _, _ = select.select([self._inotify_fd], [], [], timeout)
+            if readable:
+                self._read_events()
+        else:
+            due = self._last_scan + self.poll_interval - time.monotonic()
+            if self._pending:
+                due = min(due, self.settle_time)
+            time.sleep(max(min(timeout, due), 0))
+            if time.monotonic() - self._last_scan >= self.poll_interval:
+                self.scan()
+
+        return self._collect_ready()
+
+    def _collect_ready(self):
+        now = time.monotonic()
+        ready = []
+        for name in list(self._pending):
+            signature, since = self._pending[name][:3], self._pending[name][3]
+            if now - since < self.settle_time:
+                continue
+            # Re-check right before dispatch; a changed file restarts its settle time
+            self._observe(name)
+            current = self._pending.get(name)
+            if current is not None and current[:3] == signature:
+                del self._pending[name]
+                self._dispatched[name] = signature
+                ready.append(self.folder / name)
+        return sorted(ready)
+
+
+class ResizePyramid:
+    """
+    Cache of downscaled versions of one image.
+
+    Each requested size is derived from the nearest larger level already
+    computed instead of from the full-resolution source, and large steps use
+    Pillow's reducing_gap (fast integer reduce() followed by one LANCZOS pass).
+    Levels are re-derived from the source after max_generations chained
+    resamples to keep the accumulated quality loss bounded.
+    """
+
+    def __init__(self, img, max_generations=3):
+        """
+        Args:
+            img: Full-resolution PIL Image
+            max_generations: Maximum resample chain length before going back to the source
+        """
+        self.source = img
+        self.max_generations = max_generations
+        self._levels = []  # (image, generation), largest first
+
+    def resize(self, size):
+        """
+        Return the image resized to size, reusing cached levels.
+
+        Args:
+            size: (width, height) no larger than the source
+
+        Returns:
+            Image: Resized image
+        """
+        width, height = size
+        base, generation = self.source, 0
+        for level, level_generation in self._levels:
+            if level.size == (width, height):
+                return level
+            if (level.width >= width and level.height >= height
+                    and level_generation < self.max_generations and level.width < base.width):
+                base, generation = level, level_generation
+
+        resized = base.resize((width, height), Image.Resampling.LANCZOS, reducing_gap=2.0)
+        self._levels.append((resized, generation + 1))
+        self._levels.sort(key=lambda item: -item[0].width)
+        return resized
+
+
+class AnimationFrames:
+    """
+    Decoded frames of an animated GIF/WebP/PNG with their durations and loop count.
+
+    Consecutive frames that differ by at most merge_threshold per channel are
+    merged into one longer frame. In the frames that are kept, pixels that
+    changed by no more than the threshold are snapped back to the previous
+    frame, so libwebp's animation encoder only has to store (and crops each
+    frame to) the region that really changed. Resampling blurs those snapped
+    pixels again, so resize() snaps the resized frames once more.
+
+    Has the size/resize() interface of a PIL Image, so ResizePyramid and the
+    renditions work on it unchanged.
+    """
+
+    def __init__(self, frames, durations, loop=0, source_frames=None, merge_threshold=0):
+        """
+        Args:
+            frames: RGBA PIL Images, all the same size
+            durations: Display time of each frame in milliseconds
+            loop: Loop count (0 = forever)
+            source_frames: Number of frames in the source (default: len(frames))
+            merge_threshold: Threshold the frames were merged with, reapplied by resize()
+        """
+        self.frames = frames
+        self.durations = durations
+        self.loop = loop
+        self.source_frames = source_frames or len(frames)
+        self.merge_threshold = merge_threshold
+
+    @classmethod
+    def from_image(cls, img, merge_threshold=0, max_frames=None, max_pixels=None):
+        """
+        Decode every frame of an opened animated image. Animations with more
+        frames than max_frames, or more pixels over all frames than max_pixels,
+        are not decoded at all: only the first frame is kept, so the caller
+        converts them as a still image.
+
+        Args:
+            img: Opened PIL Image with more than one frame
+            merge_threshold: Largest per-channel change still treated as unchanged
+            max_frames: Largest number of source frames decoded (default: no limit)
+            max_pixels: Largest width * height * frames decoded (default: no limit)
+
+        Returns:
+            AnimationFrames: Merged and snapped frames
+        """
+        loop = img.info.get('loop', 0)
+        if cls.too_large(img, max_frames, max_pixels):
+            img.seek(0)
+            return cls([img.convert('RGBA')], [img.info.get('duration') or 100], loop, img.n_frames)
+
+        frames, durations = [], []
+        for index in range(img.n_frames):
+            img.seek(index)
+            cls._append(frames, durations, img.convert('RGBA'), img.info.get('duration') or 100,
+                        merge_threshold)
+        return cls(frames, durations, loop, img.n_frames, merge_threshold)
+
+    @staticmethod
+    def too_large(img, max_frames=None, max_pixels=None):
+        """
+        Whether an animation exceeds the frame or pixel limit of from_image().
+
+        Args:
+            img: Opened PIL Image
+            max_frames: Largest number of source frames (None: no limit)
+            max_pixels: Largest width * height * frames (None: no limit)
+
+        Returns:
+            bool: True if only the first frame would be decoded
+        """
+        frames = getattr(img, 'n_frames', 1)
+        return bool((max_frames and frames > max_frames)
+                    or (max_pixels and img.width * img.height * frames > max_pixels))
+
+    @staticmethod
+    def _append(frames, durations, frame, duration, merge_threshold):
+        """
+        Append a frame, merging it into the previous one when nothing changed
+        beyond merge_threshold and snapping its small changes back otherwise.
+
+        Args:
+            frames: Frames kept so far (appended to)
+            durations: Their durations (appended to, or the last one extended)
+            frame: RGBA PIL Image
+            duration: Display time of the frame in milliseconds
+            merge_threshold: Largest per-channel change still treated as unchanged
+        """
+        if frames:
+            changed_lut = [255 if value > merge_threshold else 0 for value in range(256)]
+            bands = ImageChops.difference(frame, frames[-1]).split()
+            changed = bands[0].point(changed_lut)
+            for band in bands[1:]:
+                changed = ImageChops.lighter(changed, band.point(changed_lut))
+            if changed.getbbox() is None:
+                durations[-1] += duration  # Same picture - show the previous frame longer
+                return
+            if merge_threshold:
+                frame = Image.composite(frame, frames[-1], changed)
+        frames.append(frame)
+        durations.append(duration)
+
+    @property
+    def size(self):
+        return self.frames[0].size
+
+    @property
+    def width(self):
+        return self.frames[0].width
+
+    @property
+    def height(self):
+        return self.frames[0].height
+
+    def resize(self, size, resample=Image.Resampling.LANCZOS, reducing_gap=None):
+        """
+        Resize every frame (same arguments as Image.resize()) and snap the
+        resized frames against each other with the original merge threshold.
+
+        Returns:
+            AnimationFrames: Resized animation
+        """
+        frames, durations = [], []
+        for frame, duration in zip(self.frames, self.durations):
+            self._append(frames, durations, frame.resize(size, resample, reducing_gap=reducing_gap), duration,
+                         self.merge_threshold)
+        return AnimationFrames(frames, durations, self.loop, self.source_frames, self.merge_threshold)
+
+
+class TiffBandReader:
+    """
+    Decode a TIFF band by band without ever holding the full image.
+
+    Every strip (or tile) is copied together with the tags that describe its
+    encoding into a one-strip TIFF in memory and decoded on its own, so
+    compressed files still go through libtiff. Uncompressed strips are split
+    further into bands of at most max_rows rows, and each row of tiles is
+    assembled into one full-width band.
+    """
+
+    # Tags describing how the pixel data is encoded, copied into every piece
+    STRUCTURE_TAGS = (258, 259, 262, 266, 277, 284, 317, 320, 338, 339, 347, 529, 530, 531, 532)
+
+    def __init__(self, img, max_rows=256):
+        """
+        Args:
+            img: Opened, not yet loaded TIFF (see supports())
+            max_rows: Rows per band for uncompressed strips
+        """
+        self.img = img
+        self.tags = img.tag_v2
+        self.max_rows = max_rows
+        self.tiled = 322 in self.tags and 324 in self.tags
+
+    @staticmethod
+    def supports(img):
+        """
+        Whether img can be read band by band: a TIFF with interleaved samples
+        and strip or tile offsets (old-style JPEG-in-TIFF is not supported).
+
+        Args:
+            img: Opened PIL Image
+
+        Returns:
+            bool: True if bands() can decode it
+        """
+        if img.format != 'TIFF':
+            return False
+        tags = img.tag_v2
+        return (tags.get(284, 1) == 1 and tags.get(259, 1) != 6
+                and (273 in tags or (322 in tags and 324 in tags)))
+
+    @property
+    def band_rows(self):
+        """
+        Height of the largest band, for memory estimates.
+        """
+        if self.tiled:
+            return self.tags[323]
+        rows = min(self.tags.get(278, self.img.height), self.img.height)
+        return min(rows, self.max_rows) if self.tags.get(259, 1) == 1 else rows
+
+    def bands(self):
+        """
+        Decode the image top to bottom.
+
+        Yields:
+            Image: Full-width bands in the image's own mode
+        """
+        width, height = self.img.size
+        tags = self.tags
+        if self.tiled:
+            tile_width, tile_height = tags[322], tags[323]
+            across = -(-width // tile_width)
+            for row, top in enumerate(range(0, height, tile_height)):
+                band = None
+                for column in range(across):
+                    index = row * across + column
+                    tile = self._decode(tags[324][index], tags[325][index], tile_width, tile_height)
+                    if band is None:
+                        band = Image.new(tile.mode, (width, min(tile_height, height - top)))
+                        if tile.mode == 'P':
+                            band.putpalette(tile.getpalette())
+                    band.paste(tile, (column * tile_width, 0))  # Edge tiles are clipped
+                yield band
+            return
+
+        rows_per_strip = min(tags.get(278, height), height)
+        bits = tags.get(258, (1,))
+        bits_per_pixel = sum(bits) if len(bits) > 1 else bits[0] * tags.get(277, 1)
+        row_bytes = (width * bits_per_pixel + 7) // 8
+        for index, (offset, byte_count) in enumerate(zip(tags[273], tags[279])):
+            top = index * rows_per_strip
+            rows = min(rows_per_strip, height - top)
+            if rows <= 0:
+                break
+            if tags.get(259, 1) != 1:
+                yield self._decode(offset, byte_count, width, rows)
+                continue
+            # Uncompressed: any row range of the strip is a valid strip on its own
+            for start in range(0, rows, self.max_rows):
+                count = min(self.max_rows, rows - start)
+                yield self._decode(offset + start * row_bytes, count * row_bytes, width, count)
+
+    def _decode(self, offset, byte_count, width, height):
+        """
+        Decode one strip or tile through a one-strip TIFF in memory.
+
+        Args:
+            offset: File offset of the piece's data
+            byte_count: Size of the piece's data
+            width: Width of the piece in pixels
+            height: Height of the piece in pixels
+
+        Returns:
+            Image: Decoded piece
+        """
+        self.img.fp.seek(offset)
+        data = self.img.fp.read(byte_count)
+
+        prefix = self.tags.prefix  # Keep the byte order: uncompressed 16-bit data depends on it
+        header = prefix + (b'\x2a\x00\x08\x00\x00\x00' if prefix == b'II' else b'\x00\x2a\x00\x00\x00\x08')
+        ifd = TiffImagePlugin.ImageFileDirectory_v2(header)
+        for tag in self.STRUCTURE_TAGS:
+            if tag in self.tags:
+                ifd.tagtype[tag] = self.tags.tagtype[tag]
+                ifd[tag] = self.tags[tag]
+        ifd[256], ifd[257], ifd[278] = width, height, height
+        ifd.tagtype[273] = ifd.tagtype[279] = 4  # LONG
+        ifd[273], ifd[279] = (0,), (byte_count,)  # tobytes() moves the strip offset past the directory
+
+        piece = Image.open(io.BytesIO(header + ifd.tobytes(8) + data))
+        piece.load()
+        return piece
+
+
+class ResultCache:
+    """
+    Persistent on-disk cache of finished WebP files.
+
+    Entries are keyed by a SHA-256 of the source bytes plus the encoding
+    settings, so a re-dropped or renamed copy of an already converted image is
+    served without decoding anything. Each entry is a <key>.webp file with a
+    <key>.json stats sidecar; the cache is trimmed least-recently-used first
+    (by mtime, refreshed on every hit) when it grows past max_size_mb.
+    """
+
+    def __init__(self, folder, max_size_mb=512):
+        """
+        Args:
+            folder: Cache folder (created if missing)
+            max_size_mb: Maximum total size of cached WebP files in MB
+        """
+        self.folder = Path(folder)
+        self.folder.mkdir(parents=True, exist_ok=True)
+        self.max_size_bytes = int(max_size_mb * 1024 * 1024)
+        self.hits = 0
+        self.misses = 0
+        self._size_bytes = sum(entry.stat().st_size for entry in os.scandir(self.folder)
+                               if entry.name.endswith('.webp'))
+
+    def make_key(self, source, settings):
+        """
+        Hash the source file (streamed in 1 MB blocks) together with the settings.
+
+        Args:
+            source: Path to the source image, or its content as bytes
+            settings: JSON-serialisable dict of everything that affects the output
+
+        Returns:
+            str: Hex digest used as cache key
+        """
+        digest = hashlib.sha256(json.dumps(settings, sort_keys=True).encode('utf-8'))
+        if isinstance(source, bytes):
+            digest.update(source)
+            return digest.hexdigest()
+        with open(source, 'rb') as f:
+            for block in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(block)
+        return digest.hexdigest()
+
+    def get(self, key):
+        """
+        Look up a cached conversion.
+
+        Args:
+            key: Cache key from make_key()
+
+        Returns:
+            tuple: (webp_data, stats) or None if not cached
+        """
+        webp_path = self.folder / f"{key}.webp"
+        try:
+            data = webp_path.read_bytes()
+            stats = json.loads((self.folder / f"{key}.json").read_text(encoding='utf-8'))
+        except (OSError, ValueError):
+            return None
+        try:
+            os.utime(webp_path)  # Mark as recently used
+        except OSError:
+            pass
+        return data, stats
+
+    def put(self, key, data, stats):
+        """
+        Store a conversion result. Safe to call in worker processes; the size
+        is counted (and old entries evicted) by track() in the main process.
+
+        Args:
+            key: Cache key from make_key()
+            data: Encoded WebP file
+            stats: Statistics returned by optimize_webp_size()
+        """
+        suffix = f".{os.getpid()}.{threading.get_ident()}.tmp"
+        for path, content in ((self.folder / f"{key}.json", json.dumps(stats).encode('utf-8')),
+                              (self.folder / f"{key}.webp", data)):
+            temp_path = path.with_name(path.name + suffix)
+            temp_path.write_bytes(content)
+            os.replace(temp_path, path)
+
+    def track(self, size_bytes):
+        """
+        Count a stored entry towards the cache size and evict old entries if
+        the cache is too large. Worker processes write entries into their own
+        copy of the cache, so this runs in the main process only (see
+        ImageToWebPConverter.record_result()).
+
+        Args:
+            size_bytes: Size of the stored WebP file
+        """
+        self._size_bytes += size_bytes
+        if self._size_bytes > self.max_size_bytes:
+            self.evict()
+
+    def evict(self):
+        """
+        Delete least recently used entries until the cache fits in max_size_mb.
+        """
+        entries = []
+        with os.scandir(self.folder) as scan:
+            for entry in scan:
+                if entry.name.endswith('.webp'):
+                    stat_result = entry.stat()
+                    entries.append((stat_result.st_mtime, stat_result.st_size, entry.name[:-5]))
+
+        entries.sort()
+        total = sum(size for _, size, _ in entries)
+        for _, size, key in entries:
+            if total <= self.max_size_bytes:
+                break
+            for suffix in ('.webp', '.json'):
+                try:
+                    (self.folder / f"{key}{suffix}").unlink()
+                except OSError:
+                    pass
+            total -= size
+        self._size_bytes = total
+
+    def count(self, hit):
+        """
+        Update the hit/miss counters.
+
+        Args:
+            hit: True for a cache hit, False for a miss
+        """
+        if hit:
+            self.hits += 1
+        else:
+            self.misses += 1
+
+
+class QualityPredictor:
+    """
+    Learns the starting quality and resize scale from earlier conversions.
+
+    Every successful conversion is stored with cheap image features; new images
+    start from the distance-weighted average outcome of their nearest
+    neighbours. Features are normalised by the byte budget, so records stay
+    useful when max_output_size_kb changes. The model is a JSON file that is
+    reloaded on start and grows with every batch.
+    """
+
+    def __init__(self, path, max_records=2000, neighbours=5, min_records=5):
+        """
+        Args:
+            path: JSON file the records are persisted in
+            max_records: Number of most recent records kept
+            neighbours: Number of nearest records averaged for a prediction
+            min_records: Records needed before predictions are made
+        """
+        self.path = Path(path)
+        self.max_records = max_records
+        self.neighbours = neighbours
+        self.min_records = min_records
+        self.records = []
+        self._dirty = False
+        self._mtime_ns = None  # Of the file the records were loaded from
+        self.reload()
+
+    def reload(self):
+        """
+        Load the records from disk if the file changed since they were last
+        loaded or saved. Worker processes call this before every job to pick
+        up what the main process learned and saved since they started.
+        """
+        try:
+            mtime_ns = self.path.stat().st_mtime_ns
+        except OSError:
+            return
+        if mtime_ns == self._mtime_ns:
+            return
+        try:
+            self.records = json.loads(self.path.read_text(encoding='utf-8'))['records']
+        except (OSError, ValueError, KeyError):
+            return
+        self._mtime_ns = mtime_ns
+
+    @staticmethod
+    def features(img, original_size, source_size, max_size_bytes):
+        """
+        Compute the prediction features of a decoded image.
+
+        Args:
+            img: Decoded PIL Image (may be decoded at reduced resolution)
+            original_size: (width, height) of the source
+            source_size: Source file size in bytes
+            max_size_bytes: Output size budget in bytes
+
+        Returns:
+            list: [log2 pixels per budget byte, log2 source bytes per pixel,
+                   has alpha, entropy / 8, mean edge strength]
+        """
+        pixels = max(original_size[0] * original_size[1], 1)
+
+        # Entropy and edge density on a ~256px downsample
+        small = img.reduce(max(max(img.size) // 256, 1)).convert('L')
+        edges = ImageStat.Stat(small.filter(ImageFilter.FIND_EDGES)).mean[0] / 255
+
+        return [
+            math.log2(pixels / max_size_bytes),
+            math.log2(max(source_size, 1) / pixels),
+            1.0 if img.mode in ('RGBA', 'LA', 'PA') else 0.0,
+            small.entropy() / 8,
+            edges,
+        ]
+
+    def predict(self, features):
+        """
+        Predict the starting quality and scale for an image.
+
+        Args:
+            features: Output of features()
+
+        Returns:
+            tuple: (quality, scale_percentage) or None if there are too few records
+        """
+        if len(self.records) < self.min_records:
+            return None
+
+        nearest = sorted((
+            (sum((a - b) ** 2 for a, b in zip(features, record['f'])) ** 0.5, record)
+            for record in self.records
+        ), key=lambda item: item[0])[:self.neighbours]
+
+        total_weight = quality = log_scale = 0.0
+        for distance, record in nearest:
+            weight = 1.0 / (distance + 0.05)
+            total_weight += weight
+            quality += weight * record['q']
+            log_scale += weight * math.log(record['s'])
+        return int(round(quality / total_weight)), int(round(math.exp(log_scale / total_weight)))
+
+    def output_bytes_per_pixel(self):
+        """
+        Median output density (bytes per output pixel) of recorded conversions.
+
+        Returns:
+            float: Bytes per pixel, or None if there are too few records
+        """
+        if len(self.records) < self.min_records:
+            return None
+        densities = sorted(record['bpp'] for record in self.records)
+        return densities[len(densities) // 2]
+
+    def add(self, features, stats, output_pixels):
+        """
+        Record the outcome of a conversion that met its size budget.
+
+        Args:
+            features: Output of features()
+            stats: Statistics returned by optimize_webp_size()
+            output_pixels: Pixel count of the written WebP
+        """
+        self.records.append({
+            'f': features,
+            'q': stats['quality'],
+            's': stats['resize_scale'],
+            'a': stats['attempts'],
+            'bpp': stats['final_size_kb'] * 1024 / max(output_pixels, 1),
+        })
+        del self.records[:-self.max_records]
+        self._dirty = True
+
+    def save(self):
+        """
+        Write the records to disk (atomically) if anything changed.
+        """
+        if not self._dirty:
+            return
+        temp_path = self.path.with_name(self.path.name + '.tmp')
+        temp_path.write_text(json.dumps({'records': self.records}), encoding='utf-8')
+        os.replace(temp_path, self.path)
+        self._mtime_ns = self.path.stat().st_mtime_ns
+        self._dirty = False
+
+
+class ClaimedElsewhere(Exception):
+    """Raised when another converter instance claimed a source file first."""
+
+
+class WorkClaimer:
+    """
+    Lease-based work claiming for several converter instances (possibly on
+    different machines) sharing one source folder.
+
+    A file is claimed by renaming it into source/.claims/<node_id>/ - rename is
+    atomic, also on NFS, so exactly one instance wins. Each instance keeps its
+    lease alive by touching source/.claims/<node_id>/.lease; when a lease has not
+    been renewed for lease_seconds (e.g. the machine crashed), any instance moves
+    the claimed files back into the source folder so they are converted again.
+    Lease ages are measured against the file server's clock, never the local one.
+
+    Only the claims and leases belong on the share: each instance's SQLite
+    manifest must stay on its own local disk, because SQLite locking is not
+    reliable over NFS.
+    """
+
+    CLAIMS_FOLDER = '.claims'
+    LEASE_FILE = '.lease'
+
+    def __init__(self, source_folder, node_id, lease_seconds=60):
+        """
+        Args:
+            source_folder: Shared source folder
+            node_id: Name of this instance, unique among all instances
+            lease_seconds: Seconds without renewal after which a lease has expired
+        """
+        self.source_folder = Path(source_folder)
+        self.node_id = node_id
+        self.lease_seconds = lease_seconds
+        self.claims_root = self.source_folder / self.CLAIMS_FOLDER
+        self.folder = self.claims_root / node_id
+        self.folder.mkdir(parents=True, exist_ok=True)
+        self._last_reclaim = 0.0
+        self._stop = threading.Event()
+        self._heartbeat_thread = None
+
+    def __getstate__(self):
+        # Worker processes only claim files; the heartbeat stays in the main process
+        state = self.__dict__.copy()
+        state['_stop'] = None
+        state['_heartbeat_thread'] = None
+        return state
+
+    def start(self):
+        """
+        Renew the lease now and then every lease_seconds / 3 in a background thread.
+        """
+        self.renew()
+        if self._heartbeat_thread is None:
+            self._stop.clear()
+            self._heartbeat_thread = threading.Thread(target=self._heartbeat, daemon=True)
+            self._heartbeat_thread.start()
+
+    def _heartbeat(self):
+        while not self._stop.wait(self.lease_seconds / 3):
+            try:
+                self.renew()
+            except OSError:
+                pass  # Share temporarily unavailable - try again next beat
+
+    def renew(self):
+        """
+        Touch the lease file.
+
+        Returns:
+            int: The lease file's new mtime in ns (file server time)
+        """
+        lease_path = self.folder / self.LEASE_FILE
+        self.folder.mkdir(parents=True, exist_ok=True)
+        lease_path.touch()
+        return lease_path.stat().st_mtime_ns
+
+    def claim(self, image_path):
+        """
+        Take ownership of a source file.
+
+        Args:
+            image_path: File in the source folder
+
+        Returns:
+            Path: Location of the claimed file, or None if another instance was first
+        """
+        target = self.folder / image_path.name
+        if target.exists() or self.original_name(image_path.name) != image_path.name:
+            # A same-named file is still being converted here. Names that already
+            # look prefixed get a prefix too, so original_name() never strips user text.
+            target = self.folder / f"{time.time_ns()}~{image_path.name}"
+        try:
+            os.rename(image_path, target)
+        except FileNotFoundError:
+            if self.folder.exists():
+                return None
+            # Claim folder removed by close() - recreate it and try again
+            self.folder.mkdir(parents=True, exist_ok=True)
+            return self.claim(image_path)
+        return target
+
+    @staticmethod
+    def original_name(name):
+        """
+        Name a claimed file had in the source folder: without the
+        "<time_ns>~" prefix claim() adds when the plain name is taken.
+
+        Args:
+            name: File name in a claim folder
+
+        Returns:
+            str: Original file name
+        """
+        prefix, separator, original = name.partition('~')
+        return original if separator and prefix.isdigit() and original else name
+
+    def reclaim_expired(self, include_own=False):
+        """
+        Move the files of expired leases back into the source folder. Runs at
+        most every lease_seconds / 3 unless include_own is set.
+
+        Args:
+            include_own: Also return this instance's own claims (at start-up,
+                         for files a previous run of the same node left behind)
+
+        Returns:
+            int: Number of files moved back
+        """
+        if not include_own and time.monotonic() - self._last_reclaim < self.lease_seconds / 3:
+            return 0
+        self._last_reclaim = time.monotonic()
+
+        now_ns = self.renew()
+        moved = 0
+        try:
+            folders = [entry for entry in os.scandir(self.claims_root) if entry.is_dir()]
+        except FileNotFoundError:
+            return 0
+        for entry in folders:
+            if entry.name == self.node_id and not include_own:
+                continue
+            if entry.name != self.node_id:
+                try:
+                    renewed_ns = os.stat(os.path.join(entry.path, self.LEASE_FILE)).st_mtime_ns
+                except FileNotFoundError:
+                    renewed_ns = entry.stat().st_mtime_ns
+                if now_ns - renewed_ns < self.lease_seconds * 1_000_000_000:
+                    continue
+            moved += self._release_folder(Path(entry.path))
+        return moved
+
+    def _release_folder(self, folder):
+        moved = 0
+        for claimed in folder.iterdir():
+            if claimed.name == self.LEASE_FILE or not claimed.is_file():
+                continue
+            name = self.original_name(claimed.name)
+            target = self.source_folder / name
+            if target.exists():
+                target = self.source_folder / f"{Path(name).stem}_{folder.name}{Path(name).suffix}"
+            try:
+                os.rename(claimed, target)
+                moved += 1
+            except FileNotFoundError:
+                pass  # Another instance reclaimed it first
+        if folder.name != self.node_id:
+            try:
+                (folder / self.LEASE_FILE).unlink()
+                folder.rmdir()
+            except OSError:
+                pass
+        return moved
+
+    def close(self):
+        """
+        Stop renewing the lease and hand back claimed files that were not converted.
+        """
+        if self._stop is not None:
+            self._stop.set()
+        self._heartbeat_thread = None
+        self._release_folder(self.folder)
+        try:
+            (self.folder / self.LEASE_FILE).unlink()
+            self.folder.rmdir()
+        except OSError:
+            pass
+
+
+class ConversionManifest:
+    """
+    Crash-safe journal of conversion jobs (SQLite in WAL mode).
+
+    Every source moves through started -> writing -> written -> done (or
+    failed). Outputs are written to a temp file and renamed into place, so
+    after a crash only the unfinished rows need attention: a temp file to
+    remove, or a source whose output is already complete and only needs
+    deleting. Sources that are already done and unchanged are skipped.
+    """
+
+    UNFINISHED = ('started', 'writing', 'written')
+
+    def __init__(self, path):
+        """
+        Args:
+            path: SQLite database file (created if missing)
+        """
+        self.path = Path(path)
+        self._local = threading.local()  # One connection per thread
+        self._connection()
+
+    def __getstate__(self):
+        # Connections cannot be pickled; worker processes open their own
+        state = self.__dict__.copy()
+        del state['_local']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._local = threading.local()
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(str(self.path), timeout=30)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            connection.execute('CREATE TABLE IF NOT EXISTS jobs (source TEXT PRIMARY KEY, size INTEGER, '
+                               'mtime_ns INTEGER, state TEXT NOT NULL, output TEXT, error TEXT, updated REAL)')
+            connection.execute('CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state)')
+            connection.commit()
+            self._local.connection = connection
+        return connection
+
+    @staticmethod
+    def _key(source):
+        return str(Path(source).absolute())
+
+    def mark(self, source, state, stat_result=None, output=None, error=None):
+        """
+        Record the state of a job. Passing stat_result starts a new row for the
+        current version of the source.
+
+        Args:
+            source: Path to the source image
+            state: 'started', 'writing', 'written', 'done', 'failed' or 'interrupted'
+            stat_result: os.stat_result of the source (new job)
+            output: Temp or final output path
+            error: Error message of a failed job
+        """
+        connection = self._connection()
+        with connection:
+            if stat_result is not None:
+                connection.execute('INSERT OR REPLACE INTO jobs VALUES (?, ?, ?, ?, ?, ?, ?)',
+                                   (self._key(source), stat_result.st_size, stat_result.st_mtime_ns,
+                                    state, output, error, time.time()))
+            else:
+                connection.execute('UPDATE jobs SET state = ?, output = COALESCE(?, output), error = ?, '
+                                   'updated = ? WHERE source = ?',
+                                   (state, output and self._key(output), error, time.time(), self._key(source)))
+
+    def is_done(self, source, stat_result):
+        """
+        Check whether this exact version of a source was already converted.
+
+        Args:
+            source: Path to the source image
+            stat_result: os.stat_result of the source
+
+        Returns:
+            bool: True if the job is done and size and mtime are unchanged
+        """
+        row = self._connection().execute('SELECT size, mtime_ns, state FROM jobs WHERE source = ?',
+                                         (self._key(source),)).fetchone()
+        return row == (stat_result.st_size, stat_result.st_mtime_ns, 'done')
+
+    def output_of(self, source):
+        """
+        Output file of the last finished conversion of a source.
+
+        Args:
+            source: Path to the source image
+
+        Returns:
+            Path: Output path, or None if the source was never converted
+        """
+        row = self._connection().execute('SELECT output FROM jobs WHERE source = ? AND state = ?',
+                                         (self._key(source), 'done')).fetchone()
+        return Path(row[0]) if row and row[0] else None
+
+    def unfinished(self):
+        """
+        Returns:
+            list: (source, size, mtime_ns, state, output) of every job a crash interrupted
+        """
+        return self._connection().execute(
+            f"SELECT source, size, mtime_ns, state, output FROM jobs "
+            f"WHERE state IN ({', '.join('?' * len(self.UNFINISHED))})", self.UNFINISHED
+        ).fetchall()
+
+    def close(self):
+        """
+        Close this thread's database connection.
+        """
+        connection = getattr(self._local, 'connection', None)
+        if connection is not None:
+            connection.close()
+            self._local.connection = None
+
+
+class AdmissionScheduler:
+    """
+    Memory-aware admission control for parallel conversion.
+
+    Queued images carry an estimate of the memory their conversion needs. Jobs
+    are admitted smallest first while the estimates in flight stay under the
+    budget, so small images never wait behind giant ones. To keep a steady
+    stream of small files from starving a large one, the oldest queued job is
+    reserved once max_skips younger jobs have overtaken it. A job that exceeds
+    the whole budget runs alone.
+    """
+
+    def __init__(self, budget_bytes, max_skips=8):
+        """
+        Args:
+            budget_bytes: Memory the admitted jobs may use together
+            max_skips: Times the oldest job can be overtaken before it is reserved
+        """
+        self.budget_bytes = budget_bytes
+        self.max_skips = max_skips
+        self.in_use = 0  # Sum of the estimates of admitted, unfinished jobs
+        self.running = 0
+        self._queue = []  # (estimate, sequence, item), sorted smallest first
+        self._sequence = 0
+        self._skips = 0  # Times the current oldest job has been overtaken
+
+    @property
+    def queue_depth(self):
+        return len(self._queue)
+
+    def add(self, item, estimate):
+        """
+        Queue a job.
+
+        Args:
+            item: Job passed back by admit()
+            estimate: Estimated memory of the job in bytes
+        """
+        insort(self._queue, (estimate, self._sequence, item))  # Unique sequence: items are never compared
+        self._sequence += 1
+
+    def admit(self, max_jobs):
+        """
+        Take the jobs that can start now.
+
+        Args:
+            max_jobs: Maximum number of jobs to admit (free worker slots)
+
+        Returns:
+            list: (item, estimate) of every admitted job; release() each when done
+        """
+        admitted = []
+        while self._queue and len(admitted) < max_jobs:
+            oldest = min(self._queue, key=lambda entry: entry[1])
+            candidates = [oldest] if self._skips >= self.max_skips else self._queue
+            entry = next((entry for entry in candidates
+                          if self.running == 0 or self.in_use + entry[0] <= self.budget_bytes), None)
+            if entry is None:
+                break
+            self._queue.remove(entry)
+            self._skips = 0 if entry is oldest else self._skips + 1
+            self.in_use += entry[0]
+            self.running += 1
+            admitted.append((entry[2], entry[0]))
+        return admitted
+
+    def release(self, estimate):
+        """
+        Return the memory of a finished job to the budget.
+
+        Args:
+            estimate: Estimate the job was admitted with
+        """
+        self.in_use -= estimate
+        self.running -= 1
+
+
+class ConversionMetrics:
+    """
+    Structured per-image instrumentation.
+
+    Every conversion is appended as one JSON line (per-stage durations, encode
+    attempts, bytes in/out, final quality and scale) to events_path. Rolling
+    aggregates are exported in Prometheus text format to prometheus_path and/or
+    served on http://127.0.0.1:<http_port>/metrics.
+    """
+
+    def __init__(self, events_path=None, prometheus_path=None, http_port=None, window=1000):
+        """
+        Args:
+            events_path: JSON-lines file receiving one event per image (appended)
+            prometheus_path: Text file rewritten with the current aggregates
+            http_port: Local port for a /metrics endpoint (None = no server)
+            window: Number of recent images used for latency quantiles
+        """
+        self.prometheus_path = Path(prometheus_path) if prometheus_path else None
+        self._events = open(events_path, 'a', encoding='utf-8') if events_path else None
+        self._lock = threading.Lock()
+        self._window = deque(maxlen=window)  # timings dicts of recent images
+        self._counters = {
+            'images_success': 0,
+            'images_failed': 0,
+            'cache_hits': 0,
+            'bytes_in': 0,
+            'bytes_out': 0,
+            'encode_attempts': 0,
+            'over_budget': 0,
+        }
+        self._stage_sum = {}
+        self._stage_count = {}
+        self._gauges = {}
+        self._server = None
+
+        if http_port is not None:
+            metrics = self
+
+            class MetricsHandler(BaseHTTPRequestHandler):
+                def do_GET(self):
+                    if self.path.split('?')[0] != '/metrics':
+                        self.send_error(404)
+                        return
+                    body = metrics.render().encode('utf-8')
+                    self.send_response(200)
+                    self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                    self.send_header('Content-Length', str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+
+                def log_message(self, format, *args):
+                    pass  # Keep the console quiet
+
+            self._server = ThreadingHTTPServer(('127.0.0.1', http_port), MetricsHandler)
+            threading.Thread(target=self._server.serve_forever, daemon=True).start()
+
+    def record(self, image_path, success, stats, max_output_size_kb):
+        """
+        Record one finished conversion.
+
+        Args:
+            image_path: Path to the source image file
+            success: Whether the conversion succeeded
+            stats: Statistics of the conversion (may be None)
+            max_output_size_kb: Size budget the conversion ran with
+        """
+        stats = stats or {}
+        timings = stats.get('timings', {})
+        bytes_out = int(round(stats['final_size_kb'] * 1024)) if success and 'final_size_kb' in stats else 0
+        event = {
+            'time': datetime.now().isoformat(timespec='milliseconds'),
+            'file': str(image_path),
+            'success': success,
+            'bytes_in': stats.get('source_size'),
+            'bytes_out': bytes_out if success else None,
+            'stages': {stage: round(seconds, 6) for stage, seconds in timings.items()},
+            'attempts': stats.get('attempts'),
+            'quality': stats.get('quality'),
+            'ssim': stats.get('ssim'),
+            'scale': stats.get('resize_scale'),
+            'cache_hit': stats.get('cache_hit', False),
+        }
+        if not success:
+            event['error'] = stats.get('error')
+
+        with self._lock:
+            counters = self._counters
+            counters['images_success' if success else 'images_failed'] += 1
+            counters['bytes_in'] += stats.get('source_size') or 0
+            counters['bytes_out'] += bytes_out
+            counters['encode_attempts'] += 0 if event['cache_hit'] else (stats.get('attempts') or 0)
+            counters['cache_hits'] += 1 if event['cache_hit'] else 0
+            counters['over_budget'] += 1 if bytes_out > max_output_size_kb * 1024 else 0
+            for stage, seconds in timings.items():
+                self._stage_sum[stage] = self._stage_sum.get(stage, 0.0) + seconds
+                self._stage_count[stage] = self._stage_count.get(stage, 0) + 1
+            self._window.append(timings)
+
+            if self._events is not None:
+                self._events.write(json.dumps(event) + "\n")
+                self._events.flush()
+
+    def set_gauge(self, name, value, help_text):
+        """
+        Set a point-in-time value exported as webp_converter_<name>.
+
+        Args:
+            name: Metric name (without prefix)
+            value: Current value
+            help_text: Description shown in the HELP line
+        """
+        with self._lock:
+            self._gauges[name] = (value, help_text)
+
+    def render(self):
+        """
+        Render the aggregates in Prometheus text exposition format.
+
+        Returns:
+            str: Metrics text
+        """
+        with self._lock:
+            counters = dict(self._counters)
+            stage_sum = dict(self._stage_sum)
+            stage_count = dict(self._stage_count)
+            window = list(self._window)
+            gauges = dict(self._gauges)
+
+        lines = [
+            '# HELP webp_converter_images_total Images processed, by result.',
+            '# TYPE webp_converter_images_total counter',
+            f'webp_converter_images_total{{result="success"}} {counters["images_success"]}',
+            f'webp_converter_images_total{{result="failed"}} {counters["images_failed"]}',
+        ]
+        for name, key, help_text in (
+            ('webp_converter_cache_hits_total', 'cache_hits', 'Images served from the result cache.'),
+            ('webp_converter_bytes_in_total', 'bytes_in', 'Source bytes processed.'),
+            ('webp_converter_bytes_out_total', 'bytes_out', 'WebP bytes written.'),
+            ('webp_converter_encode_attempts_total', 'encode_attempts', 'WebP encodes performed.'),
+            ('webp_converter_over_budget_total', 'over_budget', 'Outputs larger than the size budget.'),
+        ):
+            lines += [f'# HELP {name} {help_text}', f'# TYPE {name} counter', f'{name} {counters[key]}']
+        for name, (value, help_text) in sorted(gauges.items()):
+            name = f'webp_converter_{name}'
+            lines += [f'# HELP {name} {help_text}', f'# TYPE {name} gauge', f'{name} {value}']
+
+        lines += [
+            '# HELP webp_converter_stage_seconds Time spent per conversion stage (quantiles over recent images).',
+            '# TYPE webp_converter_stage_seconds summary',
+        ]
+        for stage in sorted(stage_sum):
+            values = sorted(timings[stage] for timings in window if stage in timings)
+            for quantile in (0.5, 0.95):
+                if values:
+                    value = values[min(int(round(quantile * (len(values) - 1))), len(values) - 1)]
+                    lines.append(f'webp_converter_stage_seconds{{stage="{stage}",quantile="{quantile}"}} {value:.6f}')
+            lines.append(f'webp_converter_stage_seconds_sum{{stage="{stage}"}} {stage_sum[stage]:.6f}')
+            lines.append(f'webp_converter_stage_seconds_count{{stage="{stage}"}} {stage_count[stage]}')
+        return "\n".join(lines) + "\n"
+
+    def export(self):
+        """
+        Rewrite the Prometheus text file (atomically) with the current aggregates.
+        """
+        if self.prometheus_path is None:
+            return
+        temp_path = self.prometheus_path.with_name(self.prometheus_path.name + '.tmp')
+        temp_path.write_text(self.render(), encoding='utf-8')
+        os.replace(temp_path, self.prometheus_path)
+
+    def close(self):
+        """
+        Export the final aggregates, stop the HTTP server and close the events file.
+        """
+        self.export()
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+        if self._events is not None:
+            self._events.close()
+            self._events = None
+
+
+class UnixHTTPServer(ThreadingHTTPServer):
+    """
+    ThreadingHTTPServer listening on a Unix domain socket instead of a TCP port.
+    """
+    address_family = getattr(socket, 'AF_UNIX', None)
+
+    def server_bind(self):
+        # HTTPServer.server_bind expects a (host, port) address
+        if os.path.exists(self.server_address):
+            os.unlink(self.server_address)  # Stale socket from a previous run
+        socketserver.TCPServer.server_bind(self)
+        self.server_name = 'localhost'
+        self.server_port = 0
+
+
+class ConversionService:
+    """
+    Long-running local conversion service.
+
+    POST the image bytes to /convert and the response body is the WebP file;
+    the compression statistics are returned as JSON in the X-WebP-Stats header.
+    GET /health reports the service state. Conversions run on the converter's
+    worker pool, which is started (and every worker's Pillow plugins loaded)
+    before the first request is accepted. Worker processes get the converter
+    settings once at start-up, so a request only carries the image bytes.
+    """
+
+    def __init__(self, converter, host='127.0.0.1', port=8765, unix_socket=None, max_request_mb=200):
+        """
+        Args:
+            converter: ImageToWebPConverter whose settings and worker pool are used
+            host: Interface to listen on (default: localhost only)
+            port: TCP port
+            unix_socket: Path of a Unix domain socket to listen on instead of host/port
+            max_request_mb: Largest accepted upload in MB
+        """
+        self.converter = converter
+        self.max_request_bytes = max_request_mb * 1024 * 1024
+        self._lock = threading.Lock()  # record_result() updates shared converter state
+        self.requests = 0
+
+        service = self
+
+        class ConversionHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] != '/health':
+                    self.send_error(404)
+                    return
+                self.send_json(200, {
+                    'status': 'ok',
+                    'workers': service.converter.workers,
+                    'executor': service.converter.executor,
+                    'requests': service.requests,
+                    'max_output_size_kb': service.converter.max_output_size_kb,
+                })
+
+            def do_POST(self):
+                if self.path.split('?')[0] != '/convert':
+                    self.send_error(404)
+                    return
+                length = int(self.headers.get('Content-Length') or 0)
+                if length <= 0:
+                    self.send_json(411, {'error': 'Content-Length with the image bytes is required'})
+                    return
+                if length > service.max_request_bytes:
+                    self.send_json(413, {'error': f'Image larger than {max_request_mb} MB'})
+                    return
+
+                data = self.rfile.read(length)
+                name = self.headers.get('X-Filename') or 'upload'
+                try:
+                    webp_data, stats = service.convert(data, name)
+                except Image.UnidentifiedImageError as e:
+                    self.send_json(400, {'error': str(e)})
+                    return
+                except Exception as e:
+                    self.send_json(500, {'error': str(e)})
+                    return
+
+                self.send_response(200)
+                self.send_header('Content-Type', 'image/webp')
+                self.send_header('Content-Length', str(len(webp_data)))
+                self.send_header('X-WebP-Stats', json.dumps(
+                    {key: value for key, value in stats.items() if key != 'features'}
+                ))
+                self.end_headers()
+                self.wfile.write(webp_data)
+
+            def send_json(self, status, payload):
+                body = json.dumps(payload).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass  # Conversions are reported through the converter's log/metrics
+
+        if unix_socket is not None:
+            if UnixHTTPServer.address_family is None:
+                raise ValueError("Unix domain sockets are not supported on this platform")
+            self.address = str(unix_socket)
+            self.server = UnixHTTPServer(self.address, ConversionHandler)
+        else:
+            self.server = ThreadingHTTPServer((host, port), ConversionHandler)
+            self.address = f"http://{host}:{self.server.server_port}"
+        self.server.daemon_threads = True
+
+    def warm_up(self):
+        """
+        Start the worker pool and load the Pillow plugins in every worker.
+
+        Returns:
+            int: Number of distinct warm workers
+        """
+        pool = self.converter.get_pool()
+        futures = [pool.submit(_warm_worker) for _ in range(self.converter.workers)]
+        return len({future.result() for future in futures})
+
+    def convert(self, data, name='upload'):
+        """
+        Convert one uploaded image on the worker pool.
+
+        Args:
+            data: Image file bytes
+            name: Name used in logs and metrics
+
+        Returns:
+            tuple: (webp_bytes, stats)
+        """
+        pool = self.converter.get_pool()
+        future = pool.submit(_convert_bytes_worker, self.converter.job_converter(), data, name,
+                             self.converter.effort_ratio)
+        try:
+            webp_data, stats = future.result()
+        except Exception as e:
+            with self._lock:
+                self.requests += 1
+                self.converter.record_result(Path(name), False, {'error': str(e), 'source_size': len(data)})
+            raise
+        with self._lock:
+            self.requests += 1
+            self.converter.record_result(Path(name), True, stats)
+        return webp_data, stats
+
+    def serve_forever(self):
+        """
+        Warm up the workers and serve requests until interrupted (Ctrl+C).
+        """
+        workers = self.warm_up()
+        self.converter.log(f"🌐 Conversion service listening on {self.address} ({workers} warm worker(s))")
+        self.converter.log("   POST image bytes to /convert, GET /health  |  Ctrl+C to stop")
+        try:
+            self.server.serve_forever()
+        except KeyboardInterrupt:
+            self.converter.log("\n🛑 Service stopped")
+        finally:
+            self.close()
+
+    def close(self):
+        """
+        Stop listening, save the learned predictor and shut down the converter's worker pool.
+        """
+        self.server.server_close()
+        if self.converter.predictor is not None:
+            self.converter.predictor.save()
+        if isinstance(self.server, UnixHTTPServer) and os.path.exists(self.address):
+            os.unlink(self.address)
+        self.converter.shutdown()
+
+
+class ImageToWebPConverter:
+    def __init__(self, source_folder="source", result_folder="result", failed_folder="failedConvert",
+                 workers=1, executor="process", cache_folder=None, cache_size_mb=512,
+                 model_path=None, quiet=False, metrics_log=None, metrics_file=None, metrics_port=None,
+                 memory_budget_mb=None, pipeline=False, pipeline_depth=2, manifest_path=None,
+                 node_id=None, lease_seconds=60, recursive=False, keep_originals=False, renditions=None,
+                 create_folders=True):
+        """
+        Initialize the converter with folder paths.
+
+        Args:
+            source_folder: Folder containing source images
+            result_folder: Folder to save converted images
+            failed_folder: Folder to move failed conversions
+            workers: Number of images converted in parallel (default: 1).
+                     Use 0 or None for one worker per CPU core.
+            executor: "process" or "thread" - how parallel workers are run
+            cache_folder: Folder for the result cache that skips re-encoding duplicate
+                          images (default: None, cache disabled)
+            cache_size_mb: Maximum size of the result cache in MB (default: 512)
+            model_path: JSON file for the learned quality/scale predictor
+                        (default: None, fixed starting ladder)
+            quiet: Turn all console output off (default: False)
+            metrics_log: JSON-lines file receiving one event per converted image
+            metrics_file: Prometheus text file updated after every batch
+            metrics_port: Port for a local http://127.0.0.1:<port>/metrics endpoint
+            memory_budget_mb: RAM that parallel conversions may use together; admits
+                              images by estimated decode memory, smallest first
+                              (default: None, no admission control)
+            pipeline: Convert batches as a streaming pipeline - read, decode, encode
+                      and commit run in their own threads (default: False)
+            pipeline_depth: Images buffered between two pipeline stages (default: 2)
+            manifest_path: SQLite journal of conversion jobs, used to resume after a
+                           crash (default: None, no journal). Keep it on a local
+                           disk of this instance, never on the NFS share the
+                           source folder and its claims live on: SQLite locking
+                           is not reliable over NFS
+            node_id: Name of this instance when several instances share the source
+                     folder; files are claimed before converting (default: None)
+            lease_seconds: Seconds after which the claims of a crashed instance
+                           are returned to the source folder (default: 60)
+            recursive: Convert source_folder including subfolders, mirroring the folder
+                       structure under result_folder/failed_folder instead of using a
+                       date subfolder (default: False)
+            keep_originals: Never delete or move source files (default: False)
+            renditions: Extra outputs encoded from the same decode, e.g.
+                        THUMBNAIL_RENDITIONS - list of dicts with 'suffix' (added to
+                        the file name), 'max_dimension' (px, longest side), 'max_kb'
+                        and 'metadata' (see RENDITION_METADATA_POLICIES)
+            create_folders: Create the source/result/failed folders if missing
+                            (default: True; off for dry runs, which write nothing)
+        """
+        self.source_folder = Path(source_folder)
+        self.result_folder = Path(result_folder)
+        self.failed_folder = Path(failed_folder)
+
+        # Parallel conversion settings
+        if executor not in ("process", "thread"):
+            raise ValueError(f"executor must be 'process' or 'thread', got {executor!r}")
+        self.workers = workers or os.cpu_count() or 1
+        self.executor = executor
+        self._pool = None
+        self._pool_fingerprint = None
+        self.memory_budget_mb = memory_budget_mb
+        self.scheduler = None  # AdmissionScheduler of the batch in progress
+        self.pipeline = pipeline
+        self.pipeline_depth = pipeline_depth
+
+        # Create folders if they don't exist
+        if create_folders:
+            self.source_folder.mkdir(parents=True, exist_ok=True)
+            self.result_folder.mkdir(parents=True, exist_ok=True)
+            self.failed_folder.mkdir(parents=True, exist_ok=True)
+        self.recursive = recursive
+        self.keep_originals = keep_originals
+
+        # Extra renditions (thumbnails), largest first so smaller ones derive from them
+        for rendition in renditions or []:
+            if rendition.get('metadata', 'all') not in RENDITION_METADATA_POLICIES:
+                raise ValueError(f"rendition metadata must be one of {RENDITION_METADATA_POLICIES}, "
+                                 f"got {rendition.get('metadata')!r}")
+            if not rendition.get('suffix') or rendition.get('max_kb', 0) <= 0:
+                raise ValueError(f"rendition needs a non-empty 'suffix' and a positive 'max_kb': {rendition!r}")
+        self.renditions = sorted(renditions or [], key=lambda rendition: -(rendition.get('max_dimension') or 0))
+
+        # WebP conversion settings
+        self.webp_quality = 75
+        self.webp_alpha_quality = 80
+        self.max_output_size_kb = 150  # Maximum output file size in KB (with metadata preserved)
+        self.min_quality = 25  # Lowest quality used before resizing further
+        self.quality_tolerance = 2  # Stop searching once the best quality is bracketed this tightly
+        self.quality_doubling_step = 25  # Approx. quality points per doubling of WebP size
+        self.prediction_headroom = 5  # Quality points a learned start is placed above the prediction
+        self.min_bytes_per_pixel = 0.01  # Densest packing reachable at minimum quality (caps pixel count)
+
+        # Automatic lossless/lossy selection (needs NumPy): screenshots, UI and
+        # graphics also get lossless, near-lossless and palette encodes next to
+        # the lossy search, and the smallest encode that fits is kept
+        self.auto_lossless = np is not None
+        self.lossless_method = 4  # Lossless effort; method 6 is several times slower for ~5% smaller files
+        self.analysis_size = 256  # Longest side of the sample the content statistics are computed on
+        self.palette_max_colours = 4096  # Sample colour count up to which a 256-colour palette is tried
+
+        # Animated GIF/WebP/PNG input
+        self.frame_merge_threshold = 3  # Per-channel change up to which frame pixels count as unchanged
+        self.max_animation_frames = 1000  # Longer animations are converted as their first frame
+        self.max_animation_pixels = 100_000_000  # Same for width * height * frames (~400 MB of RGBA frames)
+        self.animation_method = 4  # Encoder effort for animations; method 6 is ~5x slower and rarely smaller
+
+        # Perceptual quality floor (needs NumPy): with min_ssim set (e.g. 0.95) the
+        # smallest encode whose SSIM against the resized image still meets it is
+        # kept, and the byte budget stays the ceiling. None = byte budget only.
+        self.min_ssim = None
+
+        # Two-phase encoder effort: None = every trial encode uses method 6.
+        # Set to a lower method (e.g. 2) to run the size search fast and encode
+        # only the chosen quality/scale at method 6.
+        self.search_method = None
+        self.effort_ratio = 1.0  # Calibrated method-6 size / search-method size, sent with every worker job
+        self.effort_safety_margin = 0.03  # Extra headroom on predicted sizes
+        self.effort_log = deque(maxlen=1000)  # (file name, predicted KB, actual KB) of recent conversions
+
+        # Content-hash result cache for duplicate / re-dropped images
+        self.result_cache = ResultCache(cache_folder, cache_size_mb) if cache_folder else None
+
+        # Learned starting quality/scale, improves with every conversion
+        self.predictor = QualityPredictor(model_path) if model_path else None
+
+        # Crash-safe job journal
+        self.manifest = ConversionManifest(manifest_path) if manifest_path else None
+
+        # Work claiming between instances sharing the source folder
+        self.claimer = WorkClaimer(self.source_folder, node_id, lease_seconds) if node_id else None
+
+        # Instrumentation
+        self.quiet = quiet
+        self.metrics = None
+        if metrics_log or metrics_file or metrics_port is not None:
+            self.metrics = ConversionMetrics(metrics_log, metrics_file, metrics_port)
+
+        # Supported image formats
+        self.supported_formats = {
+            '.jpg', '.jpeg', '.png', '.bmp', '.tiff', '.tif',
+            '.gif', '.ico', '.webp', '.ppm', '.pgm', '.pbm',
+            '.pnm', '.dib', '.jfif', '.jp2', '.jpx', '.j2k'
+        }
+
+    def __getstate__(self):
+        # The worker pool and metrics exporter cannot be pickled into worker
+        # processes (metrics are recorded in the main process anyway)
+        state = self.__dict__.copy()
+        state['_pool'] = None
+        state['metrics'] = None
+        state['scheduler'] = None
+        return state
+
+    def log(self, message=""):
+        """
+        Print a log line, or collect it when running inside a parallel worker.
+        Does nothing in quiet mode.
+
+        Args:
+            message: Text to log
+        """
+        if self.quiet:
+            return
+        lines = getattr(_log_capture, 'lines', None)
+        if lines is None:
+            print(message)
+        else:
+            lines.append(message)
+
+    def get_pool(self):
+        """
+        Return the worker pool used for parallel conversion, creating it on first use.
+
+        Returns:
+            Executor: ProcessPoolExecutor or ThreadPoolExecutor with self.workers workers
+        """
+        if self._pool is not None and self.executor != "thread":
+            if self.settings_fingerprint() != self._pool_fingerprint:
+                # Settings changed since the workers were built - start them again
+                self._pool.shutdown(wait=True)
+                self._pool = None
+        if self._pool is None:
+            if self.executor == "thread":
+                self._pool = ThreadPoolExecutor(max_workers=self.workers)
+            else:
+                self._pool = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker,
+                                                 initargs=(type(self), self.worker_settings()))
+                self._pool_fingerprint = self.settings_fingerprint()
+        return self._pool
+
+    def job_converter(self):
+        """
+        Converter argument for the worker functions: this converter in worker
+        threads, None in worker processes, which use the one built once by
+        _init_worker(), so jobs never pickle the converter.
+
+        Returns:
+            ImageToWebPConverter: self, or None with the process executor
+        """
+        return self if self.executor == "thread" else None
+
+    def settings_fingerprint(self):
+        """
+        Fingerprint of the plain settings worker processes were built with.
+        State the main process keeps changing is left out: the effort ratio is
+        sent with every job and workers reload the learned model themselves.
+
+        Returns:
+            str: Changes whenever a setting changes
+        """
+        plain = (bool, int, float, str, bytes, Path, list, tuple, dict, type(None))
+        settings = {name: value for name, value in self.__dict__.items()
+                    if isinstance(value, plain) and name != 'effort_ratio' and not name.startswith('_')}
+        return repr(sorted(settings.items()))
+
+    def discard_broken_pool(self):
+        """
+        Drop the process pool after one of its workers died, so the next
+        get_pool() starts a fresh one. A pool that still works is kept.
+        """
+        pool = self._pool
+        if pool is not None and getattr(pool, '_broken', False):
+            pool.shutdown(wait=False)
+            self._pool = None
+
+    def run_isolated(self, function, *args):
+        """
+        Run one job in a worker process of its own. Used to retry the jobs that
+        were in flight when a worker died: only the job that kills this worker
+        is the one that crashed.
+
+        Args:
+            function: Module-level worker function
+            *args: Its arguments
+
+        Returns:
+            Whatever function returns
+
+        Raises:
+            BrokenProcessPool: If the job killed its worker again
+        """
+        with ProcessPoolExecutor(max_workers=1, initializer=_init_worker,
+                                 initargs=(type(self), self.worker_settings())) as pool:
+            return pool.submit(function, *args).result()
+
+    def worker_settings(self):
+        """
+        Attributes a worker process builds its converter from (see _init_worker()),
+        sent once when the pool starts: the settings, the learned model and the
+        handles workers write through (result cache, manifest, work claims),
+        without the state only the main process uses (effort log, pool, metrics).
+
+        Returns:
+            dict: Picklable attribute dict
+        """
+        settings = self.__getstate__()
+        settings['effort_log'] = deque(maxlen=1)
+        return settings
+
+    def shutdown(self):
+        """
+        Stop the worker pool (if one was started) and flush the metrics.
+        """
+        if self._pool is not None:
+            self._pool.shutdown(wait=True)
+            self._pool = None
+        if self.metrics is not None:
+            self.metrics.close()
+            self.metrics = None
+        if self.manifest is not None:
+            self.manifest.close()
+        if self.claimer is not None:
+            self.claimer.close()
+
+    def get_output_subfolder(self):
+        """
+        Create and return the output subfolder path based on current date (mmddyyyy).
+
+        Returns:
+            Path: Path to the date-based subfolder
+        """
+        now = datetime.now()
+        subfolder_name = now.strftime("%m%d%Y")
+        output_path = self.result_folder / subfolder_name
+        output_path.mkdir(parents=True, exist_ok=True)
+        return output_path
+
+    def mirrored_folder(self, root, image_path, create=True):
+        """
+        Folder below root that mirrors the folder of image_path relative to the
+        source folder (recursive mode).
+
+        Args:
+            root: Result or failed folder
+            image_path: Source image file
+            create: Create the folder if it does not exist
+
+        Returns:
+            Path: Mirrored folder
+        """
+        folder = root / image_path.parent.relative_to(self.source_folder)
+        if create:
+            folder.mkdir(parents=True, exist_ok=True)
+        return folder
+
+    def output_folder_for(self, image_path, create=True):
+        """
+        Folder the WebP of a source image is written to: the mirrored folder in
+        recursive mode, otherwise the date-based subfolder.
+
+        Args:
+            image_path: Source image file
+            create: Create the folder if it does not exist
+
+        Returns:
+            Path: Output folder
+        """
+        if self.recursive:
+            return self.mirrored_folder(self.result_folder, image_path, create)
+        if not create:
+            return self.result_folder / datetime.now().strftime("%m%d%Y")
+        return self.get_output_subfolder()
+
+    def extract_metadata(self, img):
+        """
+        Collect the metadata to carry over from an opened source image.
+
+        Args:
+            img: Opened PIL Image (before any mode conversion)
+
+        Returns:
+            dict: 'exif', 'icc_profile' and 'xmp' as bytes (empty if absent)
+        """
+        exif_data = img.info.get('exif', b'')
+        if exif_data:
+            try:
+                # Normalise EXIF (including GPS) through piexif
+                exif_data = piexif.dump(piexif.load(exif_data))
+            except Exception:
+                pass  # Keep the raw EXIF block if piexif cannot parse it
+
+        xmp_data = img.info.get('xmp') or img.info.get('XML:com.adobe.xmp') or b''
+        if isinstance(xmp_data, str):
+            xmp_data = xmp_data.encode('utf-8')
+
+        return {
+            'exif': exif_data,
+            'icc_profile': img.info.get('icc_profile') or b'',
+            'xmp': xmp_data,
+        }
+
+    def calculate_resize_dimensions(self, original_width, original_height, target_size_kb):
+        """
+        Calculate new dimensions to achieve target file size.
+        Uses balanced scaling for 150KB target with metadata preservation;
+        once the predictor has learned the typical output density, the scale
+        is sized so the pixel count fits target_size_kb.
+
+        Args:
+            original_width: Original image width
+            original_height: Original image height
+            target_size_kb: Target file size in KB
+
+        Returns:
+            tuple: (new_width, new_height, scale_percentage)
+        """
+        # For 150KB target, use 60% scale to maintain better quality
+        scale = 0.6
+
+        bytes_per_pixel = self.predictor.output_bytes_per_pixel() if self.predictor else None
+        if bytes_per_pixel:
+            # Pixel count that fits the target at the typical learned output density
+            scale = math.sqrt(target_size_kb * 1024 / (original_width * original_height * bytes_per_pixel))
+            scale = min(max(scale, 0.1), 0.85)
+
+        # Never more pixels than the budget can hold or WebP can store
+        scale = min(scale, self.max_scale(original_width, original_height, target_size_kb))
+
+        new_width = int(original_width * scale)
+        new_height = int(original_height * scale)
+
+        return new_width, new_height, int(scale * 100)
+
+    def cache_settings(self):
+        """
+        Return every setting that changes the produced WebP, for result cache keys.
+
+        Returns:
+            dict: Encoding settings
+        """
+        return {
+            'version': 3,
+            'max_output_size_kb': self.max_output_size_kb,
+            'webp_alpha_quality': self.webp_alpha_quality,
+            'min_quality': self.min_quality,
+            'quality_tolerance': self.quality_tolerance,
+            'quality_doubling_step': self.quality_doubling_step,
+            'prediction_headroom': self.prediction_headroom,
+            'min_bytes_per_pixel': self.min_bytes_per_pixel,
+            'search_method': self.search_method,
+            # The calibrated ratio only steers two-phase searches; rounded so the
+            # moving average does not change the key after every conversion
+            'effort_ratio': round(self.effort_ratio, 2) if self.search_method is not None else None,
+            'effort_safety_margin': self.effort_safety_margin if self.search_method is not None else None,
+            'auto_lossless': self.auto_lossless,
+            'lossless_method': self.lossless_method,
+            'analysis_size': self.analysis_size,
+            'palette_max_colours': self.palette_max_colours,
+            'min_ssim': self.min_ssim,
+            'frame_merge_threshold': self.frame_merge_threshold,
+            'max_animation_frames': self.max_animation_frames,
+            'max_animation_pixels': self.max_animation_pixels,
+            'animation_method': self.animation_method,
+            'metadata': 'preserve',  # EXIF/GPS, ICC and XMP are always kept
+        }
+
+    def plan_compression(self, width, height, source_size_mb, max_kb=None):
+        """
+        Choose the starting quality and resize scale from header information only,
+        so the decoder can be told how much resolution is actually needed.
+
+        Args:
+            width: Source image width
+            height: Source image height
+            source_size_mb: Source file size in MB
+            max_kb: Size budget in KB (default: max_output_size_kb)
+
+        Returns:
+            tuple: (quality, scale_percentage)
+        """
+        # Determine initial quality based on source file size
+        # Higher quality for 150KB target vs 99KB
+        if source_size_mb > 100:
+            quality = 45  # Better quality for huge files
+            resize_needed = True
+        elif source_size_mb > 50:
+            quality = 55
+            resize_needed = True
+        elif source_size_mb > 10:
+            quality = 65
+            resize_needed = True
+        else:
+            quality = 70  # Higher starting quality for small files
+            resize_needed = False
+
+        scale = 1.0
+        if resize_needed:
+            scale = self.calculate_resize_dimensions(width, height, max_kb or self.max_output_size_kb)[2] / 100
+
+        scale = min(scale, self.max_scale(width, height, max_kb))
+        return quality, max(min(int(scale * 100), 100), 1)
+
+    def max_scale(self, width, height, max_kb=None):
+        """
+        Largest useful scale: more pixels than the budget can hold even at minimum
+        quality are never kept, and WebP cannot store more than WEBP_MAX_DIMENSION
+        pixels per side.
+
+        Args:
+            width: Source image width
+            height: Source image height
+            max_kb: Size budget in KB (default: max_output_size_kb)
+
+        Returns:
+            float: Maximum scale (at most 1.0)
+        """
+        scale = 1.0
+        max_pixels = (max_kb or self.max_output_size_kb) * 1024 / self.min_bytes_per_pixel
+        if width * height > max_pixels:
+            scale = math.sqrt(max_pixels / (width * height))
+        return min(scale, WEBP_MAX_DIMENSION / max(width, height))
+
+    def apply_reduced_decode(self, img, scale_percentage):
+        """
+        Let the decoder skip resolution that a planned downscale would throw away.
+        JPEG sources are decoded with the smallest DCT scaling step (1/2, 1/4 or
+        1/8) that still covers the planned size. Must be called before the image
+        data is loaded.
+
+        Args:
+            img: Opened, not yet loaded PIL Image
+            scale_percentage: Planned output scale (see plan_compression())
+
+        Returns:
+            bool: True if a reduced decode was configured
+        """
+        if scale_percentage >= 100 or img.format != 'JPEG':
+            return False
+
+        width, height = img.size
+        target = (max(width * scale_percentage // 100, 1), max(height * scale_percentage // 100, 1))
+        img.draft(None, target)
+        return img.size != (width, height)
+
+    def open_source(self, source):
+        """
+        Open a source image. TIFFs beyond Pillow's decompression-bomb limit are
+        still opened when they will be read band by band (see streamed_size()),
+        because their memory use then no longer grows with the pixel count.
+
+        Args:
+            source: Path or binary file object
+
+        Returns:
+            Image: Opened, not yet loaded PIL Image
+
+        Raises:
+            Image.DecompressionBombError: For oversized images that cannot be streamed
+        """
+        try:
+            return Image.open(source)
+        except Image.DecompressionBombError:
+            if hasattr(source, 'seek'):
+                source.seek(0)
+            try:
+                img = TiffImagePlugin.TiffImageFile(source)
+            except Exception:
+                img = None
+            if img is not None and self.streamed_size(img) is not None:
+                return img
+            if img is not None:
+                img.close()
+            raise
+
+    def streamed_size(self, img):
+        """
+        Size a TIFF is decoded to band by band, or None to decode it normally.
+        Streaming is used when the largest useful output scale (see max_scale())
+        drops at least half of each side, so the full image is never needed.
+
+        Args:
+            img: Opened, not yet loaded PIL Image
+
+        Returns:
+            tuple: (width, height), or None
+        """
+        if not TiffBandReader.supports(img):
+            return None
+        width, height = img.size
+        scale = self.max_scale(width, height)
+        if scale > 0.5:
+            return None
+        return max(int(width * scale), 1), max(int(height * scale), 1)
+
+    def stream_decode(self, img, size):
+        """
+        Decode a TIFF band by band straight into a downscaled image. Each band is
+        reduced by an integer factor (box filter) as soon as it is decoded, and
+        one LANCZOS pass brings the result to size, so peak memory is one band
+        plus the reduced image instead of the full image.
+
+        Args:
+            img: Opened, not yet loaded TIFF (see streamed_size())
+            size: Target (width, height)
+
+        Returns:
+            Image: RGB or RGBA image of the given size
+        """
+        width, height = img.size
+        factor = max(min(width // size[0], height // size[1]), 1)
+        reader = TiffBandReader(img)
+        reduced = None
+        pending = None  # Rows left over from the previous band (fewer than factor)
+        top = 0
+        for band in reader.bands():
+            if band.mode in ('LA', 'P', 'PA'):
+                band = band.convert('RGBA')
+            elif band.mode not in ('RGB', 'RGBA'):
+                band = band.convert('RGB')
+            if pending is not None:
+                merged = Image.new(band.mode, (width, pending.height + band.height))
+                merged.paste(pending, (0, 0))
+                merged.paste(band, (0, pending.height))
+                band = merged
+            if reduced is None:
+                reduced = Image.new(band.mode, (-(-width // factor), -(-height // factor)))
+
+            usable = band.height // factor * factor
+            if usable:
+                part = band if usable == band.height else band.crop((0, 0, width, usable))
+                reduced.paste(part.reduce(factor), (0, top))
+                top += usable // factor
+            pending = band.crop((0, usable, width, band.height)) if usable < band.height else None
+
+        if pending is not None:
+            reduced.paste(pending.reduce(factor), (0, top))
+        if reduced.size != tuple(size):
+            reduced = reduced.resize(size, Image.Resampling.LANCZOS)
+        return reduced
+
+    def estimate_memory(self, image_path):
+        """
+        Estimate the peak memory of converting an image from its header only
+        (no pixel data is decoded): the decoded source at the resolution the
+        reduced decode keeps, an RGB/RGBA copy if the mode needs converting, and
+        the resized image plus encoder buffers at the largest output scale.
+        TIFFs decoded band by band only need a few bands and the reduced image;
+        animations keep every frame (up to the animation limits).
+
+        Args:
+            image_path: Path to the source image file
+
+        Returns:
+            int: Estimated bytes (0 if the header cannot be read - such files fail fast)
+        """
+        try:
+            source_size_mb = Path(image_path).stat().st_size / (1024 * 1024)
+            with self.open_source(image_path) as img:
+                width, height = img.size
+                original_pixels = width * height
+                max_scale = self.max_scale(width, height)
+                streamed = self.streamed_size(img)
+                if streamed is None:
+                    self.apply_reduced_decode(img, self.plan_compression(width, height, source_size_mb)[1])
+                else:
+                    band_pixels = width * TiffBandReader(img).band_rows
+                mode = img.mode
+                decoded_pixels = img.size[0] * img.size[1]
+                frames = img.n_frames if getattr(img, 'is_animated', False) else 1
+                if AnimationFrames.too_large(img, self.max_animation_frames, self.max_animation_pixels):
+                    frames = 1  # Converted as its first frame
+        except Exception:
+            return 0
+
+        if streamed is not None:
+            # A band, its merged and converted copies, the reduced image and the result
+            factor = max(min(width // streamed[0], height // streamed[1]), 1)
+            reduced_pixels = -(-width // factor) * -(-height // factor)
+            output_pixels = streamed[0] * streamed[1]
+            return int((band_pixels * 3 + reduced_pixels + output_pixels) * 4 + output_pixels * 4 * 3)
+
+        # Pillow stores single-band 8-bit images with 1 byte per pixel, the rest in 4
+        bytes_per_pixel = {'1': 1, 'L': 1, 'P': 1, 'I;16': 2}.get(mode, 4)
+        estimate = decoded_pixels * bytes_per_pixel
+        if mode not in ('RGB', 'RGBA'):
+            estimate += decoded_pixels * 4
+        output_pixels = min(original_pixels * max_scale * max_scale, decoded_pixels)
+        if frames > 1:
+            # Every frame is kept as RGBA, plus the resized frames of an encode attempt
+            return int((decoded_pixels + output_pixels) * frames * 4 + output_pixels * 4 * 3)
+        return int(estimate + output_pixels * 4 * 3)
+
+    def encode_webp(self, img, quality, metadata, method=6, encoding='lossy'):
+        """
+        Encode an image to WebP in memory with the standard compression settings.
+        Metadata is inserted as container chunks, so the returned size is exact.
+
+        Args:
+            img: PIL Image object or AnimationFrames (encoded as an animated WebP)
+            quality: WebP quality (0-100); compression effort for the lossless encodings
+            metadata: Dict from extract_metadata()
+            method: Encoder effort 0-6 (default: 6, best compression)
+            encoding: One of ENCODINGS (default: 'lossy')
+
+        Returns:
+            bytes: Encoded WebP file
+        """
+        buffer = io.BytesIO()
+        if isinstance(img, AnimationFrames):
+            # libwebp stores each frame's changed rectangle only and picks lossy or
+            # lossless per frame (allow_mixed), which suits palette-based GIF frames
+            img.frames[0].save(
+                buffer,
+                'WEBP',
+                save_all=True,
+                append_images=img.frames[1:],
+                duration=img.durations,
+                loop=img.loop,
+                background=(0, 0, 0, 0),
+                quality=quality,
+                alpha_quality=max(quality - 5, 60),
+                method=method,
+                exact=False,
+                lossless=False,
+                allow_mixed=True,
+                minimize_size=True,
+                kmin=3,
+                kmax=5
+            )
+        elif encoding == 'lossy':
+            img.save(
+                buffer,
+                'WEBP',
+                quality=quality,
+                alpha_quality=max(quality - 5, 60),  # Higher alpha quality
+                method=method,
+                exact=False,
+                lossless=False,
+                minimize_size=True,
+                kmin=3,
+                kmax=5
+            )
+        else:
+            if encoding == 'near_lossless':
+                # Round colour channels to multiples of 4, keep alpha exact
+                identity = list(range(256)) if img.mode == 'RGBA' else []
+                img = img.point(NEAR_LOSSLESS_LUT * 3 + identity)
+            elif encoding == 'palette':
+                # FASTOCTREE is the only quantizer that keeps an alpha channel
+                img = img.quantize(256, Image.Quantize.FASTOCTREE if img.mode == 'RGBA' else Image.Quantize.MEDIANCUT,
+                                   dither=Image.Dither.NONE)
+            img.save(buffer, 'WEBP', quality=quality, method=method, exact=False, lossless=True)
+        return embed_webp_metadata(buffer.getvalue(), **metadata)  # ALWAYS preserve metadata!
+
+    def analyse_content(self, img):
+        """
+        Classify an image as photo or graphic from NumPy statistics on a
+        nearest-neighbour sample (so no colours are blended): distinct colours,
+        alpha use, the share of flat areas and the density of hard edges.
+        Screenshots, UI and line art have few colours or large flat areas with
+        sharp edges; photos have neither.
+
+        Args:
+            img: Decoded RGB/RGBA PIL Image
+
+        Returns:
+            dict: 'kind' ('photo' or 'graphic'), 'colours', 'alpha', 'flat', 'edges'
+                  and 'encodings' (the ENCODINGS worth trying), or None without NumPy
+        """
+        if np is None:
+            return None
+
+        sample = img
+        if max(img.size) > self.analysis_size:
+            factor = self.analysis_size / max(img.size)
+            sample = img.resize((max(round(img.width * factor), 1), max(round(img.height * factor), 1)),
+                                Image.Resampling.NEAREST)
+        if sample.mode not in ('RGB', 'RGBA'):
+            sample = sample.convert('RGBA' if 'A' in sample.getbands() else 'RGB')
+
+        pixels = np.asarray(sample, dtype=np.uint32)
+        packed = (pixels[..., 0] << 16) | (pixels[..., 1] << 8) | pixels[..., 2]
+        alpha = 0.0
+        if sample.mode == 'RGBA':
+            packed |= pixels[..., 3] << 24
+            alpha = float(np.mean(pixels[..., 3] < 255))
+        colours = int(np.unique(packed).size)
+
+        # Luma gradient: exactly flat neighbours vs hard (text/UI) edges
+        luma = ((pixels[..., 0] * 299 + pixels[..., 1] * 587 + pixels[..., 2] * 114) // 1000).astype(np.int32)
+        gradient = np.abs(np.diff(luma, axis=1))[:-1, :] + np.abs(np.diff(luma, axis=0))[:, :-1]
+        flat = float(np.mean(gradient == 0)) if gradient.size else 1.0
+        edges = float(np.mean(gradient > 64)) if gradient.size else 0.0
+
+        graphic = colours <= 256 or flat >= 0.5 or (edges >= 0.05 and colours <= self.palette_max_colours)
+        encodings = ['lossy']
+        if graphic:
+            encodings.append('lossless')
+            if colours > 256:
+                encodings.append('near_lossless')
+                if colours <= self.palette_max_colours:
+                    encodings.append('palette')
+        return {
+            'kind': 'graphic' if graphic else 'photo',
+            'colours': colours,
+            'alpha': round(alpha, 4),
+            'flat': round(flat, 4),
+            'edges': round(edges, 4),
+            'encodings': encodings,
+        }
+
+    def search_quality(self, img, metadata, max_size_bytes, start_quality, max_attempts,
+                       method=6, size_ratio=1.0):
+        """
+        Find the highest quality whose encode fits in max_size_bytes.
+
+        Encodes only into memory. The first probe uses start_quality; after that the
+        next quality is interpolated on the log(size)/quality curve between the best
+        fitting and the smallest oversized encode seen so far, which usually brackets
+        the answer in 2-4 encodes instead of stepping down 5-10 points at a time.
+
+        Args:
+            img: PIL Image object (already resized)
+            metadata: Dict from extract_metadata()
+            max_size_bytes: Size budget in bytes
+            start_quality: First quality to try
+            max_attempts: Maximum number of encodes
+            method: Encoder effort used for the trial encodes
+            size_ratio: Factor converting a trial size into the expected final size
+                        (1.0 when trials are encoded with the final settings)
+
+        Returns:
+            tuple: (best_quality, best_data, smallest_quality, smallest_data, attempts)
+                   where best_quality and best_data are None if nothing fitted
+        """
+        fit_quality, fit_data = None, None   # Highest quality known to fit
+        over_quality, over_size = None, None  # Lowest quality known to be too large
+        smallest_quality, smallest_data = None, None
+        quality = max(start_quality, self.min_quality)
+        attempts = 0
+
+        while attempts < max_attempts:
+            data = self.encode_webp(img, quality, metadata, method)
+            attempts += 1
+            size = len(data) * size_ratio
+
+            if smallest_data is None or len(data) < len(smallest_data):
+                smallest_quality, smallest_data = quality, data
+
+            if size <= max_size_bytes:
+                fit_quality, fit_data = quality, data
+            else:
+                over_quality, over_size = quality, size
+
+            if over_quality is None:
+                # Start quality already fits
+                break
+
+            if fit_quality is None:
+                if quality <= self.min_quality:
+                    # Does not fit even at minimum quality
+                    break
+                # Extrapolate: size roughly doubles every quality_doubling_step points
+                drop = self.quality_doubling_step * math.log2(over_size / max_size_bytes)
+                next_quality = quality - max(int(math.ceil(drop)), 1)
+                if next_quality < self.min_quality - self.quality_doubling_step:
+                    # Far out of reach at this scale - let the caller resize instead
+                    break
+                quality = max(next_quality, self.min_quality)
+                continue
+
+            if over_quality - fit_quality <= self.quality_tolerance:
+                break
+
+            # Interpolate between the bracketing encodes on the log-size curve
+            fit_size = len(fit_data) * size_ratio
+            span = math.log(over_size) - math.log(fit_size)
+            position = (math.log(max_size_bytes) - math.log(fit_size)) / span if span > 0 else 0.5
+            next_quality = fit_quality + int(round(position * (over_quality - fit_quality)))
+            quality = min(max(next_quality, fit_quality + 1), over_quality - 1)
+
+        return fit_quality, fit_data, smallest_quality, smallest_data, attempts
+
+    def search_ssim_floor(self, img, metadata, max_quality, max_data, reference):
+        """
+        Find the lowest quality whose encode still meets min_ssim. SSIM rises with
+        quality, so the floor is bisected between min_quality and max_quality
+        (the highest quality that fits the size budget).
+
+        Args:
+            img: PIL Image the encodes are made from
+            metadata: Dict from extract_metadata()
+            max_quality: Highest quality that fits the size budget
+            max_data: Encode at max_quality
+            reference: _ssim_luma() of img
+
+        Returns:
+            tuple: (quality, data, ssim, attempts) - max_quality and max_data when
+                   even they miss the floor
+        """
+        score = self.ssim_score(reference, max_data)
+        best = (max_quality, max_data, score)
+        if score < self.min_ssim:
+            return best + (0,)
+
+        low, high = self.min_quality - 1, max_quality  # low is assumed to miss the floor
+        attempts = 0
+        while high - low > self.quality_tolerance:
+            quality = (low + high) // 2
+            data = self.encode_webp(img, quality, metadata)
+            attempts += 1
+            score = self.ssim_score(reference, data)
+            if score >= self.min_ssim:
+                high, best = quality, (quality, data, score)
+            else:
+                low = quality
+        return best + (attempts,)
+
+    @staticmethod
+    def ssim_score(reference, data):
+        """
+        SSIM of an encoded WebP against the luma of the image it was made from.
+
+        Args:
+            reference: _ssim_luma() of the encoded image
+            data: WebP file bytes
+
+        Returns:
+            float: Mean SSIM
+        """
+        with Image.open(io.BytesIO(data)) as decoded:
+            return structural_similarity(reference, _ssim_luma(decoded))
+
+    def optimize_webp_size(self, img, output_path, metadata, source_size_mb, original_size=None,
+                           features=None):
+        """
+        Optimize WebP to ensure output is under 150KB while ALWAYS preserving metadata,
+        and write the result to output_path (see encode_within_budget()).
+
+        Args:
+            img: PIL Image object
+            output_path: Path to save the WebP file
+            metadata: Dict from extract_metadata() (ALWAYS included)
+            source_size_mb: Source file size in MB
+            original_size: (width, height) of the source when img was decoded at
+                           reduced resolution (default: img.size)
+            features: QualityPredictor features (optional)
+
+        Returns:
+            dict: Compression statistics ('timings' holds seconds spent per stage)
+        """
+        output_data, stats = self.encode_within_budget(img, metadata, source_size_mb, original_size, features)
+        started = time.perf_counter()
+        output_path.write_bytes(output_data)
+        stats['timings']['write'] = time.perf_counter() - started
+        return stats
+
+    def encode_within_budget(self, img, metadata, source_size_mb, original_size=None, features=None,
+                             pyramid=None, max_kb=None, content=None):
+        """
+        Encode WebP under 150KB while ALWAYS preserving metadata. Uses an
+        in-memory quality search with dynamic resize; nothing is written to disk.
+
+        Strategy:
+        1. Start with higher quality for 150KB target (better than 99KB)
+        2. Resize image if needed
+        3. Search the highest quality that fits under 150KB (interpolated, in memory)
+        4. If even minimum quality is too large, resize further and search again
+        5. For graphics, encode lossless/near-lossless/palette variants concurrently
+           (again at every resize) and keep the smallest encode that fits at the
+           largest resolution
+        6. With min_ssim set, lower the quality to the smallest encode that still
+           meets the SSIM floor (the budget stays the ceiling)
+        7. ALWAYS preserve metadata (EXIF/ICC/XMP included in all attempts)
+
+        Args:
+            img: PIL Image object
+            metadata: Dict from extract_metadata() (ALWAYS included)
+            source_size_mb: Source file size in MB
+            original_size: (width, height) of the source when img was decoded at
+                           reduced resolution (default: img.size)
+            features: QualityPredictor features; when given and the predictor has
+                      enough records, the learned starting quality/scale is used
+            pyramid: ResizePyramid to take resized versions from, shared between
+                     renditions of the same source (default: a new one over img)
+            max_kb: Size budget in KB (default: max_output_size_kb)
+            content: Result of analyse_content() for img (default: analysed here
+                     when auto_lossless is enabled)
+
+        Returns:
+            tuple: (WebP file bytes, compression statistics) - 'timings' in the
+                   statistics holds seconds spent per stage
+        """
+        if isinstance(img, AnimationFrames):
+            return self.encode_animation_within_budget(img, metadata, source_size_mb, max_kb)
+
+        max_kb = max_kb or self.max_output_size_kb
+        max_size_bytes = max_kb * 1024
+        original_width, original_height = original_size or img.size
+
+        quality, resize_scale = self.plan_compression(original_width, original_height, source_size_mb, max_kb)
+
+        prediction = self.predictor.predict(features) if self.predictor and features else None
+        if prediction is not None:
+            # Never beyond what the budget can hold or the (reduced) decode kept
+            max_scale = max(int(min(self.max_scale(original_width, original_height, max_kb),
+                                    img.width / original_width) * 100), 1)
+            # Start one step above the learned values: the search only moves down from
+            # a start that is too large, so starting at the prediction itself would let
+            # the learned quality and scale drift lower with every conversion
+            quality = min(max(prediction[0] + self.prediction_headroom, self.min_quality), 95)
+            resize_scale = min(max(int(round(prediction[1] / 0.85)), 1), max_scale, 100)
+            self.log(f"    🧠 Predicted start: Quality={quality}, Scale={resize_scale}% "
+                     f"(learned {prediction[0]}, {prediction[1]}%)")
+        resize_needed = resize_scale < 100
+
+        # Resize image if source is very large; every resize reuses the nearest larger level
+        working_img = img
+        pyramid = pyramid or ResizePyramid(img)
+        timings = {'resize': 0.0, 'encode': 0.0}
+
+        if resize_needed:
+            new_width = max(original_width * resize_scale // 100, 1)
+            new_height = max(original_height * resize_scale // 100, 1)
+            started = time.perf_counter()
+            working_img = pyramid.resize((new_width, new_height))
+            timings['resize'] += time.perf_counter() - started
+            self.log(f"    ⚙️  Resizing: {original_width}x{original_height} → {new_width}x{new_height} ({resize_scale}%)")
+
+        # Lossless variants run in threads next to the lossy search (libwebp releases the GIL).
+        # They encode a copy: Image.save() keeps its options on the image object. Every
+        # resize of the lossy search starts a new round until a round has an encode that fits.
+        if content is None and self.auto_lossless:
+            content = self.analyse_content(img)
+        variant_rounds = []  # (image, resize_scale, {encoding: future}), largest first
+        encodings = content['encodings'][1:] if content and self.auto_lossless else []
+        variant_pool = ThreadPoolExecutor(max_workers=len(encodings)) if encodings else None
+
+        def submit_variants():
+            if variant_pool is None:
+                return
+            if variant_rounds and any(len(future.result()) <= max_size_bytes
+                                      for future in variant_rounds[-1][2].values()):
+                return  # A larger resolution already fits
+            variant_img = working_img.copy()
+            variant_rounds.append((variant_img, resize_scale, {
+                encoding: variant_pool.submit(self.encode_webp, variant_img, 100, metadata, self.lossless_method,
+                                              encoding)
+                for encoding in encodings
+            }))
+
+        submit_variants()
+
+        # Quality search to achieve target size, all encodes kept in memory
+        attempts = 0
+        max_attempts = 10
+        best_data = None
+        smallest = None  # (data, quality, resize_scale, image) of the smallest final-effort encode
+
+        # Two-phase effort: trial encodes at search_method, sizes corrected by the
+        # calibrated ratio, and only the chosen quality/scale encoded at method 6
+        two_phase = self.search_method is not None
+        search_method = self.search_method if two_phase else 6
+        size_ratio = self.effort_ratio * (1 + self.effort_safety_margin) if two_phase else 1.0
+        predicted_size = search_size = None
+
+        while attempts < max_attempts:
+            started = time.perf_counter()
+            found_quality, found_data, smallest_quality, scale_smallest, used = self.search_quality(
+                working_img, metadata, max_size_bytes, quality, max_attempts - attempts,
+                search_method, size_ratio
+            )
+            timings['encode'] += time.perf_counter() - started
+            attempts += used
+
+            if not two_phase and (smallest is None or len(scale_smallest) < len(smallest[0])):
+                smallest = (scale_smallest, smallest_quality, resize_scale, working_img)
+
+            if found_data is not None and two_phase:
+                predicted_size = len(found_data) * size_ratio
+                search_size = len(found_data)
+                started = time.perf_counter()
+                found_data = self.encode_webp(working_img, found_quality, metadata)
+                timings['encode'] += time.perf_counter() - started
+                attempts += 1
+
+                if len(found_data) > max_size_bytes:
+                    # Prediction too optimistic for this image - search again with its own ratio
+                    if smallest is None or len(found_data) < len(smallest[0]):
+                        smallest = (found_data, found_quality, resize_scale, working_img)
+                    size_ratio = len(found_data) / search_size * (1 + self.effort_safety_margin)
+                    found_data = None
+                    if found_quality > self.min_quality:
+                        quality = found_quality - 1
+                        continue
+
+            if found_data is not None:
+                # Success!
+                quality, best_data = found_quality, found_data
+                break
+
+            quality = self.min_quality
+
+            if attempts >= max_attempts or min(working_img.size) <= 1:
+                break
+
+            if not resize_needed:
+                # If quality reduction isn't enough, try resizing
+                new_width, new_height, resize_scale = self.calculate_resize_dimensions(
+                    original_width, original_height, max_kb
+                )
+                started = time.perf_counter()
+                working_img = pyramid.resize((new_width, new_height))
+                timings['resize'] += time.perf_counter() - started
+                self.log(f"    ⚙️  Resizing: {original_width}x{original_height} → {new_width}x{new_height} ({resize_scale}%)")
+                resize_needed = True
+                quality = 60  # Reset to higher quality after resize
+                submit_variants()
+            else:
+                # Quality is at minimum and still too large, resize more
+                resize_scale = int(resize_scale * 0.85)  # Less aggressive resize
+                new_width = max(int(original_width * resize_scale / 100), 1)
+                new_height = max(int(original_height * resize_scale / 100), 1)
+                started = time.perf_counter()
+                working_img = pyramid.resize((new_width, new_height))
+                timings['resize'] += time.perf_counter() - started
+                self.log(f"    ⚙️  Further resizing: → {new_width}x{new_height} ({resize_scale}%)")
+                quality = 50  # Reset quality after additional resize
+                submit_variants()
+
+        if best_data is None and smallest is None:
+            # Two-phase search never reached a final encode - encode the smallest setting
+            started = time.perf_counter()
+            smallest = (self.encode_webp(working_img, self.min_quality, metadata), self.min_quality, resize_scale,
+                        working_img)
+            timings['encode'] += time.perf_counter() - started
+
+        # Keep only the chosen encode; if the target could not be reached,
+        # keep the smallest encode produced. Metadata is still preserved!
+        if best_data is None:
+            # Report the quality and scale of the encode that is actually kept
+            output_data, quality, resize_scale, working_img = smallest
+        else:
+            output_data = best_data
+        encoding = 'lossy'
+        lowered = False  # Quality lowered below the budget's best to the perceptual floor
+
+        fitting = []
+        if variant_pool is not None:
+            started = time.perf_counter()
+            for variant_img, variant_scale, variants in variant_rounds:
+                fitting = [(len(data), name, data) for name, data in
+                           ((name, future.result()) for name, future in variants.items())
+                           if len(data) <= max_size_bytes]
+                attempts += len(variants)
+                if fitting:
+                    break
+            variant_pool.shutdown(wait=False)
+            timings['encode'] += time.perf_counter() - started
+
+        score = budget_score = None
+        if self.min_ssim and np is not None and (best_data is not None or fitting):
+            # Perceptual floor: the smallest encode that still meets min_ssim wins,
+            # larger resolutions first as with the budget-only choice below
+            started = time.perf_counter()
+            meeting = []  # (-pixels, size, encoding, data, quality, ssim)
+            if best_data is not None:
+                reference = _ssim_luma(working_img)
+                floor_quality, floor_data, floor_score, used = self.search_ssim_floor(
+                    working_img, metadata, quality, best_data, reference
+                )
+                attempts += used
+                budget_score = floor_score
+                if floor_score >= self.min_ssim:
+                    meeting.append((-working_img.width * working_img.height, len(floor_data), 'lossy', floor_data,
+                                    floor_quality, floor_score))
+            if fitting:
+                if best_data is None or variant_img.size != working_img.size:
+                    reference = _ssim_luma(variant_img)
+                for size, name, data in fitting:
+                    variant_score = 1.0 if name == 'lossless' else self.ssim_score(reference, data)
+                    if variant_score >= self.min_ssim:
+                        meeting.append((-variant_img.width * variant_img.height, size, name, data, 100,
+                                        variant_score))
+            timings['ssim'] = time.perf_counter() - started
+            if meeting:
+                _, _, encoding, output_data, floor_quality, score = min(meeting)
+                if encoding == 'lossy':
+                    lowered = floor_quality != quality
+                    quality, best_data = floor_quality, output_data
+                else:
+                    working_img, resize_scale, quality, best_data = variant_img, variant_scale, 100, output_data
+
+        # A variant wins over a lossy encode that had to be downscaled further,
+        # and over a same-size lossy encode when it is smaller
+        if score is None and fitting and (best_data is None or variant_img.size != working_img.size
+                                          or min(fitting)[0] < len(best_data)):
+            _, encoding, output_data = min(fitting)
+            working_img, resize_scale, quality, best_data = variant_img, variant_scale, 100, output_data
+
+        stats = {
+            'quality': quality,
+            'resize_scale': resize_scale,
+            'attempts': attempts,
+            'final_size_kb': len(output_data) / 1024,
+            'metadata_preserved': True,
+            'dimensions': list(working_img.size),
+            'encoding': encoding,
+            'timings': timings
+        }
+        if content:
+            stats['content'] = content['kind']
+        if score is not None:
+            stats['ssim'] = round(score, 4)
+        elif budget_score is not None and encoding == 'lossy':
+            stats['ssim'] = round(budget_score, 4)  # Floor not reachable within the budget
+        # Only budget-driven lossy choices teach the predictor and the effort calibration
+        budget_choice = best_data is not None and encoding == 'lossy' and not lowered
+        if budget_choice:
+            stats['output_pixels'] = working_img.width * working_img.height
+        if two_phase and budget_choice:
+            stats['search_method'] = search_method
+            stats['predicted_size_kb'] = predicted_size / 1024
+            stats['search_size_kb'] = search_size / 1024
+        return output_data, stats
+
+    def encode_animation_within_budget(self, animation, metadata, source_size_mb, max_kb=None):
+        """
+        Encode an animated WebP under the size budget. The quality search runs over
+        the whole animation (every trial encodes all frames), and all frames are
+        downscaled together when even the minimum quality does not fit.
+
+        Args:
+            animation: AnimationFrames
+            metadata: Dict from extract_metadata() (ALWAYS included)
+            source_size_mb: Source file size in MB
+            max_kb: Size budget in KB (default: max_output_size_kb)
+
+        Returns:
+            tuple: (WebP file bytes, compression statistics)
+        """
+        max_kb = max_kb or self.max_output_size_kb
+        max_size_bytes = max_kb * 1024
+        width, height = animation.size
+        quality, resize_scale = self.plan_compression(width, height, source_size_mb, max_kb)
+        timings = {'resize': 0.0, 'encode': 0.0}
+
+        working = animation
+        if resize_scale < 100:
+            started = time.perf_counter()
+            working = animation.resize((max(width * resize_scale // 100, 1), max(height * resize_scale // 100, 1)))
+            timings['resize'] += time.perf_counter() - started
+            self.log(f"    ⚙️  Resizing animation: {width}x{height} → {working.width}x{working.height} ({resize_scale}%)")
+
+        attempts = 0
+        max_attempts = 10
+        best_data = smallest = None
+        while attempts < max_attempts:
+            started = time.perf_counter()
+            found_quality, found_data, smallest_quality, scale_smallest, used = self.search_quality(
+                working, metadata, max_size_bytes, quality, max_attempts - attempts, self.animation_method
+            )
+            timings['encode'] += time.perf_counter() - started
+            attempts += used
+
+            if smallest is None or len(scale_smallest) < len(smallest[0]):
+                smallest = (scale_smallest, smallest_quality, resize_scale, working)
+            if found_data is not None:
+                quality, best_data = found_quality, found_data
+                break
+
+            quality = self.min_quality
+            if attempts >= max_attempts or min(working.size) <= 1:
+                break
+
+            # Resize every frame from the decoded animation, not from the previous attempt
+            resize_scale = int(resize_scale * 0.85)
+            started = time.perf_counter()
+            working = animation.resize((max(width * resize_scale // 100, 1), max(height * resize_scale // 100, 1)))
+            timings['resize'] += time.perf_counter() - started
+            self.log(f"    ⚙️  Further resizing animation: → {working.width}x{working.height} ({resize_scale}%)")
+            quality = 60  # Reset to higher quality after resize
+
+        if best_data is None:
+            # Report the quality and scale of the encode that is actually kept
+            output_data, quality, resize_scale, working = smallest
+        else:
+            output_data = best_data
+        stats = {
+            'quality': quality,
+            'resize_scale': resize_scale,
+            'attempts': attempts,
+            'final_size_kb': len(output_data) / 1024,
+            'metadata_preserved': True,
+            'dimensions': list(working.size),
+            'encoding': 'animated',
+            'frames': len(working.frames),
+            'source_frames': animation.source_frames,
+            'loop': animation.loop,
+            'timings': timings
+        }
+        return output_data, stats
+
+    def convert_image_to_webp(self, image_path):
+        """
+        Convert a single image to WebP format with balanced compression.
+        Ensures output file is under 150KB while ALWAYS preserving metadata.
+
+        Args:
+            image_path: Path to the source image file
+
+        Returns:
+            bool: True if conversion successful, False otherwise
+        """
+        success, stats = self.convert_image(image_path)
+        self.record_result(image_path, success, stats)
+        return success
+
+    def convert_image(self, image_path):
+        """
+        Convert a single image like convert_image_to_webp() and also return its
+        compression statistics. Does not update converter-wide state, so it is
+        safe to run in worker threads and processes.
+
+        Args:
+            image_path: Path to the source image file
+
+        Returns:
+            tuple: (success, stats) - for a failed conversion stats only holds
+                   'error', 'source_size' and 'timings'
+        """
+        job = self.new_job(image_path)
+        try:
+            self.read_source(job)
+            self.decode_source(job)
+            self.encode_output(job)
+            self.commit_output(job)
+            return True, job['stats']
+        except Exception as e:
+            return False, self.failed_result(job, e)
+
+    def convert_bytes(self, data, name="image"):
+        """
+        Convert an image held in memory, without touching the source/result
+        folders. Like convert_image() it does not update converter-wide state.
+
+        Args:
+            data: Image file bytes or a binary file-like object
+            name: Name used in log lines and error messages
+
+        Returns:
+            tuple: (webp_bytes, stats) - stats as returned by optimize_webp_size(),
+                   plus 'source_size', 'timings' and (with a result cache) 'cache_hit'
+
+        Raises:
+            PIL.UnidentifiedImageError: If the data is not a readable image
+        """
+        if not isinstance(data, bytes):
+            data = data.read()
+
+        job = self.new_job(Path(name))
+        job['primary_only'] = True  # Renditions are written by folder conversions only
+        job['source'] = data
+        job['source_size'] = len(data)
+        job['cache_key'] = job['cached'] = None
+        if self.result_cache is not None:
+            stage_started = time.perf_counter()
+            job['cache_key'] = self.result_cache.make_key(data, self.cache_settings())
+            job['cached'] = self.result_cache.get(job['cache_key'])
+            job['timings']['hash'] = time.perf_counter() - stage_started
+
+        if job['cached'] is not None:
+            output_data, stats = job['cached']
+            stats['cache_hit'] = True
+        else:
+            try:
+                self.decode_source(job)
+                self.encode_output(job)
+            finally:
+                self.release_image(job)
+            output_data, stats = job['output_data'], job['stats']
+            if job['cache_key'] is not None:
+                self.result_cache.put(job['cache_key'], output_data, stats)
+                stats['cache_hit'] = False
+                stats['cache_bytes'] = len(output_data)
+
+        stats['timings'] = dict(job['timings'], total=time.perf_counter() - job['started'])
+        stats['source_size'] = len(data)
+        return output_data, stats
+
+    # The conversion of one image runs in four stages that pass a job dict along:
+    # read_source -> decode_source -> encode_output -> commit_output.
+    # convert_image() runs them back to back, run_pipeline() in separate threads.
+
+    def new_job(self, image_path):
+        """
+        Create the job dict the conversion stages work on.
+
+        Args:
+            image_path: Path to the source image file
+
+        Returns:
+            dict: Job state
+        """
+        return {
+            'path': image_path,
+            'started': time.perf_counter(),
+            'timings': {},
+            'source_size': None,
+            'lines': [],
+        }
+
+    def read_source(self, job, prefetch=False):
+        """
+        Read stage: claim the source (when sharing the folder with other instances),
+        stat it, pick the output path and look up the result cache.
+
+        Args:
+            job: Job from new_job()
+            prefetch: Read the whole source file into memory, so the decode stage
+                      never waits on (network) storage
+
+        Raises:
+            ClaimedElsewhere: If another instance is converting the file
+        """
+        image_path = job['path']
+        name = Path(image_path.name)
+        if self.claimer is not None and image_path.parent == self.claimer.folder:
+            name = Path(self.claimer.original_name(name.name))  # Claimed by the main process
+        output_path = self.output_folder_for(image_path) / (name.stem + ".webp")
+        if self.claimer is not None and image_path.parent != self.claimer.folder:
+            # Not yet claimed by the main process (see submit_conversion())
+            claimed_path = self.claimer.claim(image_path)
+            if claimed_path is None:
+                raise ClaimedElsewhere(image_path.name)
+            job['path'] = image_path = claimed_path
+        stat_result = image_path.stat()
+        job['source_size'] = source_size = stat_result.st_size
+        source_size_mb = source_size / (1024 * 1024)
+        job['replace_output'] = False
+        if self.manifest is not None:
+            previous_output = self.manifest.output_of(image_path) if self.recursive else None
+            if previous_output is not None and previous_output.parent == output_path.parent:
+                # Mirrored batch: a changed source replaces its own earlier output
+                # instead of getting a numbered name next to the stale one
+                output_path, job['replace_output'] = previous_output, True
+            self.manifest.mark(image_path, 'started', stat_result)
+            job['journaled'] = True
+
+        # Output folder (date-based or mirrored), same name with .webp extension
+        job['output_path'] = output_path
+
+        self.log(f"Converting: {image_path.name} ({source_size / 1024:.1f} KB / {source_size_mb:.1f} MB)")
+
+        job['source'] = image_path
+        if prefetch:
+            stage_started = time.perf_counter()
+            job['source'] = image_path.read_bytes()
+            job['timings']['read'] = time.perf_counter() - stage_started
+
+        job['cache_key'] = job['cached'] = None
+        if self.result_cache is not None and not self.renditions:  # The cache holds one output per source
+            stage_started = time.perf_counter()
+            job['cache_key'] = self.result_cache.make_key(job['source'], self.cache_settings())
+            job['cached'] = self.result_cache.get(job['cache_key'])
+            job['timings']['hash'] = time.perf_counter() - stage_started
+            if job['cached'] is not None:
+                job.pop('source')  # Not decoded - do not keep prefetched bytes queued
+
+    def decode_source(self, job):
+        """
+        Decode stage: open the source (reduced decode where possible), extract its
+        metadata and convert it to RGB/RGBA. Skipped for cache hits.
+
+        Args:
+            job: Job that went through read_source()
+        """
+        if job['cached'] is not None:
+            return
+
+        stage_started = time.perf_counter()
+        source = job.pop('source')
+        if isinstance(source, bytes):
+            try:
+                img = self.open_source(io.BytesIO(source))
+            except Image.UnidentifiedImageError:
+                # Name the file instead of the in-memory buffer
+                raise Image.UnidentifiedImageError(f"cannot identify image file {str(job['path'])!r}") from None
+        else:
+            img = self.open_source(source)
+        job['opened'] = img
+        job['original_size'] = img.size
+        job['original_dimensions'] = original_dimensions = f"{img.size[0]}x{img.size[1]}"
+
+        # Decode only the resolution the planned output size will keep
+        _, planned_scale = self.plan_compression(img.size[0], img.size[1], job['source_size'] / (1024 * 1024))
+        streamed_size = self.streamed_size(img)
+        job['reduced_decode'] = streamed_size is None and self.apply_reduced_decode(img, planned_scale)
+        if job['reduced_decode']:
+            self.log(f"    ⚙️  Reduced decode: {original_dimensions} → {img.size[0]}x{img.size[1]}")
+
+        # Get metadata from the same open file (EXIF/GPS, ICC, XMP)
+        job['metadata'] = self.extract_metadata(img)
+
+        if streamed_size is not None:
+            self.log(f"    ⚙️  Streaming decode: {original_dimensions} → {streamed_size[0]}x{streamed_size[1]} "
+                     f"(band by band)")
+            img = self.stream_decode(img, streamed_size)
+        elif getattr(img, 'is_animated', False) and img.format in ('GIF', 'WEBP', 'PNG'):
+            animation = AnimationFrames.from_image(img, self.frame_merge_threshold, self.max_animation_frames,
+                                                   self.max_animation_pixels)
+            if AnimationFrames.too_large(img, self.max_animation_frames, self.max_animation_pixels):
+                self.log(f"    🎞️  Animation: {animation.source_frames} frames of {img.size[0]}x{img.size[1]} "
+                         f"exceed the animation limits - converting the first frame")
+            else:
+                self.log(f"    🎞️  Animation: {animation.source_frames} frames → {len(animation.frames)} "
+                         f"after merging unchanged frames")
+            # Every frame the same picture - convert it as a still image
+            img = animation if len(animation.frames) > 1 else animation.frames[0]
+        else:
+            img.load()
+
+        # Convert RGBA to RGB if necessary (for images without transparency)
+        if isinstance(img, AnimationFrames):
+            pass  # Frames are already RGBA
+        elif img.mode in ('RGBA', 'LA', 'PA', 'P'):
+            # Keep alpha channel for transparent images; the encoding variants
+            # expect RGB or RGBA, so grey and palette images are widened first
+            if img.mode != 'RGBA':
+                img = img.convert('RGBA')
+            if img.getchannel('A').getextrema()[0] == 255:
+                # Fully opaque - the alpha plane would only cost bytes
+                img = img.convert('RGB')
+        elif img.mode not in ('RGB', 'RGBA'):
+            img = img.convert('RGB')
+        job['image'] = img
+        job['timings']['decode'] = time.perf_counter() - stage_started
+
+        job['features'] = None
+        if self.predictor is not None and not isinstance(img, AnimationFrames):
+            stage_started = time.perf_counter()
+            job['features'] = QualityPredictor.features(
+                img, job['original_size'], job['source_size'], self.max_output_size_kb * 1024
+            )
+            job['timings']['features'] = time.perf_counter() - stage_started
+
+    def encode_output(self, job):
         """
-        Initialize the converter with folder paths.
+        Encode stage: search the WebP encode that fits the size budget and release
+        the decoded image. Skipped for cache hits.
 
         Args:
-            source_folder: Folder containing source images
-            result_folder: Folder to save converted images
-            failed_folder: Folder to move failed conversions
+            job: Job that went through decode_source()
         """
-        self.source_folder = Path(source_folder)
-        self.result_folder = Path(result_folder)
-        self.failed_folder = Path(failed_folder)
+        if job['cached'] is not None:
+            return
 
-        # Create folders if they don't exist
-        self.source_folder.mkdir(exist_ok=True)
-        self.result_folder.mkdir(exist_ok=True)
-        self.failed_folder.mkdir(exist_ok=True)
+        try:
+            content = None
+            if self.auto_lossless and not isinstance(job['image'], AnimationFrames):
+                started = time.perf_counter()
+                content = self.analyse_content(job['image'])
+                job['timings']['analyse'] = time.perf_counter() - started
+                if content and content['kind'] == 'graphic':
+                    self.log(f"    🔎 Graphic content ({content['colours']} colours, {content['flat']:.0%} flat): "
+                             f"trying {', '.join(content['encodings'])}")
 
-        # WebP conversion settings
-        self.webp_quality = 75
-        self.webp_alpha_quality = 80
-        self.max_output_size_kb = 150  # Maximum output file size in KB (with metadata preserved)
+            # Optimize with compression to stay under 150KB (metadata included)
+            pyramid = ResizePyramid(job['image'])
+            job['output_data'], stats = self.encode_within_budget(
+                job['image'], job['metadata'], job['source_size'] / (1024 * 1024), job['original_size'],
+                job['features'], pyramid, content=content
+            )
+            if self.renditions and not job.get('primary_only'):
+                job['renditions'] = self.encode_renditions(job['image'], job['metadata'], pyramid, content)
+                for _, _, rendition_stats in job['renditions']:
+                    for stage in ('resize', 'encode'):
+                        stats['timings'][stage] += rendition_stats['timings'][stage]
+        finally:
+            self.release_image(job)
+        if job['features'] is not None:
+            stats['features'] = job['features']
+        stats['reduced_decode'] = job['reduced_decode']
+        job['timings'].update(stats['timings'])
+        job['stats'] = stats
 
-        # Supported image formats
-        self.supported_formats = {
-            '.jpg', '.jpeg', '.png', '.bmp', '.tiff', '.tif',
-            '.gif', '.ico', '.webp', '.ppm', '.pgm', '.pbm',
-            '.pnm', '.dib', '.jfif', '.jp2', '.jpx', '.j2k'
-        }
+    def encode_renditions(self, img, metadata, pyramid, content=None):
+        """
+        Encode the extra renditions from the already decoded image, largest first.
+        Every rendition is taken from the shared resize pyramid, so it is derived
+        from the nearest larger level (e.g. the full-size output or the previous
+        rendition) instead of from the full-resolution source.
 
-    def get_output_subfolder(self):
+        Args:
+            img: Decoded source image
+            metadata: Dict from extract_metadata()
+            pyramid: ResizePyramid over img, shared with the full-size encode
+            content: Result of analyse_content() for img (None = lossy only)
+
+        Returns:
+            list: (rendition dict, WebP bytes, stats) per rendition
         """
-        Create and return the output subfolder path based on current date (mmddyyyy).
+        results = []
+        for rendition in self.renditions:
+            base = img
+            max_dimension = rendition.get('max_dimension')
+            if max_dimension and max(img.size) > max_dimension:
+                factor = max_dimension / max(img.size)
+                started = time.perf_counter()
+                base = pyramid.resize((max(round(img.width * factor), 1), max(round(img.height * factor), 1)))
+                resize_seconds = time.perf_counter() - started
+            else:
+                resize_seconds = 0.0
+
+            policy = rendition.get('metadata', 'all')
+            data, stats = self.encode_within_budget(
+                base, self.rendition_metadata(metadata, policy), 0, base.size, None, pyramid, rendition['max_kb'],
+                content
+            )
+            stats['timings']['resize'] += resize_seconds
+            stats['metadata_preserved'] = policy == 'all'
+            results.append((rendition, data, stats))
+        return results
+
+    @staticmethod
+    def rendition_metadata(metadata, policy):
+        """
+        Apply a rendition's metadata policy.
+
+        Args:
+            metadata: Dict from extract_metadata()
+            policy: 'all', 'no-gps' (EXIF without the GPS block), 'icc' (colour
+                    profile only) or 'none'
 
         Returns:
-            Path: Path to the date-based subfolder
+            dict: Metadata to embed
         """
-        now = datetime.now()
-        subfolder_name = now.strftime("%m%d%Y")
-        output_path = self.result_folder / subfolder_name
-        output_path.mkdir(parents=True, exist_ok=True)
-        return output_path
+        if policy == 'all':
+            return metadata
+        if policy == 'no-gps':
+            exif_data = metadata['exif']
+            if exif_data:
+                try:
+                    exif_dict = piexif.load(exif_data)
+                    exif_dict.pop('GPS', None)
+                    exif_dict['0th'].pop(piexif.ImageIFD.GPSTag, None)
+                    exif_data = piexif.dump(exif_dict)
+                except Exception:
+                    exif_data = b''  # Cannot strip the location reliably - drop EXIF
+            return dict(metadata, exif=exif_data)
+        if policy == 'icc':
+            return {'exif': b'', 'icc_profile': metadata['icc_profile'], 'xmp': b''}
+        return {'exif': b'', 'icc_profile': b'', 'xmp': b''}
 
-    def preserve_metadata(self, source_path, target_path):
+    def commit_output(self, job):
         """
-        Copy EXIF metadata from source to target image, including GPS data.
+        Commit stage: write the WebP file, store it in the result cache and delete
+        the source. Sets job['stats'] to the final statistics.
 
         Args:
-            source_path: Path to source image
-            target_path: Path to target WebP image
+            job: Job that went through encode_output()
         """
-        try:
-            # Try to load EXIF data from source
-            source_image = Image.open(source_path)
-
-            # Check if source has EXIF data
-            if 'exif' in source_image.info:
-                exif_dict = piexif.load(source_image.info['exif'])
-
-                # Convert EXIF to bytes
-                exif_bytes = piexif.dump(exif_dict)
-
-                # Load target image and save with EXIF
-                target_image = Image.open(target_path)
-                target_image.save(target_path, 'WEBP',
-                                quality=self.webp_quality,
-                                alpha_quality=self.webp_alpha_quality,
-                                method=6,  # Use Sharp YUV
-                                exif=exif_bytes)
-
-                print(f"    ✓ Metadata preserved (including GPS if available)")
-                return True
-            else:
-                print(f"    ℹ No EXIF metadata found in source image")
-                return False
+        image_path, output_path, source_size = job['path'], job['output_path'], job['source_size']
+        timings = job['timings']
 
-        except Exception as e:
-            print(f"    ⚠ Warning: Could not preserve metadata - {str(e)}")
-            return False
+        if job['cached'] is not None:
+            stats = self.reuse_cached_result(image_path, output_path, source_size, *job['cached'],
+                                             replace=job['replace_output'])
+            timings.update(stats['timings'])
+            stats['timings'] = dict(timings, total=time.perf_counter() - job['started'])
+            stats['source_size'] = source_size
+            job['stats'] = stats
+            return
 
-    def calculate_resize_dimensions(self, original_width, original_height, target_size_kb):
+        stats = job['stats']
+        output_data = job.pop('output_data')
+        stage_started = time.perf_counter()
+        job['output_path'] = output_path = self.write_output(output_path, output_data, image_path,
+                                                             job['replace_output'])
+        rendition_lines = []
+        if job.get('renditions'):
+            stats['renditions'] = {}
+            for rendition, data, rendition_stats in job.pop('renditions'):
+                # Named after the main output, so photo_1.webp gets photo_1_320.webp
+                rendition_path = self.write_output(
+                    output_path.with_name(output_path.stem + rendition['suffix'] + output_path.suffix), data,
+                    replace=job['replace_output']
+                )
+                stats['renditions'][rendition['suffix']] = {
+                    key: rendition_stats[key]
+                    for key in ('quality', 'encoding', 'attempts', 'final_size_kb', 'dimensions')
+                }
+                width, height = rendition_stats['dimensions']
+                rendition_lines.append(
+                    f"    ✓ Rendition {rendition_path.name}: {width}x{height}, {len(data) / 1024:.1f} KB "
+                    f"(≤{rendition['max_kb']} KB), Quality: {rendition_stats['quality']} ({rendition_stats['encoding']}), "
+                    f"Metadata: {rendition.get('metadata', 'all')}"
+                )
+        timings['write'] = time.perf_counter() - stage_started
+
+        if job['cache_key'] is not None:
+            self.result_cache.put(job['cache_key'], output_data, stats)
+            stats['cache_hit'] = False
+            stats['cache_bytes'] = len(output_data)
+
+        if any(job['metadata'].values()):
+            self.log(f"    ✓ Metadata preserved (including GPS if available)")
+        else:
+            self.log(f"    ℹ No EXIF metadata found in source image")
+
+        # Get final output file size
+        output_size = len(output_data)
+        size_reduction = ((source_size - output_size) / source_size * 100)
+
+        # Check if we achieved the target
+        if output_size > self.max_output_size_kb * 1024:
+            self.log(f"    ⚠️  Warning: Output size {output_size / 1024:.1f} KB exceeds {self.max_output_size_kb} KB limit!")
+
+        self.log(f"    ✓ Saved to: {output_path}")
+        self.log(f"    ✓ Size: {source_size / 1024:.1f} KB → {output_size / 1024:.1f} KB ({size_reduction:.1f}% reduction)")
+        self.log(f"    ✓ Dimensions: {job['original_dimensions']} → Scale: {stats['resize_scale']}%")
+        if 'frames' in stats:
+            self.log(f"    ✓ Animation: {stats['frames']} frames (source: {stats['source_frames']}), "
+                     f"Loop: {stats['loop'] or 'forever'}")
+        ssim_text = f", SSIM: {stats['ssim']:.3f}" if 'ssim' in stats else ""
+        self.log(f"    ✓ Quality: {stats['quality']} ({stats.get('encoding', 'lossy')}){ssim_text}, "
+                 f"Attempts: {stats['attempts']}, Target: ≤{self.max_output_size_kb} KB")
+        self.log(f"    ✓ Metadata: PRESERVED (GPS, EXIF, DateTime)")
+        for line in rendition_lines:
+            self.log(line)
+
+        # Delete source file after successful conversion
+        stage_started = time.perf_counter()
+        self.delete_source(image_path)
+        timings['delete'] = time.perf_counter() - stage_started
+
+        stats['timings'] = dict(timings, total=time.perf_counter() - job['started'])
+        stats['source_size'] = source_size
+
+    def write_output(self, output_path, data, image_path=None, replace=False):
         """
-        Calculate new dimensions to achieve target file size.
-        Uses balanced scaling for 150KB target with metadata preservation.
+        Write a WebP file crash-safely: the data goes to a temp file (fsynced) that
+        is then renamed into place, so a killed process never leaves a truncated
+        .webp behind. An existing file is never overwritten - same-named sources
+        get a numbered name instead (photo_1.webp, photo_2.webp, ...) - unless
+        replace is set.
 
         Args:
-            original_width: Original image width
-            original_height: Original image height
-            target_size_kb: Target file size in KB
+            output_path: Wanted output path
+            data: WebP file bytes
+            image_path: Source image, journaled in the manifest (optional)
+            replace: Atomically replace output_path (the earlier output of the same source)
 
         Returns:
-            tuple: (new_width, new_height, scale_percentage)
+            Path: Path the file was written to
         """
-        # For 150KB target, use 60% scale to maintain better quality
-        scale = 0.6
+        temp_path = output_path.with_name(f".{output_path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        with open(temp_path, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        if self.manifest is not None and image_path is not None:
+            self.manifest.mark(image_path, 'writing', output=temp_path)
 
-        new_width = int(original_width * scale)
-        new_height = int(original_height * scale)
+        try:
+            if replace:
+                candidate = output_path
+                os.replace(temp_path, candidate)
+            number = 0
+            while not replace:
+                candidate = output_path
+                if number:
+                    candidate = output_path.with_name(f"{output_path.stem}_{number}{output_path.suffix}")
+                number += 1
+                try:
+                    os.link(temp_path, candidate)  # Atomic, and fails if the name is taken
+                except FileExistsError:
+                    continue
+                except OSError:
+                    # No hard links on this file system (e.g. FAT, some network shares)
+                    if candidate.exists():
+                        continue
+                    os.replace(temp_path, candidate)
+                break
+        finally:
+            try:
+                temp_path.unlink()
+            except FileNotFoundError:
+                pass
 
-        return new_width, new_height, int(scale * 100)
+        if self.manifest is not None and image_path is not None:
+            self.manifest.mark(image_path, 'written', output=candidate)
+        return candidate
 
-    def optimize_webp_size(self, img, output_path, exif_data, source_size_mb):
+    def delete_source(self, image_path):
         """
-        Optimize WebP to ensure output is under 150KB while ALWAYS preserving metadata.
-        Uses multi-pass compression with dynamic quality and resize.
+        Delete a converted source (unless keep_originals is set) and mark its job
+        done in the manifest.
 
-        Strategy:
-        1. Start with higher quality for 150KB target (better than 99KB)
-        2. Resize image if needed
-        3. Iteratively reduce quality until under 150KB
-        4. ALWAYS preserve metadata (EXIF included in all attempts)
+        Args:
+            image_path: Path to the source image file
+        """
+        if not self.keep_originals:
+            image_path.unlink()
+        if self.manifest is not None:
+            self.manifest.mark(image_path, 'done')
+        self.log(f"    ✓ Source file {'kept' if self.keep_originals else 'deleted'}")
+
+    def is_converted(self, image_path):
+        """
+        Check the manifest for an earlier successful conversion of this exact file.
+        Only used with keep_originals: otherwise converted sources are deleted,
+        so a matching file in the source folder is a new drop.
 
         Args:
-            img: PIL Image object
-            output_path: Path to save the WebP file
-            exif_data: EXIF data to preserve (ALWAYS included)
-            source_size_mb: Source file size in MB
+            image_path: Path to the source image file
 
         Returns:
-            dict: Compression statistics
+            bool: True if the file is unchanged since it was converted
         """
-        max_size_bytes = self.max_output_size_kb * 1024
-        original_width, original_height = img.size
-
-        # Determine initial quality based on source file size
-        # Higher quality for 150KB target vs 99KB
-        if source_size_mb > 100:
-            quality = 45  # Better quality for huge files
-            resize_needed = True
-        elif source_size_mb > 50:
-            quality = 55
-            resize_needed = True
-        elif source_size_mb > 10:
-            quality = 65
-            resize_needed = True
-        else:
-            quality = 70  # Higher starting quality for small files
-            resize_needed = False
+        try:
+            return self.manifest.is_done(image_path, image_path.stat())
+        except FileNotFoundError:
+            return False
 
-        # Resize image if source is very large
-        working_img = img
-        resize_scale = 100
+    def recover_interrupted(self):
+        """
+        Finish the jobs a crash interrupted, using the manifest: leftover temp
+        files are removed, and sources whose output was already written are
+        deleted. Everything else is simply converted again. Only unfinished
+        jobs are looked at, so this is quick however long the history is.
 
-        if resize_needed:
-            new_width, new_height, resize_scale = self.calculate_resize_dimensions(
-                original_width, original_height, self.max_output_size_kb
-            )
-            working_img = img.resize((new_width, new_height), Image.Resampling.LANCZOS)
-            print(f"    ⚙️  Resizing: {original_width}x{original_height} → {new_width}x{new_height} ({resize_scale}%)")
+        Returns:
+            int: Number of interrupted jobs found
+        """
+        if self.manifest is None:
+            return 0
 
-        # Multi-pass compression to achieve target size
-        attempts = 0
-        max_attempts = 10
+        jobs = self.manifest.unfinished()
+        for source, size, mtime_ns, state, output in jobs:
+            source_path = Path(source)
+            try:
+                stat_result = source_path.stat()
+            except FileNotFoundError:
+                stat_result = None
+            unchanged = stat_result is not None and (stat_result.st_size, stat_result.st_mtime_ns) == (size, mtime_ns)
 
-        while attempts < max_attempts:
-            # Save with current quality - ALWAYS include EXIF metadata
-            working_img.save(
-                output_path,
-                'WEBP',
-                quality=quality,
-                alpha_quality=max(quality - 5, 60),  # Higher alpha quality
-                method=6,  # Best compression
-                exact=False,
-                lossless=False,
-                exif=exif_data,  # ALWAYS preserve metadata!
-                minimize_size=True,
-                kmin=3,
-                kmax=5
-            )
+            if state == 'written' and output and Path(output).exists():
+                # Output is complete - only the source deletion was lost
+                if unchanged and not self.keep_originals:
+                    source_path.unlink()
+                if unchanged or stat_result is None:
+                    self.manifest.mark(source_path, 'done')
+                    self.log(f"♻️  Resumed: {source_path.name} → {Path(output).name}")
+                    continue
+            elif state == 'writing' and output:
+                try:
+                    Path(output).unlink()  # Incomplete temp file
+                except FileNotFoundError:
+                    pass
+            self.manifest.mark(source_path, 'interrupted')
 
-            # Check file size
-            current_size = output_path.stat().st_size
+        if jobs:
+            self.log(f"♻️  Recovered {len(jobs)} interrupted job(s) from the manifest")
+        return len(jobs)
 
-            if current_size <= max_size_bytes:
-                # Success!
-                return {
-                    'quality': quality,
-                    'resize_scale': resize_scale,
-                    'attempts': attempts + 1,
-                    'final_size_kb': current_size / 1024,
-                    'metadata_preserved': True
-                }
+    def start_claiming(self):
+        """
+        Start the lease heartbeat and return the files left claimed by this node's
+        previous run or by crashed instances. Does nothing without a node_id.
+        """
+        if self.claimer is None:
+            return
+        self.claimer.start()
+        returned = self.claimer.reclaim_expired(include_own=True)
+        if returned:
+            self.log(f"♻️  Returned {returned} file(s) from expired claims to the source folder")
 
-            # File still too large, reduce quality
-            attempts += 1
+    def release_image(self, job):
+        """
+        Close the decoded image of a job (if any) so its memory is freed right away.
 
-            if attempts == 2 and not resize_needed:
-                # If quality reduction isn't enough, try resizing
-                new_width, new_height, resize_scale = self.calculate_resize_dimensions(
-                    original_width, original_height, self.max_output_size_kb
-                )
-                working_img = img.resize((new_width, new_height), Image.Resampling.LANCZOS)
-                print(f"    ⚙️  Resizing: {original_width}x{original_height} → {new_width}x{new_height} ({resize_scale}%)")
-                resize_needed = True
-                quality = 60  # Reset to higher quality after resize
-                continue
+        Args:
+            job: Job dict
+        """
+        opened = job.pop('opened', None)
+        job.pop('image', None)
+        job.pop('source', None)
+        if opened is not None:
+            opened.close()
 
-            # Reduce quality more gradually (150KB allows for better quality)
-            if current_size > max_size_bytes * 2:
-                quality = max(quality - 10, 25)  # Minimum quality 25 (better than 15)
-            elif current_size > max_size_bytes * 1.5:
-                quality = max(quality - 8, 25)
-            else:
-                quality = max(quality - 5, 25)
+    def failed_result(self, job, error):
+        """
+        Log a failed conversion and build its statistics.
 
-            # If quality is at minimum and still too large, resize more
-            if quality <= 25 and resize_needed:
-                resize_scale = int(resize_scale * 0.85)  # Less aggressive resize
-                new_width = int(original_width * resize_scale / 100)
-                new_height = int(original_height * resize_scale / 100)
-                working_img = img.resize((new_width, new_height), Image.Resampling.LANCZOS)
-                print(f"    ⚙️  Further resizing: → {new_width}x{new_height} ({resize_scale}%)")
-                quality = 50  # Reset quality after additional resize
+        Args:
+            job: Job dict of the failed image
+            error: Exception that stopped the conversion
 
-        # Return stats even if we couldn't achieve target
-        # Metadata is still preserved!
+        Returns:
+            dict: 'error', 'source_size' and 'timings' of the failed conversion, and
+                  'source_path' (where the file is now); only 'claimed_elsewhere'
+                  if another instance took the file
+        """
+        if isinstance(error, ClaimedElsewhere):
+            return {'claimed_elsewhere': True}
+        self.release_image(job)
+        if job.get('journaled'):
+            self.manifest.mark(job['path'], 'failed', error=str(error))
+        self.log(f"    ✗ Error converting {job['path'].name}: {str(error)}")
         return {
-            'quality': quality,
-            'resize_scale': resize_scale,
-            'attempts': attempts,
-            'final_size_kb': output_path.stat().st_size / 1024,
-            'metadata_preserved': True
+            'error': str(error),
+            'source_size': job['source_size'],
+            'source_path': job['path'],
+            'timings': dict(job['timings'], total=time.perf_counter() - job['started']),
         }
 
-    def convert_image_to_webp(self, image_path):
+    def reuse_cached_result(self, image_path, output_path, source_size, data, stats, replace=False):
         """
-        Convert a single image to WebP format with balanced compression.
-        Ensures output file is under 150KB while ALWAYS preserving metadata.
+        Write a cached WebP to the output folder and delete the source, without decoding.
 
         Args:
             image_path: Path to the source image file
+            output_path: Path to save the WebP file
+            source_size: Source file size in bytes
+            data: Cached WebP file
+            stats: Cached compression statistics
+            replace: Replace output_path (see write_output())
 
         Returns:
-            bool: True if conversion successful, False otherwise
+            dict: Compression statistics of the cached conversion
         """
-        try:
-            # Get source file size
-            source_size = image_path.stat().st_size
-            source_size_mb = source_size / (1024 * 1024)
-
-            # Get output folder with date-based subfolder
-            output_folder = self.get_output_subfolder()
-
-            # Create output filename (same name, .webp extension)
-            output_filename = image_path.stem + ".webp"
-            output_path = output_folder / output_filename
-
-            print(f"Converting: {image_path.name} ({source_size / 1024:.1f} KB / {source_size_mb:.1f} MB)")
+        started = time.perf_counter()
+        output_path = self.write_output(output_path, data, image_path, replace)
+        write_seconds = time.perf_counter() - started
+        size_reduction = ((source_size - len(data)) / source_size * 100)
 
-            # Open and convert image
-            with Image.open(image_path) as img:
-                original_dimensions = f"{img.size[0]}x{img.size[1]}"
+        self.log(f"    ✓ Cache hit: identical image already converted (no re-encode)")
+        self.log(f"    ✓ Saved to: {output_path}")
+        self.log(f"    ✓ Size: {source_size / 1024:.1f} KB → {len(data) / 1024:.1f} KB ({size_reduction:.1f}% reduction)")
+        self.log(f"    ✓ Scale: {stats['resize_scale']}%, Quality: {stats['quality']} ({stats.get('encoding', 'lossy')}), "
+                 f"Target: ≤{self.max_output_size_kb} KB")
+        self.log(f"    ✓ Metadata: PRESERVED (GPS, EXIF, DateTime)")
 
-                # Convert RGBA to RGB if necessary (for images without transparency)
-                if img.mode in ('RGBA', 'LA', 'P'):
-                    # Keep alpha channel for transparent images
-                    if img.mode == 'P':
-                        img = img.convert('RGBA')
-                elif img.mode not in ('RGB', 'RGBA'):
-                    img = img.convert('RGB')
+        started = time.perf_counter()
+        self.delete_source(image_path)
+        delete_seconds = time.perf_counter() - started
 
-                # Get EXIF data before saving
-                exif_data = img.info.get('exif', b'')
+        stats['cache_hit'] = True
+        stats['timings'] = {'write': write_seconds, 'delete': delete_seconds}
+        return stats
 
-                # Optimize with compression to stay under 150KB (metadata included)
-                stats = self.optimize_webp_size(img, output_path, exif_data, source_size_mb)
+    def record_result(self, image_path, success, stats):
+        """
+        Update converter-wide state from one finished conversion. Runs in the
+        main process, also when images were converted by worker processes.
 
-            # ALWAYS preserve metadata from source (re-apply with piexif)
-            self.preserve_metadata(image_path, output_path)
+        Args:
+            image_path: Path to the source image file
+            success: Whether the conversion succeeded
+            stats: Statistics returned by convert_image() (only 'error' and
+                   'source_path' if the worker died)
+        """
+        if self.metrics is not None:
+            self.metrics.record(image_path, success, stats, self.max_output_size_kb)
 
-            # Get final output file size
-            output_size = output_path.stat().st_size
-            size_reduction = ((source_size - output_size) / source_size * 100)
+        if not success or stats is None:
+            return
 
-            # Check if we achieved the target
-            if output_size > self.max_output_size_kb * 1024:
-                print(f"    ⚠️  Warning: Output size {output_size / 1024:.1f} KB exceeds {self.max_output_size_kb} KB limit!")
+        if self.result_cache is not None and 'cache_hit' in stats:
+            self.result_cache.count(stats['cache_hit'])
+            if stats['cache_hit']:
+                return  # Nothing new was encoded
+            if 'cache_bytes' in stats:
+                self.result_cache.track(stats['cache_bytes'])
 
-            print(f"    ✓ Saved to: {output_path}")
-            print(f"    ✓ Size: {source_size / 1024:.1f} KB → {output_size / 1024:.1f} KB ({size_reduction:.1f}% reduction)")
-            print(f"    ✓ Dimensions: {original_dimensions} → Scale: {stats['resize_scale']}%")
-            print(f"    ✓ Quality: {stats['quality']}, Attempts: {stats['attempts']}, Target: ≤{self.max_output_size_kb} KB")
-            print(f"    ✓ Metadata: PRESERVED (GPS, EXIF, DateTime)")
+        if self.predictor is not None and 'features' in stats and 'output_pixels' in stats:
+            self.predictor.add(stats['features'], stats, stats['output_pixels'])
 
-            # Delete source file after successful conversion
-            image_path.unlink()
-            print(f"    ✓ Source file deleted")
+        if 'predicted_size_kb' in stats:
+            self.effort_log.append((image_path.name, stats['predicted_size_kb'], stats['final_size_kb']))
+            # Calibrate the low-effort -> method 6 size ratio (moving average)
+            observed_ratio = stats['final_size_kb'] / stats['search_size_kb']
+            self.effort_ratio = 0.8 * self.effort_ratio + 0.2 * observed_ratio
 
-            return True
+    def print_effort_report(self):
+        """
+        Print how the predicted method-6 sizes of two-phase conversions compared
+        with the actual final sizes.
+        """
+        if not self.effort_log:
+            return
 
-        except Exception as e:
-            print(f"    ✗ Error converting {image_path.name}: {str(e)}")
-            return False
+        errors = [(actual - predicted) / predicted * 100 for _, predicted, actual in self.effort_log]
+        over_budget = sum(1 for _, _, actual in self.effort_log if actual > self.max_output_size_kb)
+        self.log(f"📐 Two-phase effort report (search method {self.search_method} → method 6):")
+        for (name, predicted, actual), error in list(zip(self.effort_log, errors))[-10:]:
+            self.log(f"   {name}: predicted {predicted:.1f} KB, actual {actual:.1f} KB ({error:+.1f}%)")
+        self.log(f"   Images: {len(errors)} | Mean error: {sum(errors) / len(errors):+.1f}% | "
+                 f"Mean abs error: {sum(abs(e) for e in errors) / len(errors):.1f}% | "
+                 f"Over budget: {over_budget} | Calibrated ratio: {self.effort_ratio:.3f}")
 
-    def move_to_failed(self, image_path):
+    def move_to_failed(self, image_path, original_path=None):
         """
-        Move failed conversion file to the failedConvert folder.
+        Move failed conversion file to the failedConvert folder (the mirrored
+        subfolder in recursive mode). Does nothing when keep_originals is set.
 
         Args:
             image_path: Path to the failed image file
+            original_path: Where the file was found, if it has been claimed since
         """
+        if self.keep_originals:
+            self.log(f"    ➜ Source file kept: {image_path.name}")
+            return
+
         try:
-            destination = self.failed_folder / image_path.name
+            failed_folder = self.failed_folder
+            if self.recursive:
+                failed_folder = self.mirrored_folder(self.failed_folder, original_path or image_path)
+            name = Path((original_path or image_path).name)  # Claimed files may carry a prefix
+            destination = failed_folder / name.name
 
             # If file with same name exists, add timestamp
             if destination.exists():
                 timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-                destination = self.failed_folder / f"{image_path.stem}_{timestamp}{image_path.suffix}"
+                destination = failed_folder / f"{name.stem}_{timestamp}{name.suffix}"
 
             shutil.move(str(image_path), str(destination))
-            print(f"    ➜ Moved to failedConvert: {destination.name}")
+            self.log(f"    ➜ Moved to failedConvert: {destination.name}")
 
         except Exception as e:
-            print(f"    ✗ Error moving file to failedConvert: {str(e)}")
+            self.log(f"    ✗ Error moving file to failedConvert: {str(e)}")
 
     def is_image_file(self, file_path):
         """
@@ -342,43 +3867,397 @@ class ImageToWebPConverter:
         """
         return file_path.suffix.lower() in self.supported_formats
 
+    def iter_image_files(self, folder, recursive=False):
+        """
+        Lazily enumerate the image files in a folder with os.scandir, so even
+        folders with millions of files are never listed up front. Hidden folders
+        (e.g. .claims) and the result/failed folders are skipped.
+
+        Args:
+            folder: Folder to enumerate
+            recursive: Descend into subfolders (depth-first)
+
+        Yields:
+            Path: Image file
+        """
+        skip = {os.path.realpath(self.result_folder), os.path.realpath(self.failed_folder)}
+        folders = [str(folder)]
+        while folders:
+            try:
+                with os.scandir(folders.pop()) as entries:
+                    subfolders = []
+                    for entry in entries:
+                        if entry.is_file():
+                            path = Path(entry.path)
+                            if self.is_image_file(path):
+                                yield path
+                        elif recursive and entry.is_dir() and not entry.name.startswith('.'):
+                            if os.path.realpath(entry.path) not in skip:
+                                subfolders.append(entry.path)
+            except (FileNotFoundError, NotADirectoryError, PermissionError):
+                continue
+            folders.extend(reversed(subfolders))
+
+    def convert_images(self, image_files):
+        """
+        Convert a batch of images, in parallel when more than one worker is configured.
+        Results are yielded together with the log lines of each image, so the caller
+        can print them as one uninterrupted block per file - in input order, or in
+        completion order when a memory budget is set.
+
+        Args:
+            image_files: Image paths to convert - any iterable; it is consumed
+                         lazily, so conversion starts with the first file
+
+        Yields:
+            tuple: (image_path, success, log_lines, stats) - log_lines is None
+                   when the lines were already printed (serial mode)
+        """
+        if self.pipeline:
+            yield from self.run_pipeline(image_files)
+            return
+
+        if self.workers <= 1:
+            # Serial mode logs directly, so progress is visible while a file converts;
+            # the separator a parallel block starts with comes first here as well
+            for image_file in image_files:
+                self.log()
+                success, stats = self.convert_image(image_file)
+                yield image_file, success, None, stats
+            return
+
+        image_files = iter(image_files)
+        if self.memory_budget_mb is None:
+            # Keep a few images per worker submitted ahead of the one being collected
+            pending = deque()
+            for image_file in image_files:
+                pending.append((image_file, *self.submit_conversion(self.get_pool(), image_file)))
+                if len(pending) >= self.workers * 2:
+                    image_file, future, claimed_path = pending.popleft()
+                    yield (image_file, *self.collect_result(image_file, future, claimed_path))
+            while pending:
+                image_file, future, claimed_path = pending.popleft()
+                yield (image_file, *self.collect_result(image_file, future, claimed_path))
+            return
+
+        # Memory-aware admission: results come back in completion order. Size-aware
+        # ordering looks ahead at most lookahead images of a streamed input.
+        self.scheduler = scheduler = AdmissionScheduler(self.memory_budget_mb * 1024 * 1024)
+        lookahead = self.workers * 8
+        exhausted = False
+        running = {}
+        try:
+            while True:
+                while not exhausted and scheduler.queue_depth < lookahead:
+                    image_file = next(image_files, None)
+                    if image_file is None:
+                        exhausted = True
+                    else:
+                        scheduler.add(image_file, self.estimate_memory(image_file))
+                if not running and not scheduler.queue_depth:
+                    break
+                for image_file, estimate in scheduler.admit(self.workers - len(running)):
+                    future, claimed_path = self.submit_conversion(self.get_pool(), image_file)
+                    if future is None:
+                        scheduler.release(estimate)
+                        yield (image_file, *self.collect_result(image_file, None, None))
+                        continue
+                    running[future] = (image_file, estimate, claimed_path)
+                self.update_scheduler_metrics()
+                if not running:
+                    continue
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    image_file, estimate, claimed_path = running.pop(future)
+                    scheduler.release(estimate)
+                    yield (image_file, *self.collect_result(image_file, future, claimed_path))
+        finally:
+            for future in running:
+                future.cancel()
+            self.scheduler = None
+            self.update_scheduler_metrics()
+
+    def run_pipeline(self, image_files):
+        """
+        Convert a batch as a streaming pipeline: read (prefetch into memory),
+        decode, encode and commit (write + delete source) run in their own threads,
+        connected by queues holding at most pipeline_depth images. Disk I/O and
+        encoding overlap, and a slow stage blocks the stages before it, so memory
+        stays flat. Decode and encode get self.workers threads each; with the
+        process executor they run together on the worker pool instead, so
+        encoding is not limited by the GIL.
+
+        The stage threads are stopped and joined when the generator is closed,
+        also when the caller stops iterating early.
+
+        Args:
+            image_files: List of image paths to convert
+
+        Yields:
+            tuple: (image_path, success, log_lines, stats) in completion order
+        """
+        stages = [(lambda job: self.read_source(job, prefetch=True), 1)]
+        if self.executor == "process" and self.workers > 1:
+            def decode_and_encode(job):
+                if job['cached'] is None:
+                    # The worker gets its own copy of the prefetched bytes; dropping them
+                    # here keeps jobs waiting for the commit stage from holding them
+                    source = job['source']
+                    try:
+                        future = self.get_pool().submit(_pipeline_worker, None, dict(job), self.effort_ratio)
+                        job.pop('source')
+                        result = future.result()
+                    except BrokenProcessPool:
+                        # A worker died - retry on its own, see collect_result()
+                        self.discard_broken_pool()
+                        result = self.run_isolated(_pipeline_worker, None, dict(job, source=source),
+                                                   self.effort_ratio)
+                    job.update(result)
+                    if 'error' in job:
+                        raise job.pop('error')
+
+            stages.append((decode_and_encode, self.workers))
+        else:
+            stages += [(self.decode_source, self.workers), (self.encode_output, self.workers)]
+        stages.append((self.commit_output, 1))
+        queues = [queue.Queue(maxsize=self.pipeline_depth) for _ in stages] + [queue.Queue()]
+        stop = threading.Event()  # Set when the consumer stops iterating
+
+        def put(target, item):
+            while not stop.is_set():
+                try:
+                    target.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+
+        def get(source):
+            while not stop.is_set():
+                try:
+                    return source.get(timeout=0.1)
+                except queue.Empty:
+                    pass
+            return None
+
+        def feed():
+            for image_file in image_files:
+                if not put(queues[0], self.new_job(image_file)):
+                    return
+            for _ in range(stages[0][1]):
+                put(queues[0], None)
+
+        def run_stage(index, lock, remaining):
+            function = stages[index][0]
+            inbox, outbox = queues[index], queues[index + 1]
+            while True:
+                job = get(inbox)
+                if job is None:
+                    break
+                if 'error' not in job:
+                    _log_capture.lines = job['lines']
+                    try:
+                        function(job)
+                    except Exception as e:
+                        job['error'] = e
+                    finally:
+                        _log_capture.lines = None
+                put(outbox, job)
+
+            # The last thread of a stage tells every thread of the next stage to stop
+            with lock:
+                remaining[0] -= 1
+                last = remaining[0] == 0
+            if last:
+                next_threads = stages[index + 1][1] if index + 1 < len(stages) else 1
+                for _ in range(next_threads):
+                    put(outbox, None)
+
+        threads = [threading.Thread(target=feed, daemon=True)]
+        for index, (_, count) in enumerate(stages):
+            lock, remaining = threading.Lock(), [count]
+            threads += [threading.Thread(target=run_stage, args=(index, lock, remaining), daemon=True)
+                        for _ in range(count)]
+        for thread in threads:
+            thread.start()
+
+        try:
+            while True:
+                job = queues[-1].get()
+                if job is None:
+                    break
+                if 'error' in job:
+                    _log_capture.lines = job['lines']
+                    try:
+                        stats = self.failed_result(job, job['error'])
+                    finally:
+                        _log_capture.lines = None
+                    yield job['path'], False, job['lines'], stats
+                else:
+                    yield job['path'], True, job['lines'], job['stats']
+        finally:
+            stop.set()
+            for thread in threads:
+                thread.join()
+
+    def submit_conversion(self, pool, image_file):
+        """
+        Submit one image to the worker pool. With work claiming the file is
+        claimed here in the main process first, so where it went is known even
+        when the worker dies.
+
+        Args:
+            pool: Worker pool from get_pool()
+            image_file: Path of the image in the source folder
+
+        Returns:
+            tuple: (future, path the worker converts) - (None, None) if another
+                   instance claimed the file first
+        """
+        claimed_path = image_file
+        if self.claimer is not None:
+            claimed_path = self.claimer.claim(image_file)
+            if claimed_path is None:
+                return None, None
+        try:
+            future = pool.submit(_convert_worker, self.job_converter(), claimed_path, self.effort_ratio)
+        except BrokenProcessPool:
+            # A worker died since the pool was handed out - continue on a fresh pool
+            self.discard_broken_pool()
+            future = self.get_pool().submit(_convert_worker, self.job_converter(), claimed_path, self.effort_ratio)
+        return future, claimed_path
+
+    def collect_result(self, image_file, future, claimed_path=None):
+        """
+        Unpack the result of a parallel conversion.
+
+        Args:
+            image_file: Path of the converted image
+            future: Future returned by submit_conversion() (None if claimed elsewhere)
+            claimed_path: Path the worker converted (default: image_file)
+
+        Returns:
+            tuple: (success, log lines, stats)
+        """
+        if future is None:
+            return False, [], {'claimed_elsewhere': True}
+        try:
+            try:
+                return future.result()
+            except BrokenProcessPool:
+                # A worker died and took every job in flight down with it. Retry
+                # this one on its own: it only fails again if it is the culprit.
+                self.discard_broken_pool()
+                return self.run_isolated(_convert_worker, None, claimed_path or image_file, self.effort_ratio)
+        except Exception as e:
+            # Worker process died (e.g. out of memory) - treat as a failed conversion
+            return False, [f"    ✗ Error converting {image_file.name}: {str(e)}"], {
+                'error': str(e),
+                'source_path': claimed_path or image_file,
+            }
+
+    def update_scheduler_metrics(self):
+        """
+        Export the admission queue depth and the memory budget in use.
+        """
+        if self.metrics is None or self.memory_budget_mb is None:
+            return
+        scheduler = self.scheduler
+        self.metrics.set_gauge('queue_depth', scheduler.queue_depth if scheduler else 0,
+                               'Images waiting for admission.')
+        self.metrics.set_gauge('memory_in_use_bytes', scheduler.in_use if scheduler else 0,
+                               'Estimated memory of the conversions in flight.')
+        self.metrics.set_gauge('memory_budget_bytes', self.memory_budget_mb * 1024 * 1024,
+                               'Memory budget for parallel conversions.')
+
     def process_all_images(self):
         """
         Process all images in the source folder.
         Convert them to WebP and delete originals, or move failed ones.
 
+        In recursive mode the folder tree is enumerated lazily and conversion
+        starts with the first image found.
+
         Returns:
             tuple: (success_count, failed_count)
         """
-        # Get all files in source folder
-        files = [f for f in self.source_folder.iterdir() if f.is_file()]
+        if not self.recursive:
+            return self.process_images(list(self.iter_image_files(self.source_folder)))
+
+        self.log(f"\nScanning {self.source_folder} recursively - converting images as they are found.")
+        self.log("="*60)
+        image_files = self.iter_image_files(self.source_folder, recursive=True)
+        if self.manifest is not None and self.keep_originals:
+            # Sources kept after an earlier successful conversion are not redone
+            image_files = (f for f in image_files if not self.is_converted(f))
+        return self.process_stream(image_files)
+
+    def process_images(self, image_files):
+        """
+        Convert the given images to WebP and delete originals, or move failed ones.
 
-        # Filter only image files
-        image_files = [f for f in files if self.is_image_file(f)]
+        Args:
+            image_files: List of image paths to convert
+
+        Returns:
+            tuple: (success_count, failed_count)
+        """
+        if self.manifest is not None and self.keep_originals:
+            # Sources kept after an earlier successful conversion are not redone.
+            # Without keep_originals a source still present was dropped again
+            # (e.g. copied with its mtime preserved) and is converted as usual.
+            image_files = [f for f in image_files if not self.is_converted(f)]
 
         if not image_files:
             return 0, 0
 
-        print(f"\nFound {len(image_files)} image(s) to convert.")
-        print("="*60)
+        self.log(f"\nFound {len(image_files)} image(s) to convert.")
+        self.log("="*60)
+        return self.process_stream(image_files)
+
+    def process_stream(self, image_files):
+        """
+        Convert images from any iterable (consumed lazily), print one block per
+        image, move failed ones and print the batch summary.
+
+        Args:
+            image_files: Iterable of image paths to convert
 
+        Returns:
+            tuple: (success_count, failed_count)
+        """
         success_count = 0
         failed_count = 0
 
-        for image_file in image_files:
-            print()
-            if self.convert_image_to_webp(image_file):
+        for image_file, success, lines, stats in self.convert_images(image_files):
+            if stats is not None and stats.get('claimed_elsewhere'):
+                continue  # Another instance is converting this file
+            if lines is not None:
+                self.log()
+                for line in lines:
+                    self.log(line)
+            self.record_result(image_file, success, stats)
+            if success:
                 success_count += 1
             else:
                 failed_count += 1
-                self.move_to_failed(image_file)
-            print("-"*60)
+                self.move_to_failed((stats or {}).get('source_path', image_file), image_file)
+            self.log("-"*60)
 
         if success_count > 0 or failed_count > 0:
-            print()
-            print("="*60)
-            print(f"Batch Complete! ✓ Converted: {success_count} | ✗ Failed: {failed_count}")
-            print("="*60)
+            self.log()
+            self.log("="*60)
+            self.log(f"Batch Complete! ✓ Converted: {success_count} | ✗ Failed: {failed_count}")
+            self.log("="*60)
+            if self.search_method is not None:
+                self.print_effort_report()
+            if self.result_cache is not None:
+                self.log(f"🗃️  Result cache: {self.result_cache.hits} hit(s) | {self.result_cache.misses} miss(es)")
+
+        if self.predictor is not None:
+            self.predictor.save()
+        if self.metrics is not None:
+            self.metrics.export()
 
         return success_count, failed_count
 
@@ -403,53 +4282,66 @@ class ImageToWebPConverter:
                     return True
         return False
 
-    def print_welcome_message(self):
+    def print_welcome_message(self, watch_mode="polling"):
         """
         Print bilingual welcome message (English and Indonesian).
+
+        Args:
+            watch_mode: Source folder watching mechanism ('inotify' or 'polling')
         """
-        print("\n" + "="*70)
-        print(" " * 15 + "IMAGE TO WEBP CONVERTER - by MadS")
-        print("="*70)
-        print()
-        print("🇬🇧 ENGLISH:")
-        print("  The image converter to WebP is running. Every image saved in the")
-        print("  'source' folder will be automatically converted and saved in the")
-        print("  'result' folder. Failed conversions will be moved to the")
-        print("  'failedConvert' folder.")
-        print()
-        print("  To stop, press 'Q' on the keyboard or click 'X' to close.")
-        print()
-        print("-"*70)
-        print()
-        print("🇮🇩 BAHASA INDONESIA:")
-        print("  Program image converter to WebP sedang berjalan. Setiap gambar yang")
-        print("  disimpan di folder 'source' akan otomatis di convert dan di save di")
-        print("  folder 'result'. File gambar yang gagal di convert akan di save ke")
-        print("  folder 'failedConvert'.")
-        print()
-        print("  Untuk berhenti, silahkan tekan 'Q' pada keyboard atau klik 'X'.")
-        print()
-        print("="*70)
-        print()
-        print(f"📁 Source folder      : {self.source_folder.absolute()}")
-        print(f"📁 Result folder      : {self.result_folder.absolute()}")
-        print(f"📁 Failed folder      : {self.failed_folder.absolute()}")
-        print(f"📅 Output subfolder   : {self.get_output_subfolder().name}")
-        print(f"⚙️  Quality settings   : Quality={self.webp_quality}, Alpha={self.webp_alpha_quality}, Sharp YUV=Yes")
-        print()
-        print("="*70)
-        print("🔄 Monitoring source folder... (Press 'Q' to quit)")
-        print("="*70)
-
-    def run_continuous(self, check_interval=2):
+        self.log("\n" + "="*70)
+        self.log(" " * 15 + "IMAGE TO WEBP CONVERTER - by MadS")
+        self.log("="*70)
+        self.log()
+        self.log("🇬🇧 ENGLISH:")
+        self.log("  The image converter to WebP is running. Every image saved in the")
+        self.log("  'source' folder will be automatically converted and saved in the")
+        self.log("  'result' folder. Failed conversions will be moved to the")
+        self.log("  'failedConvert' folder.")
+        self.log()
+        self.log("  To stop, press 'Q' on the keyboard or click 'X' to close.")
+        self.log()
+        self.log("-"*70)
+        self.log()
+        self.log("🇮🇩 BAHASA INDONESIA:")
+        self.log("  Program image converter to WebP sedang berjalan. Setiap gambar yang")
+        self.log("  disimpan di folder 'source' akan otomatis di convert dan di save di")
+        self.log("  folder 'result'. File gambar yang gagal di convert akan di save ke")
+        self.log("  folder 'failedConvert'.")
+        self.log()
+        self.log("  Untuk berhenti, silahkan tekan 'Q' pada keyboard atau klik 'X'.")
+        self.log()
+        self.log("="*70)
+        self.log()
+        self.log(f"📁 Source folder      : {self.source_folder.absolute()}")
+        self.log(f"📁 Result folder      : {self.result_folder.absolute()}")
+        self.log(f"📁 Failed folder      : {self.failed_folder.absolute()}")
+        self.log(f"📅 Output subfolder   : {self.get_output_subfolder().name}")
+        self.log(f"⚙️  Quality settings   : Quality={self.webp_quality}, Alpha={self.webp_alpha_quality}, Sharp YUV=Yes")
+        self.log(f"🧵 Parallel workers   : {self.workers} ({self.executor})")
+        self.log(f"👀 Watch mode         : {watch_mode}")
+        self.log()
+        self.log("="*70)
+        self.log("🔄 Monitoring source folder... (Press 'Q' to quit)")
+        self.log("="*70)
+
+    def run_continuous(self, check_interval=2, settle_time=1.0):
         """
         Run converter in continuous monitoring mode.
-        Checks source folder periodically and converts new images.
+        Watches the source folder (inotify on Linux, polling elsewhere) and converts
+        new images as soon as they have finished being written.
 
         Args:
-            check_interval: Seconds between folder checks (default: 2)
+            check_interval: Seconds between folder scans in polling mode (default: 2)
+            settle_time: Seconds a file's size and mtime must stay unchanged before
+                         it is converted (default: 1.0)
         """
-        self.print_welcome_message()
+        self.recover_interrupted()  # Before the first scan, so resumed sources are not queued
+        self.start_claiming()
+        # inotify does not see files other machines write to a shared folder
+        watcher = SourceWatcher(self.source_folder, self.is_image_file, settle_time=settle_time,
+                                poll_interval=check_interval, use_inotify=self.claimer is None)
+        self.print_welcome_message(watcher.mode)
 
         total_success = 0
         total_failed = 0
@@ -458,67 +4350,181 @@ class ImageToWebPConverter:
             while True:
                 # Check if user wants to quit
                 if self.check_quit_key():
-                    print("\n" + "="*70)
-                    print("🛑 Stopping converter...")
-                    print("="*70)
-                    print(f"📊 Total Statistics:")
-                    print(f"   ✓ Successfully converted: {total_success}")
-                    print(f"   ✗ Failed: {total_failed}")
-                    print("="*70)
-                    print("👋 Thank you! / Terima kasih!")
-                    print("="*70)
+                    self.log("\n" + "="*70)
+                    self.log("🛑 Stopping converter...")
+                    self.log("="*70)
+                    self.log(f"📊 Total Statistics:")
+                    self.log(f"   ✓ Successfully converted: {total_success}")
+                    self.log(f"   ✗ Failed: {total_failed}")
+                    self.log("="*70)
+                    self.log("👋 Thank you! / Terima kasih!")
+                    self.log("="*70)
                     break
 
-                # Process any images in source folder
-                success, failed = self.process_all_images()
-                total_success += success
-                total_failed += failed
+                # Return the files of crashed instances to the source folder
+                if self.claimer is not None:
+                    self.claimer.reclaim_expired()
 
-                # Wait before next check
-                time.sleep(check_interval)
+                # Wait for new images (short timeout keeps the 'Q' key responsive)
+                ready = watcher.wait(timeout=0.25)
+                if ready:
+                    success, failed = self.process_images(ready)
+                    total_success += success
+                    total_failed += failed
 
         except KeyboardInterrupt:
-            print("\n\n" + "="*70)
-            print("🛑 Program interrupted by user (Ctrl+C)")
-            print("="*70)
-            print(f"📊 Total Statistics:")
-            print(f"   ✓ Successfully converted: {total_success}")
-            print(f"   ✗ Failed: {total_failed}")
-            print("="*70)
-            print("👋 Thank you! / Terima kasih!")
-            print("="*70)
-
-    def run(self):
+            self.log("\n\n" + "="*70)
+            self.log("🛑 Program interrupted by user (Ctrl+C)")
+            self.log("="*70)
+            self.log(f"📊 Total Statistics:")
+            self.log(f"   ✓ Successfully converted: {total_success}")
+            self.log(f"   ✗ Failed: {total_failed}")
+            self.log("="*70)
+            self.log("👋 Thank you! / Terima kasih!")
+            self.log("="*70)
+
+        finally:
+            watcher.close()
+            self.shutdown()
+
+    def run(self, dry_run=False):
         """
         Main method to run the converter in single-run mode.
+
+        Args:
+            dry_run: Only list what would be converted, without writing anything
         """
-        print("="*60)
-        print("Image to WebP Converter")
-        print("="*60)
-        print(f"Source folder: {self.source_folder.absolute()}")
-        print(f"Result folder: {self.result_folder.absolute()}")
-        print(f"Failed folder: {self.failed_folder.absolute()}")
-        print(f"Output subfolder: {self.get_output_subfolder().name}")
-        print("="*60)
-        print()
+        self.log("="*60)
+        self.log("Image to WebP Converter")
+        self.log("="*60)
+        self.log(f"Source folder: {self.source_folder.absolute()}")
+        self.log(f"Result folder: {self.result_folder.absolute()}")
+        self.log(f"Failed folder: {self.failed_folder.absolute()}")
+        if self.recursive:
+            self.log(f"Output subfolders: mirrored from the source folder")
+        else:
+            self.log(f"Output subfolder: {self.output_folder_for(self.source_folder, create=not dry_run).name}")
+        self.log("="*60)
+        self.log()
+
+        if dry_run:
+            self.print_dry_run()
+            return
+
+        try:
+            self.recover_interrupted()
+            self.start_claiming()
+            self.process_all_images()
+        finally:
+            self.shutdown()
 
-        self.process_all_images()
+    def print_dry_run(self):
+        """
+        List every image that would be converted and where its WebP would go.
+        """
+        count = 0
+        total_bytes = 0
+        for image_file in self.iter_image_files(self.source_folder, self.recursive):
+            if self.manifest is not None and self.keep_originals and self.is_converted(image_file):
+                continue
+            output_path = self.output_folder_for(image_file, create=False) / (image_file.stem + ".webp")
+            size = image_file.stat().st_size
+            self.log(f"[dry-run] {image_file} ({size / 1024:.1f} KB) → {output_path}")
+            count += 1
+            total_bytes += size
+        self.log("="*60)
+        self.log(f"[dry-run] {count} image(s), {total_bytes / (1024 * 1024):.1f} MB would be converted "
+                 f"(target ≤{self.max_output_size_kb} KB each)")
 
 
 def main():
     """
     Main entry point for the converter.
-    Runs in continuous monitoring mode by default.
+    Runs in continuous monitoring mode by default, as a local conversion
+    service with --serve, or converts a folder tree once with the batch command.
     """
+    def output_options(default):
+        # Accepted before and after the batch command. The batch copy defaults to
+        # SUPPRESS, otherwise its defaults would reset values given before it.
+        options = argparse.ArgumentParser(add_help=False)
+        options.add_argument('--thumbnails', action='store_true', default=default,
+                             help="also write 1024/320/128 px renditions (name_1024.webp, ...)")
+        options.add_argument('--min-ssim', type=float, default=default,
+                             help="perceptual quality floor (e.g. 0.95): keep the smallest encode that meets it")
+        return options
+
+    parser = argparse.ArgumentParser(description="Convert images to WebP (max 150 KB, metadata preserved).",
+                                     parents=[output_options(None)])
+    commands = parser.add_subparsers(dest='command')
+    batch = commands.add_parser('batch', help="convert a folder tree once (recursively) and exit",
+                                parents=[output_options(argparse.SUPPRESS)])
+    batch.add_argument('input', help="input root folder")
+    batch.add_argument('output', help="output root folder (the input folder structure is mirrored)")
+    batch.add_argument('--failed', help="folder for failed files (default: <output>/failedConvert)")
+    batch.add_argument('--jobs', type=int, default=0, help="parallel workers (default: 0 = one per CPU core)")
+    batch.add_argument('--max-kb', type=int, default=150, help="output size budget in KB (default: 150)")
+    batch.add_argument('--keep-originals', action='store_true', help="never delete or move source files")
+    batch.add_argument('--dry-run', action='store_true', help="only list what would be converted")
+
+    parser.add_argument('--serve', action='store_true',
+                        help="run as a local HTTP conversion service instead of watching the source folder")
+    parser.add_argument('--host', default='127.0.0.1', help="service interface (default: 127.0.0.1)")
+    parser.add_argument('--port', type=int, default=8765, help="service port (default: 8765)")
+    parser.add_argument('--socket', help="serve on this Unix domain socket instead of host/port")
+    parser.add_argument('--workers', type=int, default=0, help="parallel workers (default: 0 = one per CPU core)")
+    parser.add_argument('--node-id',
+                        help="unique name of this instance when several machines share the source folder")
+    parser.add_argument('--manifest', default=os.path.join("result", ".manifest.sqlite"),
+                        help="SQLite job journal (default: result/.manifest.sqlite); with --node-id keep it "
+                             "on a local disk, not on the shared source mount")
+    parser.add_argument('--lease-seconds', type=int, default=60,
+                        help="seconds before the claims of a crashed instance are taken over (default: 60)")
+    args = parser.parse_args()
+    if args.min_ssim is not None and np is None:
+        parser.error("--min-ssim needs NumPy (pip install numpy)")
+
+    if args.command == 'batch':
+        output = Path(args.output)
+        manifest_path = output / ".manifest.sqlite"
+        converter = ImageToWebPConverter(
+            source_folder=args.input,
+            result_folder=output,
+            failed_folder=args.failed or output / "failedConvert",
+            workers=args.jobs,
+            model_path=output / ".quality_model.json",
+            # A dry run reads an existing manifest but never creates one
+            manifest_path=manifest_path if not args.dry_run or manifest_path.exists() else None,
+            recursive=True,
+            keep_originals=args.keep_originals,
+            renditions=THUMBNAIL_RENDITIONS if args.thumbnails else None,
+            create_folders=not args.dry_run
+        )
+        converter.max_output_size_kb = args.max_kb
+        converter.min_ssim = args.min_ssim
+        converter.run(dry_run=args.dry_run)
+        return
+
     converter = ImageToWebPConverter(
         source_folder="source",
         result_folder="result",
-        failed_folder="failedConvert"
+        failed_folder="failedConvert",
+        workers=args.workers,
+        model_path=os.path.join("result", ".quality_model.json"),
+        manifest_path=args.manifest,
+        node_id=args.node_id,
+        lease_seconds=args.lease_seconds,
+        renditions=THUMBNAIL_RENDITIONS if args.thumbnails else None
     )
+    converter.min_ssim = args.min_ssim
+
+    if args.serve:
+        ConversionService(converter, args.host, args.port, args.socket).serve_forever()
+        return
 
     # Run in continuous monitoring mode
     converter.run_continuous(check_interval=2)
 
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support()  # Required for worker processes in the .exe build
     main()
@@ -0,0 +1,49 @@
+"""
+Shared fixtures for the converter tests.
+"""
+
+import random
+import sys
+from pathlib import Path
+
+import pytest
+from PIL import Image, ImageDraw, ImageFilter
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from converter import ImageToWebPConverter  # noqa: E402
+
+NO_METADATA = {'exif': b'', 'icc_profile': b'', 'xmp': b''}
+
+
+def make_photo(size=(320, 240), seed=1):
+    """
+    Deterministic photo-like RGB image: gradient, shapes and noise.
+    """
+    rng = random.Random(seed)
+    gradient = Image.linear_gradient('L').resize(size)
+    img = Image.merge('RGB', (gradient, gradient.transpose(Image.Transpose.FLIP_LEFT_RIGHT),
+                              gradient.transpose(Image.Transpose.ROTATE_180)))
+    draw = ImageDraw.Draw(img)
+    for _ in range(20):
+        x0, y0 = rng.randrange(size[0]), rng.randrange(size[1])
+        draw.ellipse((x0, y0, x0 + rng.randrange(80), y0 + rng.randrange(80)),
+                     fill=tuple(rng.randrange(256) for _ in range(3)))
+    noise = Image.effect_noise(size, 40).convert('RGB')
+    return Image.blend(img, noise, 0.3).filter(ImageFilter.GaussianBlur(0.5))
+
+
+@pytest.fixture
+def converter(tmp_path):
+    """
+    Quiet single-worker converter on temporary folders.
+    """
+    converter = ImageToWebPConverter(tmp_path / 'source', tmp_path / 'result', tmp_path / 'failed',
+                                     workers=1, quiet=True)
+    yield converter
+    converter.shutdown()
+
+
+@pytest.fixture
+def photo():
+    return make_photo()
@@ -0,0 +1,101 @@
+"""
+Tests for memory-aware admission of parallel conversions.
+"""
+
+import threading
+
+from conftest import make_photo
+from converter import AdmissionScheduler, ImageToWebPConverter
+
+MB = 1024 * 1024
+
+
+def admit_names(scheduler, max_jobs=10):
+    return [item for item, _ in scheduler.admit(max_jobs)]
+
+
+def test_admits_smallest_first_within_budget():
+    scheduler = AdmissionScheduler(100 * MB)
+    for name, size in (('big', 75), ('small', 10), ('medium', 30)):
+        scheduler.add(name, size * MB)
+
+    assert admit_names(scheduler) == ['small', 'medium']
+    assert scheduler.in_use == 40 * MB and scheduler.queue_depth == 1
+
+    scheduler.release(10 * MB)
+    assert admit_names(scheduler) == []  # 30 + 75 > 100 - the big job waits
+    scheduler.release(30 * MB)
+    assert admit_names(scheduler) == ['big']
+
+
+def test_respects_free_worker_slots():
+    scheduler = AdmissionScheduler(100 * MB)
+    for index in range(4):
+        scheduler.add(index, MB)
+
+    assert admit_names(scheduler, max_jobs=2) == [0, 1]
+    assert scheduler.running == 2
+
+
+def test_oversized_job_runs_alone():
+    scheduler = AdmissionScheduler(100 * MB)
+    scheduler.add('huge', 500 * MB)
+    scheduler.add('small', MB)
+
+    assert admit_names(scheduler) == ['small']
+    assert admit_names(scheduler) == []  # Not next to a running job
+    scheduler.release(MB)
+    assert admit_names(scheduler) == ['huge']
+    scheduler.add('later', MB)
+    assert admit_names(scheduler) == []
+    scheduler.release(500 * MB)
+    assert admit_names(scheduler) == ['later']
+
+
+def test_oldest_job_is_reserved_after_max_skips():
+    scheduler = AdmissionScheduler(100 * MB, max_skips=2)
+    scheduler.add('large', 60 * MB)
+    scheduler.add('filler', 50 * MB)
+    assert admit_names(scheduler, 1) == ['filler']
+
+    # The filler skipped the large job once, one small job may still overtake it
+    for name in ('s1', 's2', 's3'):
+        scheduler.add(name, 10 * MB)
+    assert admit_names(scheduler) == ['s1']
+    assert admit_names(scheduler) == []  # Reserved: nothing overtakes the large job
+    for estimate in (50, 10):
+        scheduler.release(estimate * MB)
+    assert admit_names(scheduler) == ['large', 's2', 's3']
+
+
+def test_batch_stays_within_the_budget(tmp_path, monkeypatch):
+    converter = ImageToWebPConverter(tmp_path / 'source', tmp_path / 'result', tmp_path / 'failed',
+                                     workers=3, executor='thread', memory_budget_mb=100, quiet=True)
+    for index in range(6):
+        make_photo((160, 120), seed=index).save(tmp_path / 'source' / f"img{index}.png")
+    estimates = {f"img{index}.png": size * MB for index, size in enumerate((60, 30, 30, 150, 20, 40))}
+    monkeypatch.setattr(converter, 'estimate_memory', lambda path: estimates[path.name])
+
+    lock = threading.Lock()
+    running, peaks = [], []
+    convert_image = converter.convert_image
+
+    def tracked(path):
+        with lock:
+            running.append(estimates[path.name])
+            peaks.append((len(running), sum(running)))
+        try:
+            return convert_image(path)
+        finally:
+            with lock:
+                running.remove(estimates[path.name])
+
+    monkeypatch.setattr(converter, 'convert_image', tracked)
+    try:
+        assert converter.process_all_images() == (6, 0)
+    finally:
+        converter.shutdown()
+
+    # Only the oversized image ever exceeded the budget, and it ran alone
+    assert all(total <= 100 * MB or count == 1 for count, total in peaks)
+    assert (1, 150 * MB) in peaks
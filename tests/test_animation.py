@@ -0,0 +1,89 @@
+"""
+Tests for decoding animations: merging unchanged frames and snapping small changes.
+"""
+
+import io
+import random
+
+import pytest
+from PIL import Image, ImageChops, ImageDraw
+
+from conftest import make_photo
+from converter import AnimationFrames
+
+
+def make_animation(count=4, durations=None, repeat=()):
+    """
+    Lossless animated WebP: a square moving over a photo with +-1 of noise per frame.
+    Frames in repeat are the frame before them brightened by 1.
+    """
+    rng = random.Random(7)
+    base = make_photo((160, 120))
+    frames = []
+    for index in range(count):
+        if index in repeat:
+            frames.append(frames[-1].point(lambda value: min(value + 1, 255)))
+            continue
+        frame = base.point(lambda value: min(max(value + rng.randint(-1, 1), 0), 255))
+        ImageDraw.Draw(frame).rectangle((10 + index * 30, 10, 40 + index * 30, 40), fill='red')
+        frames.append(frame)
+    buffer = io.BytesIO()
+    frames[0].save(buffer, 'WEBP', save_all=True, append_images=frames[1:], lossless=True,
+                   duration=durations or 100, loop=2)
+    buffer.seek(0)
+    return Image.open(buffer)
+
+
+def assert_snapped(animation, threshold):
+    """
+    Between consecutive frames every pixel is either unchanged or changed by more than threshold.
+    """
+    for previous, frame in zip(animation.frames, animation.frames[1:]):
+        difference = ImageChops.difference(frame, previous)
+        largest = difference.split()[0]
+        for band in difference.split()[1:]:
+            largest = ImageChops.lighter(largest, band)
+        histogram = largest.histogram()
+        assert not any(histogram[1:threshold + 1])
+
+
+def test_unchanged_frames_are_merged_into_longer_ones():
+    img = make_animation(5, durations=[100, 50, 70, 100, 30], repeat=(1, 2))
+
+    animation = AnimationFrames.from_image(img, 3)
+
+    assert len(animation.frames) == 3 and animation.source_frames == 5
+    assert animation.durations == [220, 100, 30]
+    assert animation.loop == 2
+
+
+def test_small_changes_are_snapped_to_the_previous_frame():
+    animation = AnimationFrames.from_image(make_animation(), 3)
+
+    assert len(animation.frames) == 4
+    assert_snapped(animation, 3)
+    # Only the moving square is left to encode in later frames
+    bbox = ImageChops.difference(animation.frames[1], animation.frames[0]).getbbox(alpha_only=False)
+    assert bbox is not None and bbox[2] - bbox[0] <= 80 and bbox[3] - bbox[1] <= 40
+
+
+def test_resize_snaps_the_resized_frames_again():
+    animation = AnimationFrames.from_image(make_animation(), 3)
+
+    resized = animation.resize((80, 60))
+
+    assert resized.size == (80, 60) and resized.merge_threshold == 3
+    assert resized.durations == animation.durations and resized.source_frames == 4
+    assert_snapped(resized, 3)
+
+
+@pytest.mark.parametrize('limits', [{'max_frames': 3}, {'max_pixels': 160 * 120 * 3}])
+def test_oversized_animations_keep_only_the_first_frame(limits):
+    img = make_animation()
+
+    animation = AnimationFrames.from_image(img, 3, **limits)
+
+    assert AnimationFrames.too_large(img, **limits)
+    assert len(animation.frames) == 1 and animation.source_frames == 4
+    img.seek(0)
+    assert ImageChops.difference(animation.frames[0], img.convert('RGBA')).getbbox(alpha_only=False) is None
@@ -0,0 +1,58 @@
+"""
+Tests for the recursive one-shot batch command.
+"""
+
+import os
+import sys
+
+import converter as converter_module
+from conftest import make_photo
+from converter import ImageToWebPConverter
+
+
+def make_batch(tmp_path, **options):
+    output = tmp_path / 'out'
+    return ImageToWebPConverter(tmp_path / 'in', output, output / 'failedConvert', quiet=True, recursive=True,
+                                keep_originals=True, manifest_path=output / '.manifest.sqlite', **options)
+
+
+def test_changed_source_replaces_its_output(tmp_path):
+    source = tmp_path / 'in' / '2024' / 'photo.png'
+    source.parent.mkdir(parents=True)
+    make_photo((120, 90), seed=1).save(source)
+    converter = make_batch(tmp_path)
+    assert converter.process_all_images() == (1, 0)
+    first = (tmp_path / 'out' / '2024' / 'photo.webp').read_bytes()
+
+    make_photo((120, 90), seed=2).save(source)
+    os.utime(source, ns=(source.stat().st_atime_ns, source.stat().st_mtime_ns + 10 ** 9))
+    assert converter.process_all_images() == (1, 0)
+
+    assert sorted(p.name for p in (tmp_path / 'out' / '2024').iterdir()) == ['photo.webp']
+    assert (tmp_path / 'out' / '2024' / 'photo.webp').read_bytes() != first
+    assert source.exists()
+    converter.shutdown()
+
+
+def test_same_named_sources_still_get_numbered_outputs(tmp_path):
+    (tmp_path / 'in').mkdir()
+    make_photo((120, 90)).save(tmp_path / 'in' / 'photo.png')
+    make_photo((120, 90)).save(tmp_path / 'in' / 'photo.bmp')
+    converter = make_batch(tmp_path, workers=1)
+
+    assert converter.process_all_images() == (2, 0)
+
+    assert sorted(p.name for p in (tmp_path / 'out').glob('*.webp')) == ['photo.webp', 'photo_1.webp']
+    converter.shutdown()
+
+
+def test_dry_run_creates_nothing(tmp_path, monkeypatch, capsys):
+    (tmp_path / 'in').mkdir()
+    make_photo((120, 90)).save(tmp_path / 'in' / 'photo.png')
+    monkeypatch.setattr(sys, 'argv', ['converter.py', 'batch', str(tmp_path / 'in'), str(tmp_path / 'out'),
+                                      '--dry-run'])
+
+    converter_module.main()
+
+    assert not (tmp_path / 'out').exists()
+    assert '[dry-run] 1 image(s)' in capsys.readouterr().out
@@ -0,0 +1,61 @@
+"""
+Tests for the command line options reaching the converter.
+"""
+
+import sys
+
+import pytest
+
+import converter as converter_module
+
+
+class RecordingConverter:
+    """
+    Stands in for ImageToWebPConverter and records how main() set it up.
+    """
+
+    last = None
+
+    def __init__(self, **options):
+        self.options = options
+        RecordingConverter.last = self
+
+    def run(self, dry_run=False):
+        pass
+
+    def run_continuous(self, check_interval=2):
+        pass
+
+
+def run_main(monkeypatch, argv):
+    monkeypatch.setattr(converter_module, 'ImageToWebPConverter', RecordingConverter)
+    monkeypatch.setattr(sys, 'argv', ['converter.py'] + argv)
+    converter_module.main()
+    return RecordingConverter.last
+
+
+@pytest.mark.parametrize('argv', [
+    ['--thumbnails'],
+    ['--thumbnails', 'batch', 'in', 'out'],
+    ['batch', 'in', 'out', '--thumbnails'],
+])
+def test_thumbnails_reach_the_converter(monkeypatch, argv):
+    assert run_main(monkeypatch, argv).options['renditions'] == converter_module.THUMBNAIL_RENDITIONS
+
+
+@pytest.mark.parametrize('argv', [[], ['batch', 'in', 'out']])
+def test_no_thumbnails_by_default(monkeypatch, argv):
+    assert run_main(monkeypatch, argv).options['renditions'] is None
+
+
+@pytest.mark.parametrize('argv', [
+    ['--min-ssim', '0.9'],
+    ['--min-ssim', '0.9', 'batch', 'in', 'out'],
+    ['batch', 'in', 'out', '--min-ssim', '0.9'],
+])
+def test_min_ssim_reaches_the_converter(monkeypatch, argv):
+    assert run_main(monkeypatch, argv).min_ssim == 0.9
+
+
+def test_min_ssim_is_off_by_default(monkeypatch):
+    assert run_main(monkeypatch, ['batch', 'in', 'out']).min_ssim is None
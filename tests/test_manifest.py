@@ -0,0 +1,72 @@
+"""
+Tests for the crash-safe job manifest and recovery.
+"""
+
+import shutil
+
+from conftest import make_photo
+from converter import ConversionManifest, ImageToWebPConverter
+
+
+def make_converter(tmp_path, **options):
+    return ImageToWebPConverter(tmp_path / 'source', tmp_path / 'result', tmp_path / 'failed', quiet=True,
+                                manifest_path=tmp_path / 'manifest.sqlite', **options)
+
+
+def test_done_only_for_unchanged_source(tmp_path):
+    source = tmp_path / 'a.jpg'
+    source.write_bytes(b'one')
+    manifest = ConversionManifest(tmp_path / 'manifest.sqlite')
+
+    manifest.mark(source, 'started', source.stat())
+    assert not manifest.is_done(source, source.stat())
+    manifest.mark(source, 'done')
+    assert manifest.is_done(source, source.stat())
+
+    source.write_bytes(b'changed')
+    assert not manifest.is_done(source, source.stat())
+    assert manifest.unfinished() == []
+
+
+def test_recovery_finishes_written_jobs_and_removes_temp_files(tmp_path):
+    converter = make_converter(tmp_path)
+    written, writing = tmp_path / 'source' / 'written.jpg', tmp_path / 'source' / 'writing.jpg'
+    for path in (written, writing):
+        path.write_bytes(b'data')
+    output, temp = tmp_path / 'result' / 'written.webp', tmp_path / 'result' / '.writing.webp.tmp'
+    output.write_bytes(b'RIFF')
+    temp.write_bytes(b'RIFF')
+    converter.manifest.mark(written, 'started', written.stat())
+    converter.manifest.mark(written, 'written', output=output)
+    converter.manifest.mark(writing, 'started', writing.stat())
+    converter.manifest.mark(writing, 'writing', output=temp)
+
+    assert converter.recover_interrupted() == 2
+
+    assert not written.exists() and output.exists()   # Only the source deletion was lost
+    assert writing.exists() and not temp.exists()     # Converted again on the next pass
+    assert converter.manifest.unfinished() == []
+    converter.shutdown()
+
+
+def test_redropped_identical_file_is_converted_again(tmp_path):
+    converter = make_converter(tmp_path)
+    source = tmp_path / 'source' / 'photo.png'
+    make_photo((120, 90)).save(source)
+    shutil.copy2(source, tmp_path / 'copy.png')
+
+    assert converter.process_all_images() == (1, 0)
+    shutil.copy2(tmp_path / 'copy.png', source)  # Same size and mtime as the converted file
+
+    assert converter.process_all_images() == (1, 0)
+    assert not source.exists()
+    converter.shutdown()
+
+
+def test_kept_originals_are_not_converted_twice(tmp_path):
+    converter = make_converter(tmp_path, keep_originals=True)
+    make_photo((120, 90)).save(tmp_path / 'source' / 'photo.png')
+
+    assert converter.process_all_images() == (1, 0)
+    assert converter.process_all_images() == (0, 0)
+    converter.shutdown()
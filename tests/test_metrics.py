@@ -0,0 +1,71 @@
+"""
+Tests for the JSON-lines events and the Prometheus export.
+"""
+
+import json
+import urllib.request
+from pathlib import Path
+
+from conftest import make_photo
+from converter import ConversionMetrics, ImageToWebPConverter
+
+SUCCESS = {
+    'source_size': 4096, 'final_size_kb': 2.0, 'attempts': 3, 'quality': 70, 'resize_scale': 100,
+    'timings': {'decode': 0.01, 'encode': 0.2, 'total': 0.25},
+}
+
+
+def test_events_and_counters(tmp_path):
+    metrics = ConversionMetrics(tmp_path / 'events.jsonl', tmp_path / 'metrics.prom')
+    metrics.record(Path('a.png'), True, SUCCESS, 1)
+    metrics.record(Path('b.png'), False, {'error': 'broken', 'source_size': 100, 'timings': {'total': 0.1}}, 1)
+    metrics.record(Path('c.png'), True, dict(SUCCESS, cache_hit=True), 1)
+    metrics.close()
+
+    events = [json.loads(line) for line in (tmp_path / 'events.jsonl').read_text().splitlines()]
+    assert [event['success'] for event in events] == [True, False, True]
+    assert events[0]['bytes_out'] == 2048 and events[0]['stages']['encode'] == 0.2
+    assert events[1]['error'] == 'broken' and events[1]['bytes_out'] is None
+
+    text = (tmp_path / 'metrics.prom').read_text()
+    assert 'webp_converter_images_total{result="success"} 2' in text
+    assert 'webp_converter_images_total{result="failed"} 1' in text
+    assert 'webp_converter_bytes_in_total 8292' in text
+    assert 'webp_converter_encode_attempts_total 3' in text  # Cache hits encode nothing
+    assert 'webp_converter_cache_hits_total 1' in text
+    assert 'webp_converter_over_budget_total 2' in text
+    assert 'webp_converter_stage_seconds_count{stage="total"} 3' in text
+    assert 'webp_converter_stage_seconds{stage="encode",quantile="0.5"} 0.200000' in text
+
+
+def test_gauges_and_http_endpoint(tmp_path):
+    metrics = ConversionMetrics(http_port=0)
+    try:
+        metrics.set_gauge('queue_depth', 5, 'Images waiting for admission.')
+        port = metrics._server.server_port
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics") as response:
+            text = response.read().decode()
+    finally:
+        metrics.close()
+
+    assert '# TYPE webp_converter_queue_depth gauge' in text
+    assert 'webp_converter_queue_depth 5' in text
+
+
+def test_batch_writes_one_event_per_image_quietly(tmp_path, capsys):
+    converter = ImageToWebPConverter(tmp_path / 'source', tmp_path / 'result', tmp_path / 'failed', workers=1,
+                                     quiet=True, metrics_log=tmp_path / 'events.jsonl',
+                                     metrics_file=tmp_path / 'metrics.prom')
+    make_photo().save(tmp_path / 'source' / 'a.png')
+    (tmp_path / 'source' / 'b.png').write_bytes(b'not an image')
+    try:
+        assert converter.process_all_images() == (1, 1)
+    finally:
+        converter.shutdown()
+
+    events = [json.loads(line) for line in (tmp_path / 'events.jsonl').read_text().splitlines()]
+    assert sorted((Path(event['file']).name, event['success']) for event in events) == [('a.png', True),
+                                                                                         ('b.png', False)]
+    assert {'decode', 'encode', 'write', 'total'} <= set(events[0]['stages']) | set(events[1]['stages'])
+    assert 'webp_converter_images_total{result="success"} 1' in (tmp_path / 'metrics.prom').read_text()
+    assert capsys.readouterr().out == ''
@@ -0,0 +1,76 @@
+"""
+Tests for the streaming read/decode/encode/commit pipeline.
+"""
+
+import threading
+
+import pytest
+
+from conftest import make_photo
+from converter import ImageToWebPConverter
+
+
+def make_sources(folder, count):
+    folder.mkdir(parents=True, exist_ok=True)
+    paths = []
+    for index in range(count):
+        path = folder / f"img{index}.png"
+        make_photo((160, 120), seed=index).save(path)
+        paths.append(path)
+    return paths
+
+
+@pytest.mark.parametrize('executor', ['thread', 'process'])
+def test_pipeline_converts_every_image(tmp_path, executor):
+    converter = ImageToWebPConverter(tmp_path / 'source', tmp_path / 'result', tmp_path / 'failed',
+                                     workers=2, executor=executor, pipeline=True, quiet=True)
+    sources = make_sources(tmp_path / 'source', 4)
+    try:
+        results = list(converter.convert_images(sources))
+    finally:
+        converter.shutdown()
+
+    assert sorted(path.name for path, success, _, _ in results if success) == sorted(p.name for p in sources)
+    assert all(stats['final_size_kb'] > 0 for _, _, _, stats in results)
+    assert len(list((tmp_path / 'result').rglob('*.webp'))) == 4
+    assert not any(path.exists() for path in sources)
+
+
+def test_abandoned_pipeline_stops_its_threads(tmp_path):
+    converter = ImageToWebPConverter(tmp_path / 'source', tmp_path / 'result', tmp_path / 'failed',
+                                     workers=2, executor='thread', pipeline=True, pipeline_depth=1, quiet=True)
+    sources = make_sources(tmp_path / 'source', 8)
+    before = threading.active_count()
+
+    results = converter.convert_images(sources)
+    next(results)
+    results.close()
+
+    assert threading.active_count() == before
+    converter.shutdown()
+
+
+class CommitRecorder(ImageToWebPConverter):
+    """
+    Records which jobs still hold their prefetched source bytes when committed.
+    """
+
+    committed = []
+
+    def commit_output(self, job):
+        CommitRecorder.committed.append('source' in job)
+        super().commit_output(job)
+
+
+def test_process_pipeline_drops_prefetched_bytes_before_commit(tmp_path):
+    converter = CommitRecorder(tmp_path / 'source', tmp_path / 'result', tmp_path / 'failed',
+                               workers=2, executor='process', pipeline=True, quiet=True)
+    sources = make_sources(tmp_path / 'source', 4)
+    CommitRecorder.committed = []
+    try:
+        results = list(converter.convert_images(sources))
+    finally:
+        converter.shutdown()
+
+    assert all(success for _, success, _, _ in results)
+    assert CommitRecorder.committed == [False] * 4
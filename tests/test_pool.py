@@ -0,0 +1,117 @@
+"""
+Tests for parallel conversion on the worker pool.
+"""
+
+import os
+import pickle
+from concurrent.futures import ProcessPoolExecutor
+
+import pytest
+
+from conftest import make_photo
+from converter import ImageToWebPConverter
+
+
+class CrashingConverter(ImageToWebPConverter):
+    """
+    Kills its worker process on any file named crash*, like a decoder segfault would.
+    """
+
+    def decode_source(self, job):
+        if job['path'].name.startswith('crash'):
+            os._exit(1)
+        super().decode_source(job)
+
+
+def make_sources(folder, names):
+    folder.mkdir(parents=True, exist_ok=True)
+    for index, name in enumerate(names):
+        make_photo((120, 90), seed=index).save(folder / name)
+    return [folder / name for name in names]
+
+
+@pytest.mark.parametrize('executor', ['thread', 'process'])
+def test_results_come_back_in_input_order(tmp_path, executor):
+    converter = ImageToWebPConverter(tmp_path / 'source', tmp_path / 'result', tmp_path / 'failed',
+                                     workers=2, executor=executor, quiet=True)
+    sources = make_sources(tmp_path / 'source', [f"p{index}.png" for index in range(6)])
+    try:
+        results = list(converter.convert_images(sources))
+    finally:
+        converter.shutdown()
+
+    assert [path for path, _, _, _ in results] == sources
+    assert all(success for _, success, _, _ in results)
+    assert len(list((tmp_path / 'result').rglob('*.webp'))) == 6
+
+
+@pytest.mark.parametrize('options', [{}, {'memory_budget_mb': 512}, {'pipeline': True}])
+def test_dead_worker_only_fails_its_own_file(tmp_path, options):
+    converter = CrashingConverter(tmp_path / 'source', tmp_path / 'result', tmp_path / 'failed',
+                                  workers=2, executor='process', quiet=True, **options)
+    make_sources(tmp_path / 'source', ['p0.png', 'p1.png', 'crash.png', 'p3.png', 'p4.png'])
+    try:
+        assert converter.process_all_images() == (4, 1)
+        assert [path.name for path in (tmp_path / 'failed').iterdir()] == ['crash.png']
+        assert len(list((tmp_path / 'result').rglob('*.webp'))) == 4
+
+        # The next batch runs on a fresh pool
+        make_sources(tmp_path / 'source', ['p5.png'])
+        assert converter.process_all_images() == (1, 0)
+    finally:
+        converter.shutdown()
+
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_each_file_block_starts_with_the_separator(tmp_path, capsys, workers):
+    converter = ImageToWebPConverter(tmp_path / 'source', tmp_path / 'result', tmp_path / 'failed',
+                                     workers=workers, executor='thread')
+    make_sources(tmp_path / 'source', ['a.png'])
+    (tmp_path / 'source' / 'b.png').write_bytes(b'not an image')
+    capsys.readouterr()
+    try:
+        converter.process_images(sorted((tmp_path / 'source').iterdir()))
+    finally:
+        converter.shutdown()
+
+    first, second = capsys.readouterr().out.split('-' * 60 + '\n')[:2]
+    assert first.split('\n')[1:4] == ['Found 2 image(s) to convert.', '=' * 60, '']
+    assert 'a.png' in first.split('\n')[4]
+    lines = second.rstrip('\n').split('\n')
+    assert lines[0] == '' and 'b.png' in lines[1]
+    assert 'Error converting b.png' in lines[-2] and 'failedConvert' in lines[-1]
+
+
+def test_process_jobs_do_not_carry_the_converter(tmp_path, monkeypatch):
+    payloads = []
+    submit = ProcessPoolExecutor.submit
+
+    def recording_submit(pool, function, *args, **kwargs):
+        payloads.append(len(pickle.dumps(args)))
+        return submit(pool, function, *args, **kwargs)
+
+    monkeypatch.setattr(ProcessPoolExecutor, 'submit', recording_submit)
+    converter = ImageToWebPConverter(tmp_path / 'source', tmp_path / 'result', tmp_path / 'failed',
+                                     workers=2, executor='process', quiet=True)
+    converter.effort_log.extend(('x.jpg', 1.0, 1.0) for _ in range(1000))
+    make_sources(tmp_path / 'source', [f"p{index}.png" for index in range(3)])
+    try:
+        assert converter.process_all_images() == (3, 0)
+    finally:
+        converter.shutdown()
+
+    assert len(payloads) == 3 and max(payloads) < 1000
+
+
+def test_changed_settings_restart_the_worker_processes(tmp_path):
+    converter = ImageToWebPConverter(tmp_path / 'source', tmp_path / 'result', tmp_path / 'failed',
+                                     workers=2, executor='process', quiet=True)
+    try:
+        pool = converter.get_pool()
+        converter.effort_ratio = 0.9  # Sent with every job
+        assert converter.get_pool() is pool
+
+        converter.max_output_size_kb = 100
+        assert converter.get_pool() is not pool
+    finally:
+        converter.shutdown()
@@ -0,0 +1,67 @@
+"""
+Tests for the learned starting quality/scale.
+"""
+
+from conftest import NO_METADATA, make_photo
+from converter import QualityPredictor
+
+
+class FixedPredictor:
+    """
+    Predictor stand-in that always predicts the same start.
+    """
+
+    def __init__(self, quality, scale):
+        self.prediction = (quality, scale)
+
+    def predict(self, features):
+        return self.prediction
+
+    def output_bytes_per_pixel(self):
+        return None
+
+
+def test_learned_start_can_move_up(converter, photo):
+    converter.auto_lossless = False
+    converter.predictor = FixedPredictor(40, 100)
+    max_kb = len(converter.encode_webp(photo, 80, NO_METADATA)) // 1024
+
+    _, stats = converter.encode_within_budget(photo, NO_METADATA, 1.0, features=[0.0], max_kb=max_kb)
+
+    assert stats['quality'] > 40
+
+
+def test_learned_scale_can_move_up(converter):
+    converter.auto_lossless = False
+    converter.predictor = FixedPredictor(60, 50)
+    img = make_photo((800, 600))
+
+    _, stats = converter.encode_within_budget(img, NO_METADATA, 1.0, features=[0.0], max_kb=500)
+
+    assert stats['resize_scale'] > 50
+
+
+def test_predicts_weighted_neighbour_outcome(tmp_path):
+    predictor = QualityPredictor(tmp_path / 'model.json', min_records=2)
+    assert predictor.predict([0.0]) is None
+
+    for quality, scale in ((60, 50), (62, 50), (64, 50)):
+        predictor.add([0.0], {'quality': quality, 'resize_scale': scale, 'attempts': 2, 'final_size_kb': 100},
+                      100000)
+    predictor.save()
+
+    reloaded = QualityPredictor(tmp_path / 'model.json', min_records=2)
+    assert reloaded.predict([0.0]) == (62, 50)
+
+
+def test_reload_picks_up_records_saved_elsewhere(tmp_path):
+    worker = QualityPredictor(tmp_path / 'model.json')
+    main = QualityPredictor(tmp_path / 'model.json')
+    main.add([0.0], {'quality': 60, 'resize_scale': 50, 'attempts': 2, 'final_size_kb': 100}, 100000)
+
+    worker.reload()
+    assert worker.records == []
+
+    main.save()
+    worker.reload()
+    assert worker.records == main.records
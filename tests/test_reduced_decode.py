@@ -0,0 +1,44 @@
+"""
+Tests for JPEG reduced (DCT-scaled) decoding.
+"""
+
+import io
+
+import pytest
+from PIL import Image
+
+from conftest import make_photo
+
+
+def open_jpeg(size=(800, 600)):
+    buffer = io.BytesIO()
+    make_photo(size).save(buffer, 'JPEG', quality=90)
+    buffer.seek(0)
+    return Image.open(buffer)
+
+
+@pytest.mark.parametrize('scale, expected', [
+    (100, (800, 600)),
+    (60, (800, 600)),   # 1/2 would be smaller than the planned size
+    (50, (400, 300)),
+    (40, (400, 300)),
+    (20, (200, 150)),
+    (10, (100, 75)),
+])
+def test_picks_smallest_dct_step_covering_the_planned_size(converter, scale, expected):
+    img = open_jpeg()
+
+    reduced = converter.apply_reduced_decode(img, scale)
+
+    img.load()
+    assert img.size == expected
+    assert reduced == (expected != (800, 600))
+
+
+def test_other_formats_are_decoded_in_full(converter):
+    buffer = io.BytesIO()
+    make_photo((800, 600)).save(buffer, 'PNG')
+    img = Image.open(buffer)
+
+    assert converter.apply_reduced_decode(img, 10) is False
+    assert img.size == (800, 600)
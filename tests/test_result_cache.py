@@ -0,0 +1,63 @@
+"""
+Tests for the content-hash result cache and its keys.
+"""
+
+import pytest
+
+from conftest import make_photo
+from converter import ImageToWebPConverter, ResultCache
+
+
+@pytest.mark.parametrize('name, value', [
+    ('quality_doubling_step', 20),
+    ('webp_alpha_quality', 90),
+    ('max_output_size_kb', 100),
+    ('min_quality', 30),
+])
+def test_settings_that_change_the_output_change_the_key(converter, tmp_path, name, value):
+    cache = ResultCache(tmp_path / 'cache')
+    before = cache.make_key(b'image', converter.cache_settings())
+
+    setattr(converter, name, value)
+
+    assert cache.make_key(b'image', converter.cache_settings()) != before
+
+
+def test_effort_ratio_is_keyed_only_for_two_phase_searches(converter, tmp_path):
+    cache = ResultCache(tmp_path / 'cache')
+    before = cache.make_key(b'image', converter.cache_settings())
+    converter.effort_ratio = 0.9
+    assert cache.make_key(b'image', converter.cache_settings()) == before
+
+    converter.search_method = 2
+    two_phase = cache.make_key(b'image', converter.cache_settings())
+    converter.effort_ratio = 0.8
+    assert cache.make_key(b'image', converter.cache_settings()) != two_phase
+
+
+def test_put_get_round_trip(tmp_path):
+    cache = ResultCache(tmp_path / 'cache')
+    key = cache.make_key(b'image', {'version': 1})
+
+    assert cache.get(key) is None
+    cache.put(key, b'RIFF', {'quality': 70})
+
+    assert cache.get(key) == (b'RIFF', {'quality': 70})
+
+
+@pytest.mark.parametrize('executor', ['thread', 'process'])
+def test_cache_stays_within_its_size_with_worker_processes(tmp_path, executor):
+    converter = ImageToWebPConverter(tmp_path / 'source', tmp_path / 'result', tmp_path / 'failed', workers=2,
+                                     executor=executor, cache_folder=tmp_path / 'cache', cache_size_mb=0.02,
+                                     quiet=True)
+    converter.auto_lossless = False
+    for index in range(8):
+        make_photo((320, 240), seed=index).save(tmp_path / 'source' / f"img{index}.png")
+    try:
+        assert converter.process_all_images() == (8, 0)
+    finally:
+        converter.shutdown()
+
+    stored = sum(path.stat().st_size for path in (tmp_path / 'cache').glob('*.webp'))
+    assert 0 < stored <= 0.02 * 1024 * 1024
+    assert converter.result_cache._size_bytes == stored
@@ -0,0 +1,97 @@
+"""
+Tests for the in-memory quality search and the budget loop around it.
+"""
+
+import io
+
+import pytest
+from PIL import Image
+
+from conftest import NO_METADATA, make_photo
+from converter import ResizePyramid
+
+
+def test_search_brackets_highest_fitting_quality(converter, photo):
+    budget = len(converter.encode_webp(photo, 60, NO_METADATA))
+
+    quality, data, _, _, attempts = converter.search_quality(photo, NO_METADATA, budget, 90, 10)
+
+    assert len(data) <= budget
+    assert data == converter.encode_webp(photo, quality, NO_METADATA)
+    assert 60 - converter.quality_tolerance <= quality <= 60 + converter.quality_tolerance
+    assert attempts < 10
+
+
+def test_search_stops_when_start_quality_fits(converter, photo):
+    budget = len(converter.encode_webp(photo, 95, NO_METADATA))
+
+    quality, data, _, _, attempts = converter.search_quality(photo, NO_METADATA, budget, 70, 10)
+
+    assert (quality, attempts) == (70, 1)
+    assert len(data) <= budget
+
+
+def test_search_reports_smallest_encode_when_nothing_fits(converter, photo):
+    quality, data, smallest_quality, smallest_data, _ = converter.search_quality(photo, NO_METADATA, 100, 70, 10)
+
+    assert quality is None and data is None
+    assert smallest_data == converter.encode_webp(photo, smallest_quality, NO_METADATA)
+    assert len(smallest_data) > 100
+
+
+def test_budget_stats_describe_the_kept_encode_when_nothing_fits(converter):
+    converter.auto_lossless = False
+    img = make_photo((1200, 900))
+    pyramid = ResizePyramid(img)
+
+    data, stats = converter.encode_within_budget(img, NO_METADATA, 1.0, pyramid=pyramid, max_kb=1)
+
+    with Image.open(io.BytesIO(data)) as decoded:
+        assert list(decoded.size) == stats['dimensions']
+    kept = pyramid.resize(tuple(stats['dimensions']))
+    assert data == converter.encode_webp(kept, stats['quality'], NO_METADATA)
+
+
+def test_variants_are_retried_after_a_resize(converter, photo, monkeypatch):
+    encode_webp = converter.encode_webp
+    variant_sizes = []
+
+    def fake_encode(img, quality, metadata, method=6, encoding='lossy'):
+        if encoding == 'lossy':
+            return encode_webp(img, quality, metadata, method, encoding)
+        variant_sizes.append(img.size)
+        # Lossless only fits once the image has been downscaled
+        return b'RIFF' + b'\0' * (10 if img.width < photo.width else 10 ** 6)
+
+    monkeypatch.setattr(converter, 'encode_webp', fake_encode)
+    content = {'kind': 'graphic', 'encodings': ['lossy', 'lossless']}
+
+    _, stats = converter.encode_within_budget(photo, NO_METADATA, 0.1, max_kb=1, content=content)
+
+    assert variant_sizes[0] == photo.size and len(variant_sizes) == 2
+    assert stats['encoding'] == 'lossless'
+    assert tuple(stats['dimensions']) == variant_sizes[1]
+
+
+@pytest.mark.parametrize('encoding', ['near_lossless', 'palette'])
+def test_variants_accept_grey_images_with_alpha(converter, monkeypatch, encoding):
+    grey = make_photo((160, 120)).convert('L')
+    alpha = Image.linear_gradient('L').resize((160, 120))
+    Image.merge('LA', (grey, alpha)).save(converter.source_folder / 'grey.png')
+    tried = []
+    encode_webp = converter.encode_webp
+
+    def record_encode(img, quality, metadata, method=6, encoding='lossy'):
+        tried.append(encoding)
+        return encode_webp(img, quality, metadata, method, encoding)
+
+    analyse_content = converter.analyse_content
+    monkeypatch.setattr(converter, 'encode_webp', record_encode)
+    monkeypatch.setattr(converter, 'analyse_content',
+                        lambda img: dict(analyse_content(img), kind='graphic', encodings=['lossy', encoding]))
+
+    assert converter.process_all_images() == (1, 0)
+    assert encoding in tried
+    output, = converter.result_folder.rglob('grey.webp')
+    with Image.open(output) as decoded:
+        assert decoded.mode == 'RGBA'
@@ -0,0 +1,57 @@
+"""
+Tests for the in-memory conversion API and the local conversion service.
+"""
+
+import io
+import pickle
+
+import pytest
+from PIL import Image
+
+from conftest import make_photo
+from converter import ConversionService, ImageToWebPConverter, _convert_bytes_worker, _init_worker
+
+
+def png_bytes(size=(200, 150)):
+    buffer = io.BytesIO()
+    make_photo(size).save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+def test_worker_settings_leave_out_main_process_state(tmp_path):
+    converter = ImageToWebPConverter(tmp_path / 'source', tmp_path / 'result', tmp_path / 'failed', quiet=True,
+                                     manifest_path=tmp_path / 'manifest.sqlite')
+    converter.effort_log.extend(('x.jpg', 1.0, 1.0) for _ in range(1000))
+
+    settings = converter.worker_settings()
+
+    assert not settings['effort_log'] and settings['_pool'] is None and settings['metrics'] is None
+    assert settings['manifest'] is not None  # Batch workers journal their conversions
+    assert settings['max_output_size_kb'] == converter.max_output_size_kb
+    assert len(pickle.dumps(settings)) < len(pickle.dumps(converter))
+    assert converter.manifest is not None and len(converter.effort_log) == 1000
+    converter.shutdown()
+
+
+def test_installed_settings_convert_requests(converter):
+    _init_worker(type(converter), converter.worker_settings())
+
+    webp, stats = _convert_bytes_worker(None, png_bytes(), 'upload.png', 0.9)
+
+    assert webp[:4] == b'RIFF' and stats['final_size_kb'] <= converter.max_output_size_kb
+
+
+@pytest.mark.parametrize('executor', ['thread', 'process'])
+def test_service_converts_on_warm_pool(tmp_path, executor):
+    converter = ImageToWebPConverter(tmp_path / 'source', tmp_path / 'result', tmp_path / 'failed',
+                                     workers=2, executor=executor, quiet=True)
+    service = ConversionService(converter, port=0)
+    try:
+        assert service.warm_up() >= 1
+        webp, stats = service.convert(png_bytes(), 'upload.png')
+    finally:
+        service.close()
+
+    with Image.open(io.BytesIO(webp)) as decoded:
+        assert decoded.format == 'WEBP' and decoded.size == (200, 150)
+    assert service.requests == 1
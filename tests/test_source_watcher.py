@@ -0,0 +1,82 @@
+"""
+Tests for the source folder watcher (inotify and polling).
+"""
+
+import time
+
+import pytest
+
+from converter import SourceWatcher
+
+SETTLE = 0.2
+
+
+@pytest.fixture(params=['inotify', 'polling'])
+def watch(request, tmp_path):
+    """
+    Factory for a watcher on tmp_path in the requested mode, closed after the test.
+    """
+    watchers = []
+
+    def start():
+        watcher = SourceWatcher(tmp_path, lambda path: path.suffix == '.png', settle_time=SETTLE,
+                                poll_interval=0.05, use_inotify=request.param == 'inotify')
+        if watcher.mode != request.param:
+            pytest.skip('inotify is not available here')
+        watchers.append(watcher)
+        return watcher
+
+    yield start
+    for watcher in watchers:
+        watcher.close()
+
+
+def collect(watcher, seconds):
+    ready = []
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        ready += watcher.wait(0.05)
+    return [path.name for path in ready]
+
+
+def test_existing_files_are_reported_once_settled(tmp_path, watch):
+    (tmp_path / 'old.png').write_bytes(b'x' * 10)
+    (tmp_path / 'notes.txt').write_bytes(b'x')
+    watcher = watch()
+
+    assert watcher.wait(0) == []
+    assert collect(watcher, SETTLE * 3) == ['old.png']
+
+
+def test_files_still_being_written_wait_until_they_settle(tmp_path, watch):
+    watcher = watch()
+    path = tmp_path / 'copying.png'
+    started = time.monotonic()
+    with open(path, 'wb') as f:
+        while time.monotonic() - started < SETTLE * 3:
+            f.write(b'x' * 100)
+            f.flush()
+            assert 'copying.png' not in [p.name for p in watcher.wait(0.03)]
+
+    assert collect(watcher, SETTLE * 3) == ['copying.png']
+
+
+def test_reported_files_are_not_dispatched_again(tmp_path, watch):
+    watcher = watch()
+    (tmp_path / 'a.png').write_bytes(b'x' * 10)
+    assert collect(watcher, SETTLE * 3) == ['a.png']
+
+    # Still in the folder (e.g. a conversion in progress): not reported again
+    assert collect(watcher, SETTLE * 3) == []
+
+
+def test_dropping_a_file_again_reports_it_again(tmp_path, watch):
+    watcher = watch()
+    path = tmp_path / 'a.png'
+    path.write_bytes(b'x' * 10)
+    assert collect(watcher, SETTLE * 3) == ['a.png']
+
+    path.unlink()
+    path.write_bytes(b'y' * 20)
+
+    assert collect(watcher, SETTLE * 3) == ['a.png']
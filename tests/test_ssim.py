@@ -0,0 +1,75 @@
+"""
+Tests for the NumPy SSIM used by the perceptual quality floor.
+"""
+
+import io
+
+import pytest
+from PIL import Image, ImageFilter
+
+from conftest import make_photo
+
+np = pytest.importorskip('numpy')
+
+from converter import _ssim_luma, structural_similarity  # noqa: E402
+
+
+def luma(img):
+    return _ssim_luma(img)
+
+
+def naive_ssim(x, y, window=7):
+    """
+    Straightforward per-window SSIM with the same constants and uniform window.
+    """
+    c1, c2 = (0.01 * 255) ** 2, (0.03 * 255) ** 2
+    x, y = x.astype(np.float64), y.astype(np.float64)
+    scores = []
+    for top in range(x.shape[0] - window + 1):
+        for left in range(x.shape[1] - window + 1):
+            a = x[top:top + window, left:left + window]
+            b = y[top:top + window, left:left + window]
+            covariance = (a * b).mean() - a.mean() * b.mean()
+            scores.append((2 * a.mean() * b.mean() + c1) * (2 * covariance + c2)
+                          / ((a.mean() ** 2 + b.mean() ** 2 + c1) * (a.var() + b.var() + c2)))
+    return float(np.mean(scores))
+
+
+def test_identical_images_score_one():
+    reference = luma(make_photo((64, 48)))
+    assert structural_similarity(reference, reference) == pytest.approx(1.0)
+
+
+def test_matches_the_per_window_definition():
+    reference = luma(make_photo((40, 30)))
+    candidate = luma(make_photo((40, 30)).filter(ImageFilter.GaussianBlur(1.5)))
+
+    assert structural_similarity(reference, candidate) == pytest.approx(naive_ssim(reference, candidate), abs=1e-9)
+
+
+def test_banding_does_not_change_the_score():
+    reference = luma(make_photo((120, 90)))
+    candidate = luma(make_photo((120, 90), seed=2))
+
+    assert structural_similarity(reference, candidate, band_rows=7) == \
+        pytest.approx(structural_similarity(reference, candidate, band_rows=1000), abs=1e-12)
+
+
+def test_score_drops_with_encoding_quality():
+    img = make_photo((160, 120))
+    reference = luma(img)
+    scores = []
+    for quality in (90, 50, 5):
+        buffer = io.BytesIO()
+        img.save(buffer, 'WEBP', quality=quality)
+        with Image.open(buffer) as decoded:
+            scores.append(structural_similarity(reference, luma(decoded)))
+
+    assert 1.0 > scores[0] > scores[1] > scores[2]
+
+
+def test_transparent_pixels_do_not_count():
+    opaque = Image.new('RGBA', (32, 32), (255, 0, 0, 0))
+    other = Image.new('RGBA', (32, 32), (0, 255, 0, 0))
+
+    assert structural_similarity(luma(opaque), luma(other)) == pytest.approx(1.0)
@@ -0,0 +1,69 @@
+"""
+Tests for band-by-band TIFF decoding of oversized sources.
+"""
+
+import io
+
+import pytest
+from PIL import Image, ImageChops, ImageStat
+
+from conftest import make_photo
+from converter import TiffBandReader
+
+
+def open_tiff(img, **options):
+    buffer = io.BytesIO()
+    img.save(buffer, 'TIFF', **options)
+    buffer.seek(0)
+    return Image.open(buffer), buffer
+
+
+@pytest.mark.parametrize('mode', ['RGB', 'RGBA', 'L', 'P'])
+@pytest.mark.parametrize('compression', ['raw', 'tiff_lzw', 'tiff_adobe_deflate'])
+def test_bands_match_full_decode(mode, compression):
+    source = make_photo((300, 200))
+    source = source.quantize(64) if mode == 'P' else source.convert(mode)
+    img, buffer = open_tiff(source, compression=compression)
+    reader = TiffBandReader(img, max_rows=64)
+    assert TiffBandReader.supports(img)
+
+    bands = list(reader.bands())
+
+    assert max(band.height for band in bands) <= max(reader.band_rows, 64)
+    assert sum(band.height for band in bands) == 200
+    assembled = Image.new(bands[0].mode, (300, 200))
+    top = 0
+    for band in bands:
+        assembled.paste(band, (0, top))
+        top += band.height
+    full = Image.open(buffer)
+    full.load()
+    if mode == 'P':
+        assembled.putpalette(bands[0].getpalette())
+        assembled, full = assembled.convert('RGB'), full.convert('RGB')
+    assert ImageChops.difference(assembled, full).getbbox() is None
+
+
+def test_stream_decode_matches_resized_full_decode(converter):
+    source = make_photo((640, 480))
+    img, _ = open_tiff(source, compression='tiff_lzw')
+
+    streamed = converter.stream_decode(img, (200, 150))
+
+    expected = source.resize((200, 150), Image.Resampling.LANCZOS)
+    assert streamed.size == (200, 150) and streamed.mode == 'RGB'
+    assert max(ImageStat.Stat(ImageChops.difference(streamed, expected)).mean) < 4
+
+
+def test_bomb_check_is_bypassed_only_for_streamed_tiffs(converter, monkeypatch):
+    _, buffer = open_tiff(make_photo((800, 600)), compression='tiff_lzw')
+    monkeypatch.setattr(Image, 'MAX_IMAGE_PIXELS', 10000)
+
+    # Full budget: the whole image would be decoded, so the limit applies
+    with pytest.raises(Image.DecompressionBombError):
+        converter.open_source(io.BytesIO(buffer.getvalue()))
+
+    # A budget that keeps less than half of each side streams it band by band
+    converter.max_output_size_kb = 1
+    with converter.open_source(io.BytesIO(buffer.getvalue())) as img:
+        assert converter.streamed_size(img) is not None
@@ -0,0 +1,55 @@
+"""
+Tests for two-phase encoder effort: fast search encodes, calibrated method-6 final.
+"""
+
+from pathlib import Path
+
+import pytest
+
+from conftest import NO_METADATA, make_photo
+from converter import ImageToWebPConverter
+
+
+def test_final_encode_uses_method_6_and_fits(converter, photo):
+    converter.auto_lossless = False
+    converter.search_method = 2
+    max_kb = max(len(converter.encode_webp(photo, 70, NO_METADATA)) // 1024, 1)
+
+    data, stats = converter.encode_within_budget(photo, NO_METADATA, 1.0, max_kb=max_kb)
+
+    assert len(data) <= max_kb * 1024
+    assert data == converter.encode_webp(photo, stats['quality'], NO_METADATA)
+    assert stats['search_size_kb'] > 0
+    # Prediction = search size corrected by the (uncalibrated) ratio and the margin
+    assert stats['predicted_size_kb'] == pytest.approx(stats['search_size_kb'] * 1.03)
+
+
+def test_results_calibrate_the_effort_ratio(converter):
+    converter.search_method = 2
+    stats = {'predicted_size_kb': 103.0, 'search_size_kb': 100.0, 'final_size_kb': 90.0}
+
+    converter.record_result(Path('a.png'), True, stats)
+    assert converter.effort_ratio == pytest.approx(0.8 + 0.2 * 0.9)
+    converter.record_result(Path('b.png'), True, stats)
+    assert converter.effort_ratio == pytest.approx(0.8 * 0.98 + 0.2 * 0.9)
+
+    assert [name for name, _, _ in converter.effort_log] == ['a.png', 'b.png']
+    converter.record_result(Path('c.png'), False, stats)
+    assert len(converter.effort_log) == 2
+
+
+@pytest.mark.parametrize('executor', ['thread', 'process'])
+def test_batch_calibrates_across_workers(tmp_path, executor):
+    converter = ImageToWebPConverter(tmp_path / 'source', tmp_path / 'result', tmp_path / 'failed',
+                                     workers=2, executor=executor, quiet=True)
+    converter.auto_lossless = False
+    converter.search_method = 2
+    for index in range(4):
+        make_photo((320, 240), seed=index).save(tmp_path / 'source' / f"img{index}.png")
+    try:
+        assert converter.process_all_images() == (4, 0)
+    finally:
+        converter.shutdown()
+
+    assert len(converter.effort_log) == 4
+    assert converter.effort_ratio != 1.0
@@ -0,0 +1,83 @@
+"""
+Tests for splicing EXIF/ICC/XMP chunks into encoded WebP files.
+"""
+
+import io
+
+import piexif
+import pytest
+from PIL import Image, ImageCms
+
+from converter import _read_webp_chunks, embed_webp_metadata
+
+EXIF = piexif.dump({'0th': {piexif.ImageIFD.Make: b'TestCam'},
+                    'GPS': {piexif.GPSIFD.GPSLatitudeRef: b'S'}})
+XMP = b'<x:xmpmeta xmlns:x="adobe:ns:meta/"></x:xmpmeta>'
+
+
+def encode(img, **options):
+    buffer = io.BytesIO()
+    img.save(buffer, 'WEBP', **options)
+    return buffer.getvalue()
+
+
+@pytest.mark.parametrize('mode, options', [
+    ('RGB', {'quality': 80}),
+    ('RGBA', {'quality': 80}),
+    ('RGB', {'lossless': True}),
+    ('RGBA', {'lossless': True}),
+])
+def test_round_trip_keeps_bitstream_and_metadata(mode, options):
+    img = Image.new(mode, (37, 21), (10, 200, 30, 128)[:len(mode)])
+    webp = encode(img, **options)
+    icc = ImageCms.ImageCmsProfile(ImageCms.createProfile('sRGB')).tobytes()
+
+    result = embed_webp_metadata(webp, exif=b'Exif\x00\x00' + EXIF, icc_profile=icc, xmp=XMP)
+
+    chunks = _read_webp_chunks(result)
+    assert [fourcc for fourcc, _ in chunks][:2] == [b'VP8X', b'ICCP']
+    assert [fourcc for fourcc, _ in chunks][-2:] == [b'EXIF', b'XMP ']
+    # The image bitstream is copied unchanged
+    assert [payload for fourcc, payload in _read_webp_chunks(webp) if fourcc in (b'VP8 ', b'VP8L', b'ALPH')] == \
+        [payload for fourcc, payload in chunks if fourcc in (b'VP8 ', b'VP8L', b'ALPH')]
+
+    with Image.open(io.BytesIO(result)) as decoded:
+        assert decoded.size == (37, 21)
+        assert decoded.info['icc_profile'] == icc
+        assert decoded.info['xmp'] == XMP
+        assert piexif.load(decoded.info['exif'])['0th'][piexif.ImageIFD.Make] == b'TestCam'
+        assert decoded.mode == ('RGBA' if mode == 'RGBA' else 'RGB')
+        decoded.load()
+
+
+def test_without_metadata_returns_input_unchanged():
+    webp = encode(Image.new('RGB', (8, 8)), quality=50)
+    assert embed_webp_metadata(webp) == webp
+
+
+def test_embedding_twice_replaces_chunks():
+    webp = encode(Image.new('RGB', (8, 8)), quality=50)
+    once = embed_webp_metadata(webp, exif=EXIF, xmp=XMP)
+
+    twice = embed_webp_metadata(once, exif=EXIF)
+
+    assert [fourcc for fourcc, _ in _read_webp_chunks(twice)].count(b'EXIF') == 1
+    assert dict(_read_webp_chunks(twice))[b'XMP '] == XMP  # Existing chunks are kept
+    assert len(twice) % 2 == 0
+
+
+def test_animation_keeps_frame_chunks():
+    frames = [Image.new('RGBA', (16, 16), colour) for colour in ((255, 0, 0, 255), (0, 0, 255, 255))]
+    webp = encode(frames[0], save_all=True, append_images=frames[1:], duration=[100, 200], loop=2)
+
+    result = embed_webp_metadata(webp, exif=EXIF)
+
+    assert [fourcc for fourcc, _ in _read_webp_chunks(result)] == [b'VP8X', b'ANIM', b'ANMF', b'ANMF', b'EXIF']
+    with Image.open(io.BytesIO(result)) as decoded:
+        assert decoded.n_frames == 2
+        assert decoded.info['loop'] == 2
+
+
+def test_rejects_non_webp_data():
+    with pytest.raises(ValueError):
+        _read_webp_chunks(b'\x89PNG\r\n\x1a\n' + b'\x00' * 16)
@@ -0,0 +1,96 @@
+"""
+Tests for lease-based work claiming between instances.
+"""
+
+import os
+
+import converter as converter_module
+from conftest import make_photo
+from converter import ImageToWebPConverter, WorkClaimer
+
+
+def age_lease(claimer, seconds):
+    lease = claimer.folder / WorkClaimer.LEASE_FILE
+    stat_result = lease.stat()
+    os.utime(lease, ns=(stat_result.st_atime_ns, stat_result.st_mtime_ns - seconds * 1_000_000_000))
+
+
+def test_only_one_instance_claims_a_file(tmp_path):
+    (tmp_path / 'a.jpg').write_bytes(b'data')
+    first, second = WorkClaimer(tmp_path, 'host-a'), WorkClaimer(tmp_path, 'host-b')
+
+    claimed = first.claim(tmp_path / 'a.jpg')
+
+    assert claimed == tmp_path / '.claims' / 'host-a' / 'a.jpg' and claimed.exists()
+    assert second.claim(tmp_path / 'a.jpg') is None
+
+
+def test_expired_lease_returns_claims(tmp_path):
+    (tmp_path / 'a.jpg').write_bytes(b'data')
+    crashed, survivor = WorkClaimer(tmp_path, 'host-a', lease_seconds=60), WorkClaimer(tmp_path, 'host-b')
+    crashed.renew()
+    crashed.claim(tmp_path / 'a.jpg')
+
+    assert survivor.reclaim_expired(include_own=True) == 0  # Lease still fresh
+    age_lease(crashed, 61)
+    assert survivor.reclaim_expired(include_own=True) == 1
+
+    assert (tmp_path / 'a.jpg').read_bytes() == b'data'
+    assert not crashed.folder.exists()
+
+
+def test_close_hands_back_unconverted_claims(tmp_path):
+    (tmp_path / 'a.jpg').write_bytes(b'data')
+    claimer = WorkClaimer(tmp_path, 'host-a')
+    claimer.start()
+    claimer.claim(tmp_path / 'a.jpg')
+
+    claimer.close()
+
+    assert (tmp_path / 'a.jpg').exists() and not claimer.folder.exists()
+
+
+def test_file_of_a_dead_worker_leaves_the_claim_folder(tmp_path, monkeypatch):
+    def dying_worker(converter, image_path, effort_ratio=None):
+        raise RuntimeError("worker died")
+
+    monkeypatch.setattr(converter_module, '_convert_worker', dying_worker)
+    converter = ImageToWebPConverter(tmp_path / 'source', tmp_path / 'result', tmp_path / 'failed', quiet=True,
+                                     workers=2, executor='thread', node_id='host-a')
+    make_photo((64, 48)).save(tmp_path / 'source' / 'photo.png')
+
+    assert converter.process_all_images() == (0, 1)
+
+    assert (tmp_path / 'failed' / 'photo.png').exists()
+    assert not list(converter.claimer.folder.glob('*.png'))
+    converter.shutdown()
+
+
+def test_release_keeps_names_containing_a_tilde(tmp_path):
+    names = ['holiday~1.jpg', '2024~trip.jpg', 'a.jpg']
+    for name in names:
+        (tmp_path / name).write_bytes(name.encode())
+    claimer = WorkClaimer(tmp_path, 'host-a')
+    claimer.start()
+    for name in names:
+        claimer.claim(tmp_path / name)
+    (tmp_path / 'a.jpg').write_bytes(b'again')
+    claimer.claim(tmp_path / 'a.jpg')  # Same name still claimed: prefixed
+
+    claimer.close()
+
+    restored = sorted(path.name for path in tmp_path.iterdir() if path.is_file())
+    assert restored == ['2024~trip.jpg', 'a.jpg', 'a_host-a.jpg', 'holiday~1.jpg']
+    assert (tmp_path / '2024~trip.jpg').read_bytes() == b'2024~trip.jpg'
+
+
+def test_prefixed_claims_keep_their_output_name(tmp_path):
+    converter = ImageToWebPConverter(tmp_path / 'source', tmp_path / 'result', tmp_path / 'failed',
+                                     workers=2, executor='thread', node_id='host-a', quiet=True)
+    make_photo((120, 90)).save(tmp_path / 'source' / '2024~trip.png')
+    try:
+        assert converter.process_all_images() == (1, 0)
+    finally:
+        converter.shutdown()
+
+    assert [path.name for path in (tmp_path / 'result').rglob('*.webp')] == ['2024~trip.webp']